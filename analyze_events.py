@@ -0,0 +1,120 @@
+"""
+分析 job_events.jsonl：吞吐随时间的变化、最慢的歌曲、失败原因
+用法：python analyze_events.py [logs/job_events.jsonl] [--run 运行ID] [--job 任务ID] [--bucket 10] [--top 10]
+"""
+import argparse
+import json
+from collections import Counter, defaultdict
+
+FINISH_EVENTS = ('track_done', 'track_failed')
+
+def load_events(path, run=None, job=None):
+    """
+    :return: 事件字典列表（按时间排序），跳过无法解析的行
+    """
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if run and event.get('run') != run:
+                continue
+            if job is not None and str(event.get('job')) != str(job):
+                continue
+            events.append(event)
+    events.sort(key=lambda e: e['ts'])
+    return events
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def track_timelines(events):
+    """
+    把同一首歌的各个事件合并成一条记录
+    :return: {(run, job, song_id): {'queued', 'resolved', 'finished', ...最终事件字段}}
+    """
+    tracks = defaultdict(dict)
+    for e in events:
+        if 'song_id' not in e:
+            continue
+        record = tracks[(e['run'], e.get('job'), e['song_id'])]
+        if e['event'] == 'track_queued':
+            record['queued'] = e['ts']
+        elif e['event'] == 'track_resolved':
+            record['resolved'] = e['ts']
+            record['has_url'] = e.get('has_url')
+        elif e['event'] in FINISH_EVENTS:
+            record.update(e)
+            record['finished'] = e['ts']
+    return tracks
+
+def summarize(events, bucket=10, top=10):
+    tracks = track_timelines(events)
+    finished = [t for t in tracks.values() if 'finished' in t]
+    lines = []
+    if not finished:
+        return '没有已完成的歌曲事件'
+    start = min(t.get('queued', t['finished']) for t in finished)
+    end = max(t['finished'] for t in finished)
+    wall = max(end - start, 0.001)
+    total_bytes = sum(t.get('bytes', 0) for t in finished)
+    outcomes = Counter(t.get('outcome', 'unknown') for t in finished)
+
+    lines.append(f"歌曲 {len(finished)} 首，用时 {wall:.1f} 秒，"
+                 f"{len(finished) / wall:.2f} 首/秒，{total_bytes / wall / 1024 / 1024:.2f} MB/秒，"
+                 f"共 {total_bytes / 1024 / 1024:.1f} MB")
+    lines.append('结果：' + '，'.join(f'{k} {v}' for k, v in outcomes.most_common()))
+
+    waits = [t['resolved'] - t['queued'] for t in finished if 'resolved' in t and 'queued' in t]
+    durations = [t['duration_ms'] for t in finished if 'duration_ms' in t]
+    first_bytes = [t['first_byte_ms'] for t in finished if 'first_byte_ms' in t]
+    lines.append('')
+    lines.append(f"{'阶段':<16}{'p50':>10}{'p90':>10}{'max':>10}")
+    for label, values in (('入队→解析(秒)', waits), ('处理耗时(ms)', durations), ('首字节(ms)', first_bytes)):
+        if values:
+            lines.append(f"{label:<16}{percentile(values, 50):>10.1f}{percentile(values, 90):>10.1f}{max(values):>10.1f}")
+
+    lines.append('')
+    lines.append(f'吞吐（每 {bucket} 秒）：')
+    buckets = defaultdict(lambda: [0, 0])
+    for t in finished:
+        slot = int((t['finished'] - start) // bucket)
+        buckets[slot][0] += 1
+        buckets[slot][1] += t.get('bytes', 0)
+    for slot in range(int(wall // bucket) + 1):
+        count, size = buckets.get(slot, (0, 0))
+        mb_per_sec = size / bucket / 1024 / 1024
+        lines.append(f"  {slot * bucket:>6}s  {count:>5} 首  {mb_per_sec:>7.2f} MB/秒  {'#' * min(count, 60)}")
+
+    lines.append('')
+    lines.append(f'最慢的 {top} 首：')
+    for t in sorted(finished, key=lambda t: t.get('duration_ms', 0), reverse=True)[:top]:
+        lines.append(f"  {t['song_id']:<12} {t.get('duration_ms', 0):>9.1f} ms  "
+                     f"首字节 {t.get('first_byte_ms', '-')} ms  {t.get('bytes', 0) / 1024:.0f} KB  "
+                     f"重试 {t.get('retries', 0)}  {t.get('outcome', '')}")
+
+    failures = Counter(t.get('error') or '无下载链接' for t in finished if t.get('outcome') in ('failed', 'skipped'))
+    if failures:
+        lines.append('')
+        lines.append('失败/跳过原因：')
+        for cause, count in failures.most_common():
+            lines.append(f'  {cause:<24} {count}')
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='分析下载事件日志')
+    parser.add_argument('path', nargs='?', default='logs/job_events.jsonl')
+    parser.add_argument('--run', help='只统计某次运行（事件中的 run 字段）')
+    parser.add_argument('--job', help='只统计某个任务（网页端 jobs.db 中的任务ID）')
+    parser.add_argument('--bucket', type=int, default=10, help='吞吐统计的时间粒度（秒）')
+    parser.add_argument('--top', type=int, default=10, help='列出最慢的歌曲数')
+    args = parser.parse_args()
+    print(summarize(load_events(args.path, args.run, args.job), args.bucket, args.top))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+"""
+web_downloader 的 ASGI 入口：音频代理和常用的元数据接口在事件循环中处理，
+其余路由（页面、登录、任务等）在线程池中交给原来的 Flask 应用
+
+- /proxy_download 用 httpx 异步转发上游音频，几千个同时试听的连接共用一个事件循环，
+  不再每个连接占用一个线程；每块数据等客户端收下（send 返回）后才读下一块，
+  客户端慢时不会在内存中堆积数据
+- /search、/api/search_songs、/api/song_detail、/cover 先查缓存，未命中时在小线程池中请求上游
+
+用法：python asgi_app.py [--host 127.0.0.1] [--port 5000]（需要 pip install httpx uvicorn），或 uvicorn asgi_app:app
+"""
+import argparse
+import asyncio
+import contextvars
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+try:
+    import httpx  # 可选依赖，未安装时 /proxy_download 仍由 Flask 处理（每个音频流占用一个线程）
+except ImportError:
+    httpx = None
+try:
+    import uvicorn  # 可选依赖，只在直接运行本文件时需要
+except ImportError:
+    uvicorn = None
+import web_downloader as wd
+from download_pipeline import EXPIRED_STATUS, UrlExpiredError
+from upstream_qos import INTERACTIVE, with_lane
+
+MAX_STREAMS = 2000  # 同时转发的音频流上限，超出时返回 503
+STREAM_CHUNK_SIZE = 64 * 1024
+UPSTREAM_CONNECT_TIMEOUT = 10
+UPSTREAM_READ_TIMEOUT = 30  # 上游超过该时间没有数据时结束转发
+METADATA_WORKERS = 8  # 元数据接口缓存未命中时请求上游的线程数
+WSGI_WORKERS = 16  # 交给 Flask 处理的请求使用的线程数
+
+metadata_pool = ThreadPoolExecutor(max_workers=METADATA_WORKERS, thread_name_prefix='asgi-metadata')
+wsgi_pool = ThreadPoolExecutor(max_workers=WSGI_WORKERS, thread_name_prefix='asgi-wsgi')
+client = None  # httpx.AsyncClient，在 lifespan 启动时（关闭 lifespan 时在第一次转发时）创建
+stream_slots = None  # asyncio.Semaphore(MAX_STREAMS)，同上
+stream_stats = {'active': 0, 'total': 0, 'rejected': 0, 'bytes': 0}
+
+# ----------------- 工具函数 -----------------
+
+async def in_pool(pool, func, *args):
+    # 线程池中没有 Flask 请求上下文，上游请求默认会走批量通道，这里显式指定交互通道
+    return await asyncio.get_running_loop().run_in_executor(pool, with_lane(INTERACTIVE, func), *args)
+
+def parse_query(scope):
+    # 与 request.args.get 一致：同名参数取第一个
+    query = {}
+    for key, value in urllib.parse.parse_qsl(scope['query_string'].decode('utf-8', 'replace'), keep_blank_values=True):
+        query.setdefault(key, value)
+    return query
+
+def request_header(scope, name):
+    name = name.encode('latin-1')
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+def accepts(scope, encoding):
+    return encoding in [part.split(';')[0].strip() for part in request_header(scope, 'accept-encoding').split(',')]
+
+async def start_response(send, status, headers):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in headers]})
+
+async def respond(send, status, body, headers):
+    await start_response(send, status, headers)
+    await send({'type': 'http.response.body', 'body': body})
+
+async def respond_text(send, status, text):
+    await respond(send, status, text.encode('utf-8'), [('content-type', 'text/html; charset=utf-8')])
+
+async def respond_json(scope, send, data):
+    # 压缩规则与 web_downloader.compress_json 相同
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    headers = [('content-type', 'application/json'), ('vary', 'Accept-Encoding')]
+    if len(body) >= wd.JSON_COMPRESS_MIN_SIZE:
+        if wd.brotli is not None and accepts(scope, 'br'):
+            body = wd.brotli.compress(body, quality=4)
+            headers.append(('content-encoding', 'br'))
+        elif accepts(scope, 'gzip'):
+            body = gzip.compress(body, 6)
+            headers.append(('content-encoding', 'gzip'))
+    await respond(send, 200, body, headers)
+
+async def watch_disconnect(receive, disconnected):
+    # 请求体之后服务器只会再发 http.disconnect；转发循环每块检查一次，客户端断开后尽快释放上游连接
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    disconnected.set()
+
+def ensure_stream_resources():
+    """创建音频代理用的信号量和 httpx 客户端；服务器关闭 lifespan（如 uvicorn --lifespan off）时不会收到 startup 事件"""
+    global client, stream_slots
+    if stream_slots is None:
+        stream_slots = asyncio.Semaphore(MAX_STREAMS)
+    if client is None and httpx is not None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=100),
+            follow_redirects=True,
+        )
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+# ----------------- 元数据接口 -----------------
+
+async def search(scope, receive, send, query):
+    kw = query.get('kw', '')
+    if not kw.strip():
+        return await respond_json(scope, send, {'code': 400, 'msg': '关键词不能为空'})
+    data = await in_pool(metadata_pool, wd.cached_search, kw, query.get('stype', '1'),
+                         query.get('limit', 30), query.get('offset', 0))
+    await respond_json(scope, send, data)
+
+async def search_songs(scope, receive, send, query):
+    kw = query.get('kw', '')
+    if not kw.strip():
+        return await respond_json(scope, send, {'code': 400, 'msg': '关键词不能为空', 'songs': []})
+    data = await in_pool(metadata_pool, wd.search_songs_with_covers, kw, query.get('limit', 30), query.get('offset', 0))
+    await respond_json(scope, send, data)
+
+async def song_detail(scope, receive, send, query):
+    songs = await in_pool(metadata_pool, wd.get_song_details, wd.parse_song_ids(query.get('ids')))
+    await respond_json(scope, send, {'code': 200, 'songs': songs})
+
+async def cover(scope, receive, send, query, song_id):
+    size = wd.cover_size(query.get('s'))
+    try:
+        path = await in_pool(metadata_pool, wd.fetch_cover, int(song_id), size)
+    except Exception as e:
+        return await respond_text(send, 502, f'封面获取失败: {e}')
+    if not path:
+        return await respond_text(send, 404, '该歌曲没有封面')
+    etag = await in_pool(metadata_pool, wd.cover_etag, path)
+    headers = [('etag', f'"{etag}"'), ('cache-control', f'public, max-age={wd.COVER_MAX_AGE}')]
+    if etag in [tag.strip().strip('"') for tag in request_header(scope, 'if-none-match').split(',')]:
+        return await respond(send, 304, b'', headers)
+    body = await in_pool(metadata_pool, read_file, path)
+    await respond(send, 200, body, headers + [('content-type', wd.cover_mimetype(path))])
+
+async def api_stream_stats(scope, receive, send, query):
+    await respond_json(scope, send, {
+        'streams': dict(stream_stats, limit=MAX_STREAMS),
+        'threads': threading.active_count(),
+        'upstream': wd.upstream_gate.stats(),
+    })
+
+# ----------------- 音频代理 -----------------
+
+async def open_audio(song_id, song_url, levels, offset):
+    """
+    与 web_downloader.open_audio 相同：从 offset 字节开始打开音频流，链接过期时重新获取一次
+    :return: (响应, 需要丢弃的开头字节数)，CDN 不支持 Range 时返回完整内容，需丢弃 offset 字节
+    """
+    for attempt in range(2):
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        r = await client.send(client.build_request('GET', song_url.url, headers=headers), stream=True)
+        if r.status_code in EXPIRED_STATUS and attempt == 0:
+            await r.aclose()
+            song_url = await in_pool(metadata_pool, wd.cached_song_url, song_id, levels, True)
+            if not song_url:
+                break
+            continue
+        if r.status_code >= 400:
+            await r.aclose()
+            r.raise_for_status()
+        return r, (offset if offset and r.status_code == 200 else 0)
+    raise UrlExpiredError(f'{song_id} 下载链接失效')
+
+async def relay(upstream, send, skip, disconnected):
+    """逐块转发上游音频；await send 在客户端来不及接收时等待，形成背压"""
+    try:
+        async for chunk in upstream.aiter_bytes(STREAM_CHUNK_SIZE):
+            if disconnected.is_set():
+                return
+            if skip:
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                chunk, skip = chunk[skip:], 0
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                stream_stats['bytes'] += len(chunk)
+    except httpx.HTTPError as e:
+        # 响应头已发出，只能提前结束
+        print(f'音频转发中断: {e}')
+    finally:
+        await upstream.aclose()
+
+async def proxy_download(scope, receive, send, query, song_id):
+    # preview=1 为试听：使用低码率，可命中预取的开头；否则按下载音质
+    ensure_stream_resources()
+    if stream_slots.locked():
+        stream_stats['rejected'] += 1
+        return await respond(send, 503, '同时试听/下载的连接过多，请稍后重试'.encode('utf-8'),
+                             [('content-type', 'text/html; charset=utf-8'), ('retry-after', '5')])
+    async with stream_slots:
+        preview = query.get('preview') == '1'
+        levels = (wd.PREVIEW_LEVEL,) if preview else wd.DOWNLOAD_LEVELS
+        song_url = await in_pool(metadata_pool, wd.cached_song_url, song_id, levels)
+        if not song_url:
+            return await respond_text(send, 404, '无法获取下载链接')
+        song = await in_pool(metadata_pool, wd.get_song_detail, song_id)
+        if not song:
+            return await respond_text(send, 404, '未找到该歌曲')
+        artists = song.get('artists') or song.get('ar')
+        filename = f"{artists[0]['name']}-{song['name']}.{song_url.type}"
+        headers = [
+            ('content-disposition', f"attachment; filename*=UTF-8''{urllib.parse.quote(filename)}"),
+            ('content-type', 'audio/flac' if song_url.type == 'flac' else 'audio/mpeg'),
+        ]
+        head = await in_pool(metadata_pool, wd.read_head, song_id) if wd.PREFETCH_ENABLED and preview else None
+        disconnected = asyncio.Event()
+        watcher = asyncio.create_task(watch_disconnect(receive, disconnected))
+        stream_stats['active'] += 1
+        stream_stats['total'] += 1
+        # 登记为交互通道的流：批量下载在试听期间限速，但不占用 UPSTREAM_CONNECTIONS 的名额
+        try:
+            with wd.upstream_gate.stream(INTERACTIVE):
+                if head:
+                    # 已预取开头：立即返回本地缓存，再从断点处连上游取剩余部分
+                    await start_response(send, 200, headers)
+                    await send({'type': 'http.response.body', 'body': head, 'more_body': True})
+                    try:
+                        upstream, skip = await open_audio(song_id, song_url, levels, len(head))
+                    except (httpx.HTTPError, UrlExpiredError) as e:
+                        print(f'音频转发中断: {e}')
+                        upstream = None
+                else:
+                    try:
+                        upstream, skip = await open_audio(song_id, song_url, levels, 0)
+                    except (httpx.HTTPError, UrlExpiredError) as e:
+                        return await respond_text(send, 502, f'音频获取失败: {e}')
+                    await start_response(send, 200, headers)
+                if upstream is not None:
+                    await relay(upstream, send, skip, disconnected)
+                if not disconnected.is_set():
+                    await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            stream_stats['active'] -= 1
+            watcher.cancel()
+
+# ----------------- 其余路由交给 Flask -----------------
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        name = f'HTTP_{name}'
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+async def call_wsgi(scope, receive, send):
+    """在 wsgi_pool 中运行 Flask 应用，响应逐块取出后发给客户端"""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    environ = wsgi_environ(scope, bytes(body))
+    response = {}
+    written = []
+
+    def wsgi_start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+        return written.append
+
+    def next_chunk(chunks):
+        for chunk in chunks:
+            if chunk:
+                return chunk
+        return None
+
+    def run():
+        result = wd.app(environ, wsgi_start_response)
+        chunks = iter(result)
+        return result, chunks, next_chunk(chunks)
+
+    # 同一请求的各步可能在不同线程执行，共用一个 contextvars 上下文（stream_with_context 依赖它）
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    result, chunks, chunk = await loop.run_in_executor(wsgi_pool, context.run, run)
+    disconnected = asyncio.Event()
+    watcher = asyncio.create_task(watch_disconnect(receive, disconnected))
+    try:
+        await start_response(send, response['status'], response['headers'])
+        for data in written:
+            await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+        while chunk is not None and not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await loop.run_in_executor(wsgi_pool, context.run, next_chunk, chunks)
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(wsgi_pool, context.run, result.close)
+
+# ----------------- ASGI 应用 -----------------
+
+ROUTES = [
+    (re.compile(r'/search'), search),
+    (re.compile(r'/api/search_songs'), search_songs),
+    (re.compile(r'/api/song_detail'), song_detail),
+    (re.compile(r'/cover/(\d+)'), cover),
+    (re.compile(r'/api/stream_stats'), api_stream_stats),
+]
+if httpx is not None:
+    ROUTES.append((re.compile(r'/proxy_download/([^/]+)'), proxy_download))
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            ensure_stream_resources()
+            # 与 python web_downloader.py 启动时相同，继续未完成的任务并定期接手租约到期的任务
+            await asyncio.get_running_loop().run_in_executor(None, wd.start_background_jobs)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if client is not None:
+                await client.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    if wd.lease_watch_pid != os.getpid():
+        # 关闭 lifespan 时没有 startup 事件，在第一个请求时继续未完成的任务
+        await asyncio.get_running_loop().run_in_executor(None, wd.start_background_jobs)
+    if scope['method'] == 'GET':
+        for pattern, handler in ROUTES:
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                return await handler(scope, receive, send, parse_query(scope), *match.groups())
+    await call_wsgi(scope, receive, send)
+
+def main():
+    parser = argparse.ArgumentParser(description='以 ASGI 方式运行网页端（异步音频代理）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    if uvicorn is None:
+        sys.exit('需要先安装 uvicorn：pip install uvicorn httpx')
+    if httpx is None:
+        print('未安装 httpx，/proxy_download 仍由 Flask 在线程池中处理')
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
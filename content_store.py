@@ -0,0 +1,320 @@
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，不支持 reflink
+    fcntl = None
+
+# Linux FICLONE ioctl（btrfs/xfs 等文件系统的写时复制克隆）
+FICLONE = 0x40049409
+# 隔离区最多保留的文件数，超出后删除最早的
+QUARANTINE_KEEP = 50
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blobs (
+    song_id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL,          -- 相对内容库根目录的路径
+    created_at REAL NOT NULL,
+    tagged INTEGER NOT NULL DEFAULT 0,  -- 是否已写入 ID3 标签（带标签的文件按自己的 sha256 另存，不与原文件共用）
+    br INTEGER NOT NULL DEFAULT 0,      -- 下载时的码率，0 表示未知（早期下载的文件）
+    level TEXT NOT NULL DEFAULT ''      -- 下载时的音质等级
+);
+CREATE INDEX IF NOT EXISTS blobs_sha256 ON blobs (sha256);
+'''
+
+def preallocate(f, size):
+    """
+    按预计大小一次性分配磁盘空间，减少碎片，空间不足时在开始写入前就报错
+    :return: 是否已预分配（系统不支持时返回 False）
+    """
+    if not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        # 文件系统不支持 fallocate
+        return False
+    return True
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+class IntegrityError(Exception):
+    """下载的文件长度或 MD5 与上游不符（传输中断、内容损坏），文件已移入隔离区，需要重新下载"""
+
+class BlobWriter:
+    """
+    边下载边写临时文件并计算 sha256 和 md5，commit 时校验长度和 md5，通过后按哈希移入内容库
+    """
+    def __init__(self, store, song_id, expected_size=0, ext='mp3', br=0, level=''):
+        self.store = store
+        self.song_id = song_id
+        self.ext = ext
+        self.br = br
+        self.level = level
+        self.tmp_path = os.path.join(store.tmp_dir, f'{song_id}.{uuid.uuid4().hex}.part')
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+        self._f = open(self.tmp_path, 'wb')
+        try:
+            self.preallocated = expected_size > 0 and preallocate(self._f, expected_size)
+        except BaseException:
+            # 空间不足：调用方拿不到 BlobWriter，在这里关闭并删除临时文件
+            self.abort()
+            raise
+
+    def write(self, chunk):
+        self._f.write(chunk)
+        self._sha256.update(chunk)
+        self._md5.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self, expected_length=0, md5=''):
+        """
+        :param expected_length: 应收到的字节数（响应的 Content-Length），0 表示不检查
+        :param md5: /song/url 返回的 md5，空表示不检查
+        :return: 内容库中文件的绝对路径
+        :raises IntegrityError: 长度或 md5 不符，临时文件已移入隔离区
+        """
+        if self.preallocated:
+            # 实际大小与预计不同时去掉多分配的部分
+            self._f.truncate(self.size)
+        self._f.close()
+        if expected_length and self.size != expected_length:
+            problem = f'文件不完整：收到 {self.size} 字节，应为 {expected_length} 字节'
+        elif md5 and self._md5.hexdigest() != md5.lower():
+            problem = 'MD5 校验失败'
+        else:
+            problem = None
+        if problem:
+            self.store.quarantine_file(self.tmp_path, f'{self.song_id}.{self.ext}')
+            raise IntegrityError(problem)
+        digest = self._sha256.hexdigest()
+        rel_path = os.path.join('blobs', digest[:2], f'{digest}.{self.ext}')
+        blob_path = os.path.join(self.store.root, rel_path)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if os.path.exists(blob_path):
+            # 不同歌曲ID的音频完全相同，直接复用已有文件
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, blob_path)
+        self.store.record(self.song_id, digest, self.size, rel_path, self.br, self.level)
+        return blob_path
+
+    def abort(self):
+        self._f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        return False
+
+class ContentStore:
+    """
+    内容库：每首歌（歌曲ID）只下载一次，音频按 sha256 存放在 root/blobs 下，
+    各歌单/文件夹里的文件都是指向它的硬链接（不支持时依次尝试 reflink、复制）
+    """
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        # 多个下载进程共用同一个内容库
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(blobs)')]
+        for column, sql in (('tagged', 'INTEGER NOT NULL DEFAULT 0'), ('br', 'INTEGER NOT NULL DEFAULT 0'),
+                            ('level', "TEXT NOT NULL DEFAULT ''")):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE blobs ADD COLUMN {column} {sql}')
+
+    def lookup(self, song_id):
+        """
+        :return: 已下载过的音频文件绝对路径，没有则返回 None
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT path FROM blobs WHERE song_id = ?', (int(song_id),)).fetchone()
+        if not row:
+            return None
+        blob_path = os.path.join(self.root, row[0])
+        return blob_path if os.path.exists(blob_path) else None
+
+    def record(self, song_id, sha256, size, rel_path, br=0, level=''):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO blobs (song_id, sha256, size, path, created_at, br, level) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (int(song_id), sha256, size, rel_path, time.time(), br, level),
+            )
+
+    def entries(self):
+        """
+        :return: [(歌曲ID, sha256, 大小, 相对路径)]
+        """
+        with self._lock:
+            return self._conn.execute('SELECT song_id, sha256, size, path FROM blobs ORDER BY song_id').fetchall()
+
+    def verify(self, deep=False):
+        """
+        按索引中记录的大小（deep=True 时再按 sha256）检查内容库中的文件，不访问网络
+        :return: 生成器，产出有问题的 (歌曲ID, 相对路径, 问题)
+        """
+        for song_id, sha256, size, rel_path in self.entries():
+            blob_path = os.path.join(self.root, rel_path)
+            try:
+                actual = os.path.getsize(blob_path)
+            except OSError:
+                yield song_id, rel_path, '文件不存在'
+                continue
+            if actual != size:
+                yield song_id, rel_path, f'大小不符：{actual} 字节，记录为 {size} 字节'
+            elif deep and file_sha256(blob_path) != sha256:
+                yield song_id, rel_path, 'sha256 不符'
+
+    def quarantine_file(self, path, name):
+        """把校验失败的文件移入隔离区（root/quarantine），只保留最近 QUARANTINE_KEEP 个"""
+        quarantine_dir = os.path.join(self.root, 'quarantine')
+        os.makedirs(quarantine_dir, exist_ok=True)
+        os.replace(path, os.path.join(quarantine_dir, f'{time.strftime("%Y%m%d-%H%M%S")}.{uuid.uuid4().hex[:6]}.{name}'))
+        kept = sorted(os.listdir(quarantine_dir))
+        for old in kept[:-QUARANTINE_KEEP]:
+            try:
+                os.remove(os.path.join(quarantine_dir, old))
+            except OSError:
+                pass
+
+    def forget(self, song_id, link_dirs=()):
+        """
+        删除一首歌的记录，文件移入隔离区，并删除 link_dirs 中指向它的硬链接，下次下载时会重新获取
+        :return: 删除的硬链接路径列表
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT path FROM blobs WHERE song_id = ?', (int(song_id),)).fetchone()
+            self._conn.execute('DELETE FROM blobs WHERE song_id = ?', (int(song_id),))
+        if not row:
+            return []
+        blob_path = os.path.join(self.root, row[0])
+        try:
+            blob_stat = os.stat(blob_path)
+        except OSError:
+            return []
+        removed = []
+        for link_dir in link_dirs:
+            for entry in os.scandir(link_dir):
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                if (st.st_dev, st.st_ino) == (blob_stat.st_dev, blob_stat.st_ino):
+                    os.remove(entry.path)
+                    removed.append(entry.path)
+        with self._lock:
+            # 其它歌曲ID的音频完全相同时共用同一个文件，仍被引用就不移走
+            shared = self._conn.execute('SELECT 1 FROM blobs WHERE path = ?', (row[0],)).fetchone()
+        if not shared:
+            self.quarantine_file(blob_path, os.path.basename(blob_path))
+        return removed
+
+    def quality(self, song_id):
+        """
+        :return: (码率, 音质等级)，没有记录返回 (0, '')
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT br, level FROM blobs WHERE song_id = ?', (int(song_id),)).fetchone()
+        return (row[0], row[1]) if row else (0, '')
+
+    def is_tagged(self, song_id):
+        with self._lock:
+            row = self._conn.execute('SELECT tagged FROM blobs WHERE song_id = ?', (int(song_id),)).fetchone()
+        return bool(row and row[0])
+
+    def commit_tagged(self, song_id, src_path, tmp_path, sha256, size, link_paths=()):
+        """
+        把写好标签的临时文件按新的 sha256 移入内容库，只改这首歌的记录和它的链接
+        原文件可能被音频相同的其它歌曲共用，不能原地改写；不再被引用时才删除
+        :param src_path: 写标签时读取的内容库文件
+        :param tmp_path: 带标签的临时文件（与内容库在同一文件系统）
+        :param link_paths: 指向 src_path 的歌曲文件，改为链接到新文件
+        :return: 新文件的绝对路径；期间这首歌已重新下载（记录不再指向 src_path）时丢弃临时文件，返回 None
+        """
+        ext = os.path.splitext(src_path)[1]
+        rel_path = os.path.join('blobs', sha256[:2], f'{sha256}{ext}')
+        blob_path = os.path.join(self.root, rel_path)
+        with self._lock:
+            row = self._conn.execute('SELECT path FROM blobs WHERE song_id = ?', (int(song_id),)).fetchone()
+            if not row or os.path.join(self.root, row[0]) != src_path:
+                os.remove(tmp_path)
+                return None
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if os.path.exists(blob_path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob_path)
+            self._conn.execute('UPDATE blobs SET tagged = 1, sha256 = ?, size = ?, path = ? WHERE song_id = ?',
+                               (sha256, size, rel_path, int(song_id)))
+            shared = self._conn.execute('SELECT 1 FROM blobs WHERE path = ?', (row[0],)).fetchone()
+        for path in link_paths:
+            try:
+                if os.path.samefile(path, src_path):
+                    self.link(blob_path, path)
+            except OSError:
+                pass
+        if not shared and os.path.exists(src_path):
+            os.remove(src_path)
+        return blob_path
+
+    def writer(self, song_id, expected_size=0, ext='mp3', br=0, level=''):
+        """
+        :param expected_size: 预计文件大小（字节），大于 0 时预先分配空间
+        :param ext: 文件扩展名（由 /song/url 返回的 type 决定，无损为 flac）
+        :param br: 码率，记录在索引中用于判断能否升级音质
+        :param level: 音质等级
+        """
+        return BlobWriter(self, song_id, expected_size, ext, br, level)
+
+    def link(self, blob_path, target):
+        """
+        把内容库中的文件放到目标位置，优先硬链接
+        :return: 'hardlink' / 'reflink' / 'copy'
+        """
+        tmp_target = f'{target}.{uuid.uuid4().hex}.part'
+        try:
+            os.link(blob_path, tmp_target)
+            method = 'hardlink'
+        except OSError:
+            method = self._reflink_or_copy(blob_path, tmp_target)
+        os.replace(tmp_target, target)
+        return method
+
+    def _reflink_or_copy(self, src, dst):
+        if fcntl is not None:
+            try:
+                with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return 'reflink'
+            except OSError:
+                pass
+        shutil.copyfile(src, dst)
+        return 'copy'
@@ -0,0 +1,346 @@
+import queue
+import shutil
+import threading
+import time
+from collections import namedtuple
+from content_store import IntegrityError
+
+# 流水线中流转的精简歌曲记录，只保留下载和展示需要的字段
+# idx 为歌曲在任务日志中的位置（job_tracks.idx），同一首歌在歌单中出现多次时用它区分，不在日志中的为 None
+Track = namedtuple('Track', ['id', 'name', 'artist', 'artists', 'album', 'cover', 'no', 'idx'], defaults=(None,))
+
+# 队列结束标记
+_DONE = object()
+
+# 签名下载链接过期时 CDN 返回的状态码
+EXPIRED_STATUS = (403, 404, 410)
+
+# /song/url 返回的下载链接及文件信息（size 为字节数，br 为码率，level 为音质等级）
+SongUrl = namedtuple('SongUrl', ['url', 'size', 'br', 'md5', 'type', 'level'])
+
+# /song/url/v1 的音质等级，从低到高
+QUALITY_LEVELS = ('standard', 'higher', 'exhigh', 'lossless', 'hires')
+
+class UrlExpiredError(Exception):
+    """下载链接已过期或被拒绝，需要重新获取链接后重试"""
+
+class DiskSpaceError(Exception):
+    """预检发现剩余磁盘空间不足以下载整个任务"""
+
+class PipelineError(Exception):
+    """
+    流水线中翻页、解析链接或结果回调出错：已列出的歌曲照常处理完，结束后统一抛出
+    errors 为全部异常，processed 为已处理的歌曲数
+    """
+    def __init__(self, errors, processed):
+        super().__init__('; '.join(str(e) or type(e).__name__ for e in errors[:3])
+                         + (f' 等 {len(errors)} 个错误' if len(errors) > 3 else ''))
+        self.errors = errors
+        self.processed = processed
+
+def song_url_from_item(item):
+    """
+    :param item: /song/url 返回的 data 中的一项
+    :return: SongUrl，没有下载链接时返回 None
+    """
+    if not item.get('url'):
+        return None
+    return SongUrl(url=item['url'], size=item.get('size') or 0, br=item.get('br') or 0,
+                   md5=item.get('md5') or '', type=(item.get('type') or 'mp3').lower(), level=item.get('level') or '')
+
+def resolve_levels(song_ids, levels, fetch):
+    """
+    按音质等级顺序获取下载链接：先请求首选等级，拿不到链接的歌曲再用下一个等级
+    :param song_ids: 歌曲ID列表
+    :param levels: 音质等级列表（按优先顺序）
+    :param fetch: 函数，参数为 (歌曲ID列表, 等级)，返回 /song/url/v1 的 data 列表
+    :return: {歌曲ID: SongUrl}
+    """
+    urls = {}
+    remaining = list(song_ids)
+    for level in levels:
+        if not remaining:
+            break
+        for i in range(0, len(remaining), 100):
+            for item in fetch(remaining[i:i+100], level):
+                song_url = song_url_from_item(item)
+                if song_url:
+                    urls[item['id']] = song_url
+        remaining = [sid for sid in remaining if sid not in urls]
+    return urls
+
+def level_rank(level):
+    """:return: 音质等级的高低顺序，未知等级为 -1"""
+    return QUALITY_LEVELS.index(level) if level in QUALITY_LEVELS else -1
+
+def preflight(tracks, resolve_urls, save_dir, needs_download=None, reserve=0):
+    """
+    下载前预检：按 /song/url 返回的文件大小统计任务总字节数，并检查保存目录的剩余空间
+    :param tracks: Track 列表
+    :param resolve_urls: 同 run_pipeline，返回 {歌曲ID: SongUrl}
+    :param save_dir: 保存目录
+    :param needs_download: 函数，参数为 Track，返回是否需要实际下载（已存在/可复用的歌曲不计入）
+    :param reserve: 下载完成后至少保留的剩余空间（字节）
+    :return: {歌曲ID: 预计字节数}，只包含需要下载的歌曲
+    :raises DiskSpaceError: 剩余空间不足
+    """
+    pending = [t for t in tracks if needs_download is None or needs_download(t)]
+    urls = resolve_urls([t.id for t in pending]) if pending else {}
+    sizes = {t.id: urls[t.id].size for t in pending if urls.get(t.id)}
+    expected = sum(sizes.values())
+    free = shutil.disk_usage(save_dir).free
+    if expected + reserve > free:
+        raise DiskSpaceError(f'磁盘空间不足：需要 {format_bytes(expected + reserve)}，可用 {format_bytes(free)}')
+    return sizes
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f'{n:.1f} {unit}' if unit != 'B' else f'{n} B'
+        n /= 1024
+
+class ByteProgress:
+    """
+    按字节统计任务进度和剩余时间：总量来自预检的文件大小，每下载完一首歌计入它的预计大小
+    失败、跳过或复用的歌曲不计入已完成，并从总量中扣除，剩余时间只按还要下载的字节估算
+    """
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.total = sum(sizes.values())
+        self.done = 0
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, song_id, downloaded=True):
+        """
+        :param downloaded: 是否实际下载了该歌曲
+        """
+        with self._lock:
+            size = self.sizes.pop(song_id, 0)
+            if downloaded:
+                self.done += size
+            else:
+                self.total -= size
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            rate = self.done / elapsed if elapsed > 0 else 0
+            eta = (self.total - self.done) / rate if rate > 0 else None
+            return {
+                'bytes_done': self.done,
+                'bytes_total': self.total,
+                'bytes_per_sec': round(rate),
+                'eta_seconds': round(eta) if eta is not None else None,
+            }
+
+class RateLimiter:
+    """
+    令牌桶限速：所有线程共用，限制每秒发出的请求数
+    """
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: 每秒允许的请求数，0 或负数表示不限速
+        :param burst: 允许的突发请求数，默认等于 rate
+        """
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def compact_track(song):
+    """
+    把网易云返回的完整歌曲字典压缩成 Track
+    :param song: /song/detail 或 /playlist/track/all 返回的歌曲字典（已是 Track 则原样返回）
+    :return: Track
+    """
+    if isinstance(song, Track):
+        return song
+    artists = song.get('ar') or song.get('artists') or []
+    album = song.get('al') or song.get('album') or {}
+    return Track(
+        id=song['id'],
+        name=song.get('name', ''),
+        artist=artists[0].get('name', '') if artists else '',
+        artists='/'.join(a.get('name', '') for a in artists),
+        album=album.get('name', ''),
+        cover=album.get('picUrl') or '',
+        no=song.get('no') or 0,
+    )
+
+def run_pipeline(pages, resolve_urls, download, on_result=None, on_listed=None,
+                 url_batch=100, workers=1, queue_size=200, lookahead=20,
+                 url_max_age=600, max_refresh=2, max_verify_retries=2, events=None, cancel=None):
+    """
+    流水线下载歌单：翻页、解析下载链接、下载三个阶段各自运行，用有界队列连接
+    第一页歌曲拿到后立即开始解析和下载，无需等待整个歌单列完；队列有上限，内存占用与歌单大小无关
+    下载链接只在下载位置前方 lookahead 首的窗口内解析，长任务末尾的链接不会提前过期；
+    下载时发现链接已过期（download 抛出 UrlExpiredError）或解析时间超过 url_max_age，会重新获取链接再试；
+    下载的文件长度或 MD5 不符（download 抛出 IntegrityError）时重新下载
+    :param pages: 可迭代对象，每次产出一页歌曲（原始字典或 Track）
+    :param resolve_urls: 函数，参数为歌曲ID列表，返回 {歌曲ID: SongUrl}（没有链接的歌曲不包含在内）
+    :param download: 函数，参数为 (Track, SongUrl 或 None)，返回结果消息；链接失效时抛出 UrlExpiredError，
+                     校验失败时抛出 IntegrityError
+    :param on_result: 回调 (Track, 结果消息)，每首歌处理结束后调用
+    :param on_listed: 回调 (已列出的歌曲数)，每列完一页调用一次
+    :param url_batch: 每次解析下载链接的最大歌曲数（不超过 lookahead）
+    :param workers: 并行下载线程数
+    :param queue_size: 待解析歌曲队列的容量
+    :param lookahead: 已解析但未下载的歌曲数上限
+    :param url_max_age: 链接解析后超过该秒数再下载时先重新获取
+    :param max_refresh: 单首歌链接失效后最多重新获取的次数
+    :param max_verify_retries: 单首歌校验失败后最多重新下载的次数
+    :param events: 事件日志（job_events.EventLog），记录每首歌的入队、解析、完成事件，None 表示不记录
+    :param cancel: threading.Event，设置后不再翻页、解析或开始新的下载（正在下载的歌曲照常完成），尽快返回
+    :return: 处理的歌曲数
+    :raises PipelineError: 翻页、解析链接或 on_result 出错（即使部分歌曲已处理完）
+    """
+    url_batch = max(1, min(url_batch, lookahead))
+    track_q = queue.Queue(maxsize=queue_size)
+    download_q = queue.Queue(maxsize=lookahead)
+    errors = []
+    processed = [0]
+    processed_lock = threading.Lock()
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    def list_stage():
+        listed = 0
+        try:
+            for page in pages:
+                if cancelled():
+                    break
+                for song in page:
+                    track = compact_track(song)
+                    if events:
+                        events.emit('track_queued', song_id=track.id)
+                    track_q.put(track)
+                listed += len(page)
+                if on_listed:
+                    on_listed(listed)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            track_q.put(_DONE)
+
+    def resolve_stage():
+        finished = False
+        try:
+            while not finished:
+                batch = [track_q.get()]
+                # 尽量凑满一批再请求，但不为凑批而等待
+                while len(batch) < url_batch:
+                    try:
+                        batch.append(track_q.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch[-1] is _DONE:
+                    batch.pop()
+                    finished = True
+                if not batch or cancelled():
+                    # 取消后继续取出剩余歌曲但不再解析，让翻页阶段不会阻塞在写满的队列上
+                    continue
+                start = time.perf_counter()
+                try:
+                    urls = resolve_urls([track.id for track in batch])
+                except Exception as e:
+                    errors.append(e)
+                    urls = {}
+                resolved_at = time.monotonic()
+                for track in batch:
+                    if events:
+                        events.emit('track_resolved', song_id=track.id, has_url=bool(urls.get(track.id)),
+                                    batch=len(batch), resolve_ms=round((time.perf_counter() - start) * 1000, 1))
+                    download_q.put((track, urls.get(track.id), resolved_at))
+        finally:
+            for _ in range(workers):
+                download_q.put(_DONE)
+
+    def refresh_url(track):
+        try:
+            return resolve_urls([track.id]).get(track.id)
+        except Exception:
+            return None
+
+    def download_one(track, url, resolved_at, stats):
+        if url and time.monotonic() - resolved_at > url_max_age:
+            url = refresh_url(track)
+            stats['stale_refresh'] = True
+        refreshes = 0
+        verify_retries = 0
+        while True:
+            try:
+                return download(track, url)
+            except UrlExpiredError as e:
+                if refreshes >= max_refresh:
+                    stats.update(outcome='failed', error=type(e).__name__, retries=refreshes)
+                    return f"[失败] {track.artist}-{track.name}: 下载链接失效（已重新获取{refreshes}次）: {e}"
+                refreshes += 1
+                stats['retries'] = refreshes
+                url = refresh_url(track)
+            except IntegrityError as e:
+                if verify_retries >= max_verify_retries:
+                    stats.update(outcome='failed', error=type(e).__name__, verify_retries=verify_retries)
+                    return f"[失败] {track.artist}-{track.name}: {e}（已重新下载{verify_retries}次）"
+                verify_retries += 1
+                stats['verify_retries'] = verify_retries
+            except Exception as e:
+                stats.update(outcome='failed', error=type(e).__name__)
+                return f"[失败] {track.artist}-{track.name}: {e}"
+
+    def download_logged(track, url, resolved_at):
+        if not events:
+            return download_one(track, url, resolved_at, {})
+        start = time.perf_counter()
+        with events.track() as stats:
+            msg = download_one(track, url, resolved_at, stats)
+        stats.setdefault('outcome', 'failed' if msg and msg.startswith('[失败]') else 'downloaded')
+        stats.setdefault('retries', 0)
+        events.emit('track_failed' if stats['outcome'] == 'failed' else 'track_done', song_id=track.id,
+                    duration_ms=round((time.perf_counter() - start) * 1000, 1), **stats)
+        return msg
+
+    def download_stage():
+        while True:
+            item = download_q.get()
+            if item is _DONE:
+                break
+            if cancelled():
+                continue
+            track, url, resolved_at = item
+            msg = download_logged(track, url, resolved_at)
+            with processed_lock:
+                processed[0] += 1
+            if on_result:
+                # 回调出错不能让下载线程退出，否则 download_q 写满后解析阶段会一直阻塞
+                try:
+                    on_result(track, msg)
+                except Exception as e:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=list_stage, daemon=True),
+               threading.Thread(target=resolve_stage, daemon=True)]
+    threads += [threading.Thread(target=download_stage, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise PipelineError(errors, processed[0])
+    return processed[0]
@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+COVER_SIZE = 500  # 嵌入封面的边长（像素），由图片 CDN 的 ?param= 缩放
+
+logger = logging.getLogger(__name__)
+
+def tags_from_track(track):
+    """
+    从 Track 生成标签字典（可跨进程传递）
+    :param track: 精简歌曲记录（Track）
+    :return: 标签字典
+    """
+    return {
+        'title': track.name,
+        'artist': track.artists or track.artist,
+        'album': track.album,
+        'track_no': track.no,
+        'cover_url': track.cover,
+    }
+
+def _syncsafe(n):
+    return bytes([(n >> 21) & 0x7f, (n >> 14) & 0x7f, (n >> 7) & 0x7f, n & 0x7f])
+
+def _frame(frame_id, payload):
+    return frame_id.encode('ascii') + struct.pack('>I', len(payload)) + b'\x00\x00' + payload
+
+def _text_frame(frame_id, text):
+    # 编码 1 = 带 BOM 的 UTF-16，ID3v2.3 下兼容性最好
+    return _frame(frame_id, b'\x01' + str(text).encode('utf-16'))
+
+def build_id3v2(tags, cover=None, cover_mime='image/jpeg'):
+    """
+    生成 ID3v2.3 标签
+    :param tags: 标签字典（title/artist/album/track_no）
+    :param cover: 封面图片字节，None 表示不嵌入
+    :return: 标签字节
+    """
+    frames = b''
+    for frame_id, key in (('TIT2', 'title'), ('TPE1', 'artist'), ('TALB', 'album')):
+        if tags.get(key):
+            frames += _text_frame(frame_id, tags[key])
+    if tags.get('track_no'):
+        frames += _text_frame('TRCK', tags['track_no'])
+    if cover:
+        # 编码 0，MIME，图片类型 3（封面），空描述
+        frames += _frame('APIC', b'\x00' + cover_mime.encode('ascii') + b'\x00\x03\x00' + cover)
+    return b'ID3\x03\x00\x00' + _syncsafe(len(frames)) + frames
+
+def id3v2_size(head):
+    """
+    :param head: 文件开头至少 10 字节
+    :return: 文件开头已有 ID3v2 标签的总长度，没有则为 0
+    """
+    if len(head) < 10 or head[:3] != b'ID3':
+        return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+def tag_file(path, tags, out_dir):
+    """
+    在进程池中执行：下载封面，把带新 ID3v2 标签的文件写到 out_dir 下的临时文件
+    不改动 path：内容库中相同音频的文件可能被多首歌共用，由主进程把临时文件移入内容库（见 ContentStore.commit_tagged）
+    :param out_dir: 临时文件目录，与内容库在同一文件系统
+    :return: {'path', 'tmp_path', 'size', 'sha256', 'seconds'}
+    """
+    start = time.perf_counter()
+    cover = None
+    if tags.get('cover_url'):
+        try:
+            resp = requests.get(tags['cover_url'], params={'param': f'{COVER_SIZE}y{COVER_SIZE}'}, timeout=10)
+            resp.raise_for_status()
+            cover = resp.content
+        except requests.RequestException:
+            cover = None
+    tag = build_id3v2(tags, cover)
+    with open(path, 'rb') as f:
+        data = f.read()
+    audio = data[id3v2_size(data[:10]):]
+    tmp_path = os.path.join(out_dir, f'{uuid.uuid4().hex}.tagged.part')
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(tag)
+            f.write(audio)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {
+        'path': path,
+        'tmp_path': tmp_path,
+        'size': len(tag) + len(audio),
+        'sha256': hashlib.sha256(tag + audio).hexdigest(),
+        'seconds': time.perf_counter() - start,
+    }
+
+class TagStage:
+    """
+    下载后的标签写入阶段：下载线程只把任务放进队列立即返回，
+    由单独的进程池写标签、处理封面，不占用下载线程；吞吐单独统计
+    """
+    def __init__(self, out_dir, processes=2):
+        """
+        :param out_dir: 带标签文件的临时目录（内容库的 tmp 目录）
+        """
+        self.out_dir = out_dir
+        self.processes = processes
+        self._queue = queue.Queue()
+        self._inflight = threading.Semaphore(processes * 2)
+        self._pool = None
+        self._feeder = None
+        self._lock = threading.Lock()
+        self._started_at = None
+        self.tagged = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.bytes = 0
+
+    def submit(self, path, tags, on_done=None):
+        """
+        :param path: 要写标签的文件
+        :param tags: tags_from_track 生成的标签字典
+        :param on_done: 成功后回调 (结果字典)，在主进程的回调线程中执行，负责把临时文件 tmp_path 移走；
+                        回调返回后仍留下的临时文件会被删除
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes)
+                self._feeder = threading.Thread(target=self._feed, daemon=True)
+                self._feeder.start()
+                self._started_at = time.perf_counter()
+        self._queue.put((path, tags, on_done))
+
+    def _feed(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            path, tags, on_done = item
+            self._inflight.acquire()
+            try:
+                future = self._pool.submit(tag_file, path, tags, self.out_dir)
+            except Exception:
+                # 进程池已损坏（如子进程被杀，BrokenProcessPool）等：记为失败，继续处理队列，不让 feeder 线程退出
+                self._inflight.release()
+                logger.exception('提交标签任务失败: %s', path)
+                with self._lock:
+                    self.failed += 1
+                continue
+            future.add_done_callback(lambda f, cb=on_done, p=path: self._finished(f, cb, p))
+
+    def _finished(self, future, on_done, path):
+        self._inflight.release()
+        try:
+            result = future.result()
+        except Exception:
+            logger.exception('写入标签失败: %s', path)
+            with self._lock:
+                self.failed += 1
+            return
+        try:
+            if on_done:
+                on_done(result)
+        except Exception:
+            logger.exception('保存带标签的文件失败: %s', path)
+            with self._lock:
+                self.failed += 1
+            return
+        finally:
+            # 回调没有取走（或出错）的临时文件
+            if os.path.exists(result['tmp_path']):
+                os.remove(result['tmp_path'])
+        with self._lock:
+            self.tagged += 1
+            self.busy_seconds += result['seconds']
+            self.bytes += result['size']
+
+    def close(self):
+        """等待队列中的任务全部完成并关闭进程池"""
+        with self._lock:
+            pool, feeder = self._pool, self._feeder
+        if pool is None:
+            return
+        self._queue.put(None)
+        feeder.join()
+        pool.shutdown(wait=True)
+        with self._lock:
+            self._pool = None
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._started_at if self._started_at else 0
+            return {
+                'tagged': self.tagged,
+                'failed': self.failed,
+                'pending': self._queue.qsize(),
+                'files_per_sec': round(self.tagged / elapsed, 2) if elapsed else 0,
+                'mb_per_sec': round(self.bytes / elapsed / 1024 / 1024, 2) if elapsed else 0,
+                'avg_seconds': round(self.busy_seconds / self.tagged, 3) if self.tagged else 0,
+            }
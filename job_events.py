@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# 歌曲最终结果：download_song 通过 note(outcome=...) 标记，失败时记录异常类名
+OUTCOMES = ('downloaded', 'reused', 'exists', 'skipped', 'failed')
+
+class EventLog:
+    """
+    结构化事件日志：任务和每首歌的生命周期事件按行写入 JSONL，供 analyze_events.py 事后分析
+    每行至少包含 ts（时间戳）、run（本次运行ID）、event（事件名），其余字段随事件而定
+    """
+    def __init__(self, path, run_id=None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._f = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def emit(self, event, **fields):
+        record = {'ts': round(time.time(), 4), 'run': self.run_id, 'event': event}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._f.write(line + '\n')
+
+    def bind(self, **fields):
+        """返回附带固定字段（如 job）的子日志，写入同一个文件"""
+        return BoundEventLog(self, fields)
+
+    @contextmanager
+    def track(self):
+        """
+        在当前线程中开始记录一首歌的处理过程，期间 note() 写入的字段由调用方汇总进最终事件
+        :return: 字段字典
+        """
+        stats = {}
+        previous = getattr(self._local, 'stats', None)
+        self._local.stats = stats
+        try:
+            yield stats
+        finally:
+            self._local.stats = previous
+
+    def note(self, **fields):
+        """给当前线程正在处理的歌曲补充字段（字节数、首字节耗时、结果等），不在 track() 中时忽略"""
+        stats = getattr(self._local, 'stats', None)
+        if stats is not None:
+            stats.update(fields)
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+class BoundEventLog:
+    def __init__(self, log, fields):
+        self._log = log
+        self._fields = fields
+
+    def emit(self, event, **fields):
+        self._log.emit(event, **dict(self._fields, **fields))
+
+    def bind(self, **fields):
+        return BoundEventLog(self._log, dict(self._fields, **fields))
+
+    def track(self):
+        return self._log.track()
+
+    def note(self, **fields):
+        self._log.note(**fields)
+
+class TransferTimer:
+    """
+    下载循环中使用：记录首字节耗时和传输字节数，写入当前歌曲的事件字段
+    """
+    def __init__(self, log):
+        self._log = log
+        self._start = time.perf_counter()
+        self.bytes = 0
+
+    def update(self, n):
+        if not self.bytes:
+            self._log.note(first_byte_ms=round((time.perf_counter() - self._start) * 1000, 1))
+        self.bytes += n
+
+    def finish(self):
+        self._log.note(bytes=self.bytes, transfer_ms=round((time.perf_counter() - self._start) * 1000, 1))
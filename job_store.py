@@ -0,0 +1,266 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from download_pipeline import Track
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,                     -- song / playlist
+    target_id TEXT NOT NULL,                -- 歌曲ID或歌单ID
+    info TEXT NOT NULL DEFAULT '{}',        -- 前端传入的展示信息（JSON）
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued / running / done / error
+    listed INTEGER NOT NULL DEFAULT 0,      -- 歌单是否已全部列出并记录
+    msg TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    worker_id TEXT NOT NULL DEFAULT '',     -- 正在处理该任务的进程（主机名:pid）
+    lease_until REAL NOT NULL DEFAULT 0,    -- 租约到期时间，到期未续约的 running 任务可被其它进程接手
+    progress TEXT NOT NULL DEFAULT '{}'     -- 进度（JSON：current/total/msg/now），供任意进程的 /status 读取
+);
+CREATE TABLE IF NOT EXISTS job_tracks (
+    job_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,                   -- 在歌单中的位置
+    song_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    artists TEXT NOT NULL,
+    album TEXT NOT NULL,
+    cover TEXT NOT NULL,
+    no INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', -- pending / done / failed
+    msg TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_tracks_song ON job_tracks (job_id, song_id);
+'''
+
+# 下载结果消息前缀 -> 歌曲状态
+FAILED_PREFIXES = ('[失败]',)
+
+# 旧版本 jobs.db 缺少的列
+MIGRATIONS = {
+    'worker_id': "ALTER TABLE jobs ADD COLUMN worker_id TEXT NOT NULL DEFAULT ''",
+    'lease_until': 'ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0',
+    'progress': "ALTER TABLE jobs ADD COLUMN progress TEXT NOT NULL DEFAULT '{}'",
+}
+
+class LeaseLostError(Exception):
+    """任务的租约已被其它进程接手，本进程不能再写入该任务"""
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+class JobStore:
+    """
+    下载任务日志：任务和每首歌的状态写入本地 SQLite，服务重启或崩溃后可从第一首未完成的歌继续
+    同一台机器上的多个 web/下载进程共用一个 jobs.db（WAL 模式）：
+    进程通过 claim_job 领取任务并定期续约，进程退出后租约到期，任务由其它进程接手
+    写入任务状态、进度和歌曲结果的方法可传入 worker_id：租约已不属于该进程时不写入，
+    避免卡顿后恢复的旧进程覆盖新接手进程的结果
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')]
+        for column, sql in MIGRATIONS.items():
+            if column not in columns:
+                self._conn.execute(sql)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).lastrowid
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add_job(self, job_type, target_id, info=None):
+        """
+        新增排队任务
+        :return: 任务ID
+        """
+        now = time.time()
+        return self._execute(
+            'INSERT INTO jobs (type, target_id, info, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (job_type, str(target_id), json.dumps(info or {}, ensure_ascii=False), now, now),
+        )
+
+    def _job_dict(self, rows):
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job['info'] = json.loads(job['info'])
+        job['progress'] = json.loads(job['progress'])
+        return job
+
+    def get_job(self, job_id):
+        return self._job_dict(self._query('SELECT * FROM jobs WHERE id = ?', (job_id,)))
+
+    def claim_job(self, worker_id, lease_seconds, job_type=None):
+        """
+        领取下一个待处理任务：优先接手租约已到期的中断任务，其次按入队顺序
+        多个进程同时领取时由 SQLite 写锁保证同一任务只会被一个进程拿到
+        :param job_type: 只领取该类型的任务，None 表示不限
+        :return: 任务字典（领取前的状态在 job['status'] 中），没有可领取的任务返回 None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE (status = 'queued' OR (status = 'running' AND lease_until < ?)) "
+                    "AND (? IS NULL OR type = ?) ORDER BY status = 'running' DESC, id LIMIT 1",
+                    (now, job_type, job_type),
+                ).fetchall()
+                if rows:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                        (worker_id, now + lease_seconds, now, rows[0]['id']),
+                    )
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+        return self._job_dict(rows)
+
+    def renew_lease(self, job_id, worker_id, lease_seconds):
+        """
+        续约
+        :return: 租约是否仍属于该进程
+        """
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, worker_id),
+            )
+            return cur.rowcount > 0
+
+    def release_dead_leases(self):
+        """本机已退出的进程持有的租约立即作废，重启后不必等租约到期就能继续任务"""
+        if os.name != 'posix':
+            # Windows 上 os.kill 会结束目标进程，只能等租约自然到期
+            return
+        host = socket.gethostname()
+        for row in self._query("SELECT id, worker_id FROM jobs WHERE status = 'running' AND lease_until > 0"):
+            worker_host, _, pid = row['worker_id'].rpartition(':')
+            if worker_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                self._execute('UPDATE jobs SET lease_until = 0 WHERE id = ? AND worker_id = ?',
+                              (row['id'], row['worker_id']))
+
+    def set_job_status(self, job_id, status, msg='', worker_id=None):
+        """
+        :param worker_id: 只在任务仍由该进程持有时更新，None 表示不检查
+        :return: 是否已更新
+        """
+        with self._lock:
+            cur = self._conn.execute(
+                'UPDATE jobs SET status = ?, msg = ?, updated_at = ? WHERE id = ? AND (? IS NULL OR worker_id = ?)',
+                (status, msg, time.time(), job_id, worker_id, worker_id),
+            )
+            return cur.rowcount > 0
+
+    def set_progress(self, job_id, worker_id=None, **fields):
+        """合并更新任务进度（current/total/msg/now），worker_id 同 set_job_status"""
+        with self._lock:
+            row = self._conn.execute('SELECT progress, worker_id FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or (worker_id is not None and row[1] != worker_id):
+                return
+            progress = json.loads(row[0])
+            progress.update(fields)
+            self._conn.execute('UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?',
+                               (json.dumps(progress, ensure_ascii=False), time.time(), job_id))
+
+    def progress_snapshot(self):
+        """
+        汇总所有进程的下载进度
+        :return: (正在下载的任务列表, 最近结束的任务)，任务字典带解析后的 progress
+        """
+        running = [self._job_dict([row]) for row in
+                   self._query("SELECT * FROM jobs WHERE status = 'running' ORDER BY updated_at DESC")]
+        last = self._job_dict(self._query(
+            "SELECT * FROM jobs WHERE status IN ('done', 'error') ORDER BY updated_at DESC LIMIT 1"
+        ))
+        return running, last
+
+    def count_jobs(self, *statuses):
+        marks = ','.join('?' for _ in statuses)
+        return self._query(f'SELECT COUNT(*) FROM jobs WHERE status IN ({marks})', statuses)[0][0]
+
+    def add_tracks(self, job_id, tracks, worker_id=None):
+        """
+        记录新列出的一页歌曲，位置接在已记录歌曲之后
+        :param worker_id: 同 set_job_status
+        :return: 带位置（idx）的 Track 列表
+        :raises LeaseLostError: 任务已不属于 worker_id
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if worker_id is not None:
+                    owner = self._conn.execute('SELECT worker_id FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                    if owner is None or owner[0] != worker_id:
+                        raise LeaseLostError(f'任务 {job_id} 已由其它进程接手')
+                start = self._conn.execute('SELECT COUNT(*) FROM job_tracks WHERE job_id = ?', (job_id,)).fetchone()[0]
+                self._conn.executemany(
+                    'INSERT INTO job_tracks (job_id, idx, song_id, name, artist, artists, album, cover, no) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(job_id, start + i, t.id, t.name, t.artist, t.artists, t.album, t.cover, t.no)
+                     for i, t in enumerate(tracks)],
+                )
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+        return [t._replace(idx=start + i) for i, t in enumerate(tracks)]
+
+    def mark_listed(self, job_id, worker_id=None):
+        self._execute('UPDATE jobs SET listed = 1, updated_at = ? WHERE id = ? AND (? IS NULL OR worker_id = ?)',
+                      (time.time(), job_id, worker_id, worker_id))
+
+    def track_counts(self, job_id):
+        """
+        :return: (已记录歌曲数, 已处理歌曲数)
+        """
+        row = self._query(
+            "SELECT COUNT(*), COALESCE(SUM(status != 'pending'), 0) FROM job_tracks WHERE job_id = ?", (job_id,)
+        )[0]
+        return row[0], row[1]
+
+    def pending_tracks(self, job_id):
+        rows = self._query(
+            "SELECT * FROM job_tracks WHERE job_id = ? AND status = 'pending' ORDER BY idx", (job_id,)
+        )
+        return [Track(id=r['song_id'], name=r['name'], artist=r['artist'], artists=r['artists'],
+                      album=r['album'], cover=r['cover'], no=r['no'], idx=r['idx']) for r in rows]
+
+    def mark_track(self, job_id, idx, msg, worker_id=None):
+        """
+        记录歌曲结果，按歌单中的位置更新（同一首歌出现多次时各自记录）
+        :param idx: Track.idx
+        :param worker_id: 同 set_job_status
+        """
+        status = 'failed' if msg and msg.startswith(FAILED_PREFIXES) else 'done'
+        self._execute(
+            "UPDATE job_tracks SET status = ?, msg = ? WHERE job_id = ? AND idx = ? AND status = 'pending' "
+            "AND (? IS NULL OR EXISTS (SELECT 1 FROM jobs WHERE jobs.id = job_tracks.job_id AND jobs.worker_id = ?))",
+            (status, msg or '', job_id, idx, worker_id, worker_id),
+        )
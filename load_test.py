@@ -0,0 +1,352 @@
+"""
+网页端压力测试：启动本地上游桩服务（模拟网易云 API 和音频 CDN），把 web_downloader.app 指向它，
+多个并发用户按场景请求各接口，输出各接口的延迟分位数和吞吐，可保存为 JSON 与之前的结果对比
+用法：python load_test.py [--scenario mixed] [--users 20] [--duration 20] [--out report.json] [--compare old.json]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import Counter, defaultdict
+
+import requests
+from werkzeug.serving import make_server
+
+from analyze_events import percentile
+
+KEYWORDS = ['周杰伦', '陈奕迅', '林俊杰', '邓紫棋', '五月天', '薛之谦', '毛不易', '李荣浩', '孙燕姿', '王菲',
+            '晴天', '稻香', '十年', '后来', '平凡之路', '起风了', '夜曲', '光年之外', '演员', '告白气球']
+SHARED_PLAYLISTS = [3778678, 3779629, 2884035]  # 多个用户同时打开的热门歌单
+PREVIEW_POOL = 200  # 试听的歌曲从这么多首中随机选，部分请求会命中下载链接缓存
+LEVEL_BITRATES = {'standard': 128000, 'higher': 192000, 'exhigh': 320000, 'lossless': 999000, 'hires': 1999000}
+
+# ----------------- 上游桩服务 -----------------
+
+class UpstreamStub:
+    """
+    模拟上游：网易云 API 中本项目用到的接口，以及支持 Range 的音频 CDN
+    数据按 ID 生成，同一 ID 每次返回相同内容；每个请求先等待 latency 秒模拟网络往返
+    """
+    def __init__(self, latency=0.02, audio_bytes=1024 * 1024, audio_bps=0, playlist_size=1000):
+        self.latency = latency
+        self.audio = (bytes(range(256)) * (audio_bytes // 256 + 1))[:audio_bytes]
+        self.audio_bps = audio_bps
+        self.playlist_size = playlist_size
+        self.base = ''  # 服务启动后设置，用于生成音频和封面链接
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._routes = {
+            '/search': self.search,
+            '/song/detail': self.song_detail,
+            '/song/url/v1': self.song_url,
+            '/playlist/detail': self.playlist_detail,
+            '/playlist/track/all': self.playlist_tracks,
+        }
+
+    def song(self, song_id):
+        return {'id': song_id, 'name': f'歌曲{song_id}', 'ar': [{'name': f'歌手{song_id % 50}'}],
+                'al': {'name': f'专辑{song_id % 200}', 'picUrl': f'{self.base}/cover/{song_id}.jpg'},
+                'dt': 240000, 'no': 1}
+
+    def search(self, query):
+        # 同一关键词固定对应一段歌曲ID
+        first = zlib.crc32(query.get('keywords', '').encode()) % 100000 * 1000
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 30))
+        songs = [{'id': first + i, 'name': f'歌曲{first + i}', 'artists': [{'name': '歌手'}],
+                  'album': {'name': '专辑'}, 'duration': 240000} for i in range(offset, offset + limit)]
+        return {'code': 200, 'result': {'songCount': 300, 'songs': songs}}
+
+    def song_detail(self, query):
+        ids = [int(x) for x in query.get('ids', '').split(',') if x.isdigit()]
+        return {'code': 200, 'songs': [self.song(sid) for sid in ids]}
+
+    def song_url(self, query):
+        level = query.get('level', 'standard')
+        ids = [int(x) for x in query.get('id', '').split(',') if x.isdigit()]
+        return {'code': 200, 'data': [{'id': sid, 'url': f'{self.base}/audio/{sid}.mp3', 'size': len(self.audio),
+                                       'br': LEVEL_BITRATES.get(level, 128000), 'md5': None, 'type': 'mp3',
+                                       'level': level} for sid in ids]}
+
+    def playlist_detail(self, query):
+        pid = int(query.get('id', 0))
+        return {'code': 200, 'playlist': {'id': pid, 'name': f'歌单{pid}', 'trackCount': self.playlist_size,
+                                          'updateTime': 1700000000000, 'trackUpdateTime': 1700000000000}}
+
+    def playlist_tracks(self, query):
+        pid = int(query.get('id', 0))
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 1000))
+        end = min(offset + limit, self.playlist_size)
+        return {'code': 200, 'songs': [self.song(pid * 10000 + i) for i in range(offset, end)]}
+
+    def stream_audio(self, environ, start_response):
+        data = self.audio
+        status = '200 OK'
+        headers = [('Content-Type', 'audio/mpeg'), ('Accept-Ranges', 'bytes')]
+        rng = environ.get('HTTP_RANGE', '')
+        if rng.startswith('bytes='):
+            start, _, end = rng[6:].partition('-')
+            start = int(start or 0)
+            end = min(int(end), len(data) - 1) if end else len(data) - 1
+            headers.append(('Content-Range', f'bytes {start}-{end}/{len(data)}'))
+            data = data[start:end + 1]
+            status = '206 Partial Content'
+        headers.append(('Content-Length', str(len(data))))
+        start_response(status, headers)
+        def body():
+            for i in range(0, len(data), 64 * 1024):
+                chunk = data[i:i + 64 * 1024]
+                if self.audio_bps:
+                    time.sleep(len(chunk) / self.audio_bps)
+                yield chunk
+        return body()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        query = dict(urllib.parse.parse_qsl(environ.get('QUERY_STRING', '')))
+        route = '/audio' if path.startswith('/audio/') else path
+        with self._lock:
+            self.counts[route] += 1
+        time.sleep(self.latency)
+        if route == '/audio':
+            return self.stream_audio(environ, start_response)
+        handler = self._routes.get(path)
+        if handler is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'not found']
+        body = json.dumps(handler(query), ensure_ascii=False).encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+
+def serve(app):
+    """
+    在后台线程中启动 WSGI 服务（随机端口）
+    :return: (server, 基础地址)
+    """
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+# ----------------- 场景 -----------------
+
+def search_request(rnd):
+    # 大部分是热门关键词（命中缓存），一部分是冷门关键词（回源）
+    kw = rnd.choice(KEYWORDS) if rnd.random() < 0.8 else f'{rnd.choice(KEYWORDS)}{rnd.randrange(100000)}'
+    return 'search', f'/search?kw={urllib.parse.quote(kw)}&stype=1'
+
+def search_songs_request(rnd):
+    return 'search_songs', f'/api/search_songs?kw={urllib.parse.quote(rnd.choice(KEYWORDS))}'
+
+def playlist_request(rnd):
+    return 'playlist_tracks', f'/api/playlist_tracks?id={rnd.choice(SHARED_PLAYLISTS)}'
+
+def playlist_stream_request(rnd):
+    return 'playlist_stream', f'/api/playlist_tracks?id={rnd.choice(SHARED_PLAYLISTS)}&stream=1&fields=id,name,ar.name,al.picUrl'
+
+def song_detail_request(rnd):
+    pid = rnd.choice(SHARED_PLAYLISTS)
+    start = rnd.randrange(0, 900)
+    ids = ','.join(str(pid * 10000 + i) for i in range(start, start + 50))
+    return 'song_detail', f'/api/song_detail?ids={ids}'
+
+def preview_request(rnd):
+    return 'preview', f'/proxy_download/{rnd.randrange(1, PREVIEW_POOL + 1)}?preview=1'
+
+# 场景名 -> [(权重, 请求生成函数)]
+SCENARIOS = {
+    'search': [(3, search_request), (1, search_songs_request)],
+    'playlist': [(2, playlist_request), (1, playlist_stream_request), (2, song_detail_request)],
+    'preview': [(1, preview_request)],
+    'mixed': [(3, search_request), (1, search_songs_request), (1, playlist_request), (1, playlist_stream_request),
+              (1, song_detail_request), (2, preview_request)],
+}
+
+def run_load(base_url, scenario, users, duration, think=0.0, seed=0):
+    """
+    users 个用户同时开始，各自循环发请求直到 duration 秒，每个请求完整读取响应体
+    :return: 请求记录列表，每条包含 name、status、ok、latency_ms、ttfb_ms、bytes、end（相对开始的秒数）
+    """
+    weighted = SCENARIOS[scenario]
+    weights = [w for w, _ in weighted]
+    makers = [m for _, m in weighted]
+    samples = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def user(index):
+        rnd = random.Random(seed * 1000 + index)
+        session = requests.Session()
+        session.trust_env = False  # 不走系统代理
+        records = []
+        while time.perf_counter() < deadline:
+            name, path = rnd.choices(makers, weights)[0](rnd)
+            t0 = time.perf_counter()
+            record = {'name': name, 'status': 0, 'ok': False, 'bytes': 0}
+            try:
+                with session.get(base_url + path, stream=True, timeout=60) as r:
+                    record['ttfb_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+                    for chunk in r.iter_content(chunk_size=64 * 1024):
+                        record['bytes'] += len(chunk)
+                    record['status'] = r.status_code
+                    record['ok'] = r.status_code < 400
+            except requests.RequestException as e:
+                record['error'] = type(e).__name__
+            now = time.perf_counter()
+            record['latency_ms'] = round((now - t0) * 1000, 2)
+            record['end'] = round(now - start, 3)
+            records.append(record)
+            if think:
+                time.sleep(think)
+        with lock:
+            samples.extend(records)
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+# ----------------- 报告 -----------------
+
+def endpoint_stats(records, wall):
+    latencies = [r['latency_ms'] for r in records]
+    ttfbs = [r['ttfb_ms'] for r in records if 'ttfb_ms' in r]
+    size = sum(r['bytes'] for r in records)
+    return {
+        'count': len(records),
+        'errors': sum(1 for r in records if not r['ok']),
+        'rps': round(len(records) / wall, 2),
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies) if latencies else 0,
+        'ttfb_p50_ms': percentile(ttfbs, 50),
+        'ttfb_p99_ms': percentile(ttfbs, 99),
+        'mb_per_sec': round(size / wall / 1024 / 1024, 3),
+    }
+
+def summarize(samples, wall):
+    by_name = defaultdict(list)
+    for record in samples:
+        by_name[record['name']].append(record)
+    errors = Counter(str(r.get('error') or r['status']) for r in samples if not r['ok'])
+    return {
+        'endpoints': {name: endpoint_stats(records, wall) for name, records in sorted(by_name.items())},
+        'total': endpoint_stats(samples, wall),
+        'errors': dict(errors),
+    }
+
+def format_report(report):
+    lines = [f"场景 {report['scenario']}，{report['users']} 个用户，{report['wall_seconds']} 秒，"
+             f"上游延迟 {report['upstream']['latency_ms']} ms" + (f"，标签 {report['label']}" if report['label'] else '')]
+    lines.append('')
+    lines.append(f"{'接口':<18}{'请求数':>8}{'错误':>6}{'请求/秒':>10}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+                 f"{'首字节p50':>11}{'MB/秒':>9}")
+    rows = list(report['endpoints'].items()) + [('合计', report['total'])]
+    for name, s in rows:
+        lines.append(f"{name:<18}{s['count']:>8}{s['errors']:>6}{s['rps']:>10.1f}{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}"
+                     f"{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}{s['ttfb_p50_ms']:>11.1f}{s['mb_per_sec']:>9.2f}")
+    if report['errors']:
+        lines.append('')
+        lines.append('错误：' + '，'.join(f'{k} {v}' for k, v in report['errors'].items()))
+    lines.append('')
+    lines.append('上游请求数：' + '，'.join(f'{k} {v}' for k, v in sorted(report['upstream_requests'].items())))
+    return '\n'.join(lines)
+
+def change(old, new):
+    if not old:
+        return '-'
+    return f'{(new - old) / old * 100:+.1f}%'
+
+def compare_reports(baseline, report):
+    """
+    :return: 与之前报告逐接口对比 p50/p99/吞吐的文本
+    """
+    lines = [f"与 {baseline.get('label') or '之前的结果'} 对比（场景 {baseline['scenario']}，{baseline['users']} 个用户）："]
+    lines.append(f"{'接口':<18}{'p50(ms) 旧 → 新':<31}{'p99(ms) 旧 → 新':<31}请求/秒 旧 → 新")
+    rows = list(report['endpoints'].items()) + [('合计', report['total'])]
+    for name, s in rows:
+        old = baseline['total'] if name == '合计' else baseline['endpoints'].get(name)
+        if not old:
+            lines.append(f'{name:<18}（之前的结果中没有该接口）')
+            continue
+        lines.append(f"{name:<18}{old['p50_ms']:>10.1f} → {s['p50_ms']:<9.1f}{change(old['p50_ms'], s['p50_ms']):>9}"
+                     f"{old['p99_ms']:>10.1f} → {s['p99_ms']:<9.1f}{change(old['p99_ms'], s['p99_ms']):>9}"
+                     f"{old['rps']:>10.1f} → {s['rps']:<9.1f}{change(old['rps'], s['rps']):>9}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='网页端接口压力测试（本地上游桩服务）')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='mixed', help='请求场景')
+    parser.add_argument('--users', type=int, default=20, help='并发用户数')
+    parser.add_argument('--duration', type=float, default=20, help='持续时间（秒）')
+    parser.add_argument('--think', type=float, default=0, help='每个用户两次请求之间的间隔（秒）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同种子的请求序列相同')
+    parser.add_argument('--upstream-latency', type=float, default=20, help='上游每个请求的延迟（毫秒）')
+    parser.add_argument('--audio-kb', type=int, default=1024, help='每首歌音频大小（KB）')
+    parser.add_argument('--audio-kbps', type=int, default=0, help='上游音频传输速度（KB/秒），0 表示不限')
+    parser.add_argument('--playlist-size', type=int, default=1000, help='每个歌单的歌曲数')
+    parser.add_argument('--workdir', help='运行目录（jobs.db、缓存等写在这里），默认使用新的临时目录')
+    parser.add_argument('--label', default='', help='写入报告的标签，如版本号')
+    parser.add_argument('--out', help='把报告保存为 JSON')
+    parser.add_argument('--compare', help='与之前保存的 JSON 报告对比')
+    args = parser.parse_args()
+    out = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    # web_downloader 在当前目录下创建 jobs.db、缓存和下载目录，放到独立目录中，每次从空缓存开始
+    workdir = args.workdir or tempfile.mkdtemp(prefix='load_test_')
+    os.makedirs(workdir, exist_ok=True)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    stub = UpstreamStub(args.upstream_latency / 1000, args.audio_kb * 1024, args.audio_kbps * 1024, args.playlist_size)
+    stub_server, stub.base = serve(stub)
+    import web_downloader
+    web_downloader.API_BASE = stub.base
+    app_server, app_base = serve(web_downloader.app)
+    print(f'上游桩服务 {stub.base}，网页服务 {app_base}，运行目录 {workdir}')
+    print(f'场景 {args.scenario}：{args.users} 个用户，持续 {args.duration} 秒...')
+
+    started_at = time.time()
+    start = time.perf_counter()
+    samples = run_load(app_base, args.scenario, args.users, args.duration, args.think, args.seed)
+    wall = max(time.perf_counter() - start, 0.001)
+    report = {
+        'label': args.label,
+        'scenario': args.scenario,
+        'users': args.users,
+        'duration': args.duration,
+        'seed': args.seed,
+        'started_at': round(started_at, 3),
+        'wall_seconds': round(wall, 2),
+        'upstream': {'latency_ms': args.upstream_latency, 'audio_kb': args.audio_kb,
+                     'audio_kbps': args.audio_kbps, 'playlist_size': args.playlist_size},
+        'upstream_requests': dict(stub.counts),
+    }
+    report.update(summarize(samples, wall))
+    app_server.shutdown()
+    stub_server.shutdown()
+
+    print(format_report(report))
+    if out:
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'报告已保存到 {out}')
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print('')
+        print(compare_reports(baseline, report))
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,19 @@
+import argparse
 import os
+import sys
+import threading
+import time
 import requests
 from tqdm import tqdm
 import json
 import re
+from collections import defaultdict
+from download_pipeline import (EXPIRED_STATUS, ByteProgress, DiskSpaceError, PipelineError, RateLimiter,
+                               UrlExpiredError, compact_track, format_bytes, preflight, resolve_levels, run_pipeline)
+from content_store import ContentStore, IntegrityError
+from playlist_cache import PlaylistCache
+from job_events import EventLog, TransferTimer
+from id3_tagger import TagStage, tags_from_track
 
 # 读取配置文件
 with open('config.json', 'r', encoding='utf-8') as f:
@@ -38,46 +49,88 @@ SONG_ID = extract_id(SONG_ID_RAW)
 SAVE_DIR = os.path.join(os.getcwd(), 'Music_DownLoad')
 # 每次请求获取的最大歌曲数（API限制）
 SONGS_PER_REQUEST = 100
+# 歌单并行下载线程数（可在 config.json 中修改）
+DOWNLOAD_WORKERS = int(config.get('DOWNLOAD_WORKERS', 1))
+# 下载完成后是否写入 ID3 标签和封面（在单独的进程池中进行，不占用下载线程）
+ID3_TAGGING = bool(config.get('ID3_TAGGING', False))
+# 结构化事件日志路径（JSONL），可用 analyze_events.py 分析下载过程
+EVENT_LOG = config.get('EVENT_LOG', os.path.join('logs', 'job_events.jsonl'))
+# 每秒最多请求 API 的次数（翻页、获取链接、歌曲详情），0 表示不限速
+API_RATE = float(config.get('API_RATE', 0))
+# 下载歌单前先列出全部歌曲，按文件大小检查剩余空间并显示按字节的进度和剩余时间；
+# 预检会让 /song/url 请求量翻倍且要等列完才开始下载，默认关闭（边列边下）
+PREFLIGHT = bool(config.get('PREFLIGHT', False))
+# 预检时下载完成后至少保留的剩余空间（MB）
+DISK_RESERVE_MB = int(config.get('DISK_RESERVE_MB', 200))
+# 下载音质等级，按顺序尝试（standard < higher < exhigh < lossless < hires），前一个拿不到链接时降级
+DOWNLOAD_LEVELS = config.get('DOWNLOAD_LEVELS', ['exhigh', 'higher', 'standard'])
+# 已下载文件的码率低于本次可获取的码率时是否重新下载替换（否则只在结果中提示可升级）
+UPGRADE_QUALITY = bool(config.get('UPGRADE_QUALITY', False))
 
 # 自动创建保存目录
 os.makedirs(SAVE_DIR, exist_ok=True)
+# 内容库：同一首歌只下载一次，其它歌单/文件名用硬链接复用
+content_store = ContentStore(os.path.join(SAVE_DIR, '.store'))
+tag_stage = TagStage(content_store.tmp_dir, processes=2) if ID3_TAGGING else None
+event_log = EventLog(EVENT_LOG)
+rate_limiter = RateLimiter(API_RATE)
+# 歌单歌曲列表缓存（与网页端共用 cache/playlists），歌单没有变化时不再翻页
+playlist_cache = PlaylistCache(os.path.join('cache', 'playlists'))
 
-def get_all_tracks(playlist_id):
+def api_get(url, **kwargs):
     """
-    分页获取歌单内所有歌曲的详细信息
+    请求网易云 API，所有线程共用 rate_limiter 的速率限制
+    """
+    rate_limiter.acquire()
+    return requests.get(url, **kwargs)
+
+def iter_track_pages(playlist_id):
+    """
+    分页获取歌单内歌曲，每拿到一页就返回一页
     :param playlist_id: 歌单ID
-    :return: 歌曲信息列表
+    :return: 生成器，每次产出一页歌曲信息列表
     """
-    tracks = []
     offset = 0
     while True:
         url = f"{API_BASE}/playlist/track/all?id={playlist_id}&limit={SONGS_PER_REQUEST}&offset={offset}"
-        resp = requests.get(url)
+        resp = api_get(url)
         data = resp.json()
         if 'songs' not in data or not data['songs']:
             break
-        tracks.extend(data['songs'])
+        yield data['songs']
         if len(data['songs']) < SONGS_PER_REQUEST:
             break
         offset += SONGS_PER_REQUEST
-    return tracks
+
+def get_playlist_version(playlist_id):
+    """
+    获取歌单详情中的更新时间，用于判断缓存的歌曲列表是否还有效
+    :param playlist_id: 歌单ID
+    :return: 版本，获取失败返回 None
+    """
+    try:
+        resp = api_get(f"{API_BASE}/playlist/detail", params={'id': playlist_id})
+        return PlaylistCache.version_of(resp.json().get('playlist'))
+    except Exception:
+        return None
+
+def playlist_pages(playlist_id):
+    """
+    同 iter_track_pages，歌单自上次获取后没有变化时直接从缓存返回
+    """
+    return playlist_cache.pages(playlist_id, get_playlist_version(playlist_id),
+                                lambda: iter_track_pages(playlist_id), page_size=SONGS_PER_REQUEST)
 
 def get_song_urls(song_ids):
     """
-    批量获取歌曲的下载链接
+    批量获取歌曲的下载链接，按 DOWNLOAD_LEVELS 的顺序选择音质
     :param song_ids: 歌曲ID列表
-    :return: {歌曲ID: 下载链接} 字典
+    :return: {歌曲ID: SongUrl} 字典（含链接、文件大小、码率、音质等级），没有链接的歌曲不包含在内
     """
-    urls = {}
-    for i in range(0, len(song_ids), 100):
-        batch = song_ids[i:i+100]
-        ids_str = ','.join(str(sid) for sid in batch)
-        url = f"{API_BASE}/song/url?id={ids_str}"
-        resp = requests.get(url)
-        data = resp.json()
-        for item in data.get('data', []):
-            urls[item['id']] = item['url']
-    return urls
+    def fetch(batch, level):
+        resp = api_get(f"{API_BASE}/song/url/v1", params={'id': ','.join(str(sid) for sid in batch), 'level': level})
+        return resp.json().get('data') or []
+    return resolve_levels(song_ids, DOWNLOAD_LEVELS, fetch)
 
 def sanitize_filename(name):
     """
@@ -87,36 +140,103 @@ def sanitize_filename(name):
     """
     return ''.join(c for c in name if c not in '\\/:*?\"<>|')
 
-def download_song(song, url):
+def queue_tagging(track, blob_path, filepath):
     """
-    下载单首歌曲到本地
-    :param song: 歌曲信息字典
-    :param url: 下载链接
+    把写标签任务交给标签进程池，已写过标签的歌曲跳过
+    带标签的文件另存为这首歌自己的内容库文件，原文件可能被音频相同的其它歌曲共用，不原地改写
+    :param track: 精简歌曲记录（Track）
+    :param blob_path: 内容库中的文件路径
+    :param filepath: 链接到 blob_path 的歌曲文件，写完标签后改为链接到新文件
     """
-    if not url:
-        print(f"[跳过] {song['name']} - {song['ar'][0]['name']} (无下载链接)")
-        return
-    artist = song['ar'][0]['name']
-    name = song['name']
-    filename = sanitize_filename(f"{artist}-{name}.mp3")
-    filepath = os.path.join(SAVE_DIR, filename)
-    if os.path.exists(filepath):
-        print(f"[已存在] {filename}")
+    if tag_stage is None or not blob_path.endswith('.mp3') or content_store.is_tagged(track.id):
         return
+    tag_stage.submit(blob_path, tags_from_track(track),
+                     on_done=lambda result: content_store.commit_tagged(track.id, blob_path, result['tmp_path'],
+                                                                        result['sha256'], result['size'], [filepath]))
+
+def song_filepath(track, ext='mp3'):
+    """
+    :param track: 精简歌曲记录（Track）
+    :param ext: 扩展名（无损音质为 flac）
+    :return: (文件名, 保存路径)
+    """
+    filename = sanitize_filename(f"{track.artist}-{track.name}.{ext}")
+    return filename, os.path.join(SAVE_DIR, filename)
+
+def upgrade_from(track, song_url):
+    """
+    :return: 已下载文件的码率（低于本次可获取的码率时），否则 0
+    """
+    if not song_url:
+        return 0
+    stored_br, _ = content_store.quality(track.id)
+    return stored_br if 0 < stored_br < song_url.br else 0
+
+def needs_download(track):
+    """本地没有该文件、内容库中也没有时才需要实际下载"""
+    filename, filepath = song_filepath(track)
+    return not os.path.exists(filepath) and not content_store.lookup(track.id)
+
+def download_song(track, song_url):
+    """
+    下载单首歌曲到本地
+    :param track: 精简歌曲记录（Track）
+    :param song_url: 下载链接信息（SongUrl），None 表示没有下载链接
+    :return: 结果消息，如 [完成] xxx.mp3
+    """
+    ext = song_url.type if song_url else 'mp3'
+    filename, filepath = song_filepath(track, ext)
+    old_br = upgrade_from(track, song_url)
+    upgrade = bool(old_br) and UPGRADE_QUALITY
+    if os.path.exists(filepath) and not upgrade:
+        event_log.note(outcome='exists')
+        hint = f" (可升级: {old_br // 1000}k → {song_url.br // 1000}k)" if old_br else ''
+        return f"[已存在] {filename}{hint}"
+    blob_path = None if upgrade else content_store.lookup(track.id)
+    if blob_path and blob_path.endswith(f'.{ext}'):
+        # 这首歌之前下载过（可能文件名不同），直接链接过来
+        content_store.link(blob_path, filepath)
+        queue_tagging(track, blob_path, filepath)
+        event_log.note(outcome='reused')
+        return f"[复用] {filename}"
+    if not song_url:
+        event_log.note(outcome='skipped')
+        return f"[跳过] {track.name} - {track.artist} (无下载链接)"
+    timer = TransferTimer(event_log)
     try:
-        with requests.get(url, stream=True) as r:
+        with requests.get(song_url.url, stream=True) as r:
+            if r.status_code in EXPIRED_STATUS:
+                raise UrlExpiredError(f'HTTP {r.status_code}')
             r.raise_for_status()
             total = int(r.headers.get('content-length', 0))
-            with open(filepath, 'wb') as f, tqdm(
+            # 按 Content-Length（没有时用 /song/url 返回的大小）和 md5 在写入的同时校验，不再重读文件
+            expected_length = 0 if r.headers.get('content-encoding') else total
+            with content_store.writer(track.id, song_url.size, ext, song_url.br, song_url.level) as blob, tqdm(
                 desc=filename, total=total, unit='B', unit_scale=True, unit_divisor=1024
             ) as bar:
                 for chunk in r.iter_content(chunk_size=8192):
                     if chunk:
-                        f.write(chunk)
+                        blob.write(chunk)
                         bar.update(len(chunk))
-        print(f"[完成] {filename}")
+                        timer.update(len(chunk))
+                blob_path = blob.commit(expected_length or song_url.size, song_url.md5)
+        timer.finish()
+        content_store.link(blob_path, filepath)
+        queue_tagging(track, blob_path, filepath)
+        event_log.note(outcome='downloaded', br=song_url.br, level=song_url.level)
+        if upgrade:
+            return f"[完成] {filename} (音质升级: {old_br // 1000}k → {song_url.br // 1000}k)"
+        return f"[完成] {filename}"
+    except IntegrityError:
+        # 文件已隔离，由流水线重新下载
+        timer.finish()
+        raise
+    except UrlExpiredError:
+        raise
     except Exception as e:
-        print(f"[失败] {filename}: {e}")
+        timer.finish()
+        event_log.note(outcome='failed', error=type(e).__name__)
+        return f"[失败] {filename}: {e}"
 
 def get_single_song(song_id):
     """
@@ -125,7 +245,7 @@ def get_single_song(song_id):
     :return: 歌曲信息字典或None
     """
     url = f"{API_BASE}/song/detail?ids={song_id}"
-    resp = requests.get(url)
+    resp = api_get(url)
     data = resp.json()
     if 'songs' in data and data['songs']:
         return data['songs'][0]
@@ -134,35 +254,375 @@ def get_single_song(song_id):
 def main():
     """
     主流程：根据MODE判断下载单曲还是歌单
+    :return: 退出码，出错（包括翻页/获取链接中途失败）时为 1
     """
+    events = event_log.bind(mode=MODE, target_id=SONG_ID if MODE == 1 else PLAYLIST_ID)
+    events.emit('job_started')
+    # 任何退出路径（包括未处理的异常）都记录 job_finished，事件日志中不留下未结束的任务
+    result = {'status': 'error'}
+    try:
+        return download_target(events, result)
+    except BaseException as e:
+        result.setdefault('error', str(e) or type(e).__name__)
+        raise
+    finally:
+        events.emit('job_finished', **result)
+
+def download_target(events, result):
+    """
+    下载 config.json 中指定的单曲或歌单
+    :param result: job_finished 事件的字段，按结果填入 status/tracks/error
+    :return: 退出码
+    """
+    def on_result(track, msg):
+        print(msg)
     if MODE == 1:
         # 下载单曲
         if not SONG_ID:
             print("请在config.json中设置SONG_ID！")
-            return
+            result['error'] = '未设置 SONG_ID'
+            return 1
         print(f"正在获取歌曲（ID: {SONG_ID}）...")
         song = get_single_song(SONG_ID)
         if not song:
             print("未找到该歌曲！")
-            return
+            result['error'] = '未找到该歌曲'
+            return 1
         print("正在获取下载链接...")
-        urls = get_song_urls([song['id']])
-        url = urls.get(song['id'])
-        download_song(song, url)
+        try:
+            count = run_pipeline([[song]], get_song_urls, download_song, on_result=on_result, events=events)
+        except PipelineError as e:
+            return report_pipeline_error(e, result)
         print("下载完成！")
     else:
-        # 下载歌单
-        print(f"正在获取歌单（ID: {PLAYLIST_ID}）的所有歌曲...")
-        tracks = get_all_tracks(PLAYLIST_ID)
-        print(f"共获取到 {len(tracks)} 首歌曲。")
-        song_ids = [song['id'] for song in tracks]
-        print("正在获取下载链接...")
-        urls = get_song_urls(song_ids)
-        print("开始下载...")
-        for song in tracks:
-            url = urls.get(song['id'])
-            download_song(song, url)
+        pages = playlist_pages(PLAYLIST_ID)
+        if PREFLIGHT:
+            print(f"正在获取歌单（ID: {PLAYLIST_ID}）的歌曲并检查磁盘空间...")
+            try:
+                pages, byte_progress = preflight_pages(pages)
+            except DiskSpaceError as e:
+                print(e)
+                result['error'] = str(e)
+                return 1
+            on_result = progress_printer(sum(len(page) for page in pages), byte_progress)
+        else:
+            # 翻页、获取链接、下载同时进行，拿到第一页就开始下载
+            print(f"正在获取歌单（ID: {PLAYLIST_ID}）的歌曲并开始下载...")
+        try:
+            count = run_pipeline(pages, get_song_urls, download_song,
+                                 on_result=on_result, workers=DOWNLOAD_WORKERS, events=events)
+        except PipelineError as e:
+            return report_pipeline_error(e, result)
+        print(f"共处理 {count} 首歌曲。")
         print("全部下载完成！")
+    finish_tagging()
+    result.update(status='done', tracks=count)
+    print(f"事件日志已写入 {EVENT_LOG}，可运行 python analyze_events.py {EVENT_LOG} --run {event_log.run_id} 查看统计")
+    return 0
+
+def report_pipeline_error(e, result):
+    """
+    下载流程出错（如歌单翻页中途失败）：已处理的歌曲照常保存，提示错误并返回退出码 1
+    :param result: job_finished 事件的字段
+    """
+    finish_tagging()
+    print(f"共处理 {e.processed} 首歌曲，但未能全部完成：{e}")
+    print("可重新运行继续下载，已下载的歌曲会跳过。")
+    result.update(tracks=e.processed, error=str(e))
+    return 1
+
+def preflight_pages(pages):
+    """
+    列出全部歌曲，按 /song/url 返回的文件大小统计需要下载的总量并检查剩余空间
+    :param pages: 歌曲页的可迭代对象
+    :return: (歌曲页列表, ByteProgress)
+    :raises DiskSpaceError: 剩余空间不足
+    """
+    tracks = [compact_track(song) for page in pages for song in page]
+    sizes = preflight(tracks, get_song_urls, SAVE_DIR, needs_download, DISK_RESERVE_MB * 1024 * 1024)
+    print(f"共 {len(tracks)} 首，其中需要下载 {len(sizes)} 首，预计 {format_bytes(sum(sizes.values()))}")
+    return [tracks], ByteProgress(sizes)
+
+def progress_printer(total, byte_progress):
+    """
+    :return: on_result 回调，打印结果消息和整体进度（已处理/总数、字节数、剩余时间）
+    """
+    done = [0]
+    lock = threading.Lock()
+    def on_result(track, msg):
+        # 多个下载线程同时回调，加锁避免计数和输出交错
+        with lock:
+            byte_progress.add(track.id, msg.startswith('[完成]'))
+            done[0] += 1
+            stats = byte_progress.snapshot()
+            eta = stats['eta_seconds']
+            eta_text = f"，剩余约 {eta // 60}分{eta % 60}秒" if eta is not None else ''
+            print(f"[{done[0]}/{total}] {format_bytes(stats['bytes_done'])}/{format_bytes(stats['bytes_total'])}"
+                  f"{eta_text} {msg}")
+    return on_result
+
+def finish_tagging():
+    """等待标签进程池写完并打印统计"""
+    if tag_stage is None:
+        return
+    print("正在等待标签写入完成...")
+    tag_stage.close()
+    stats = tag_stage.stats()
+    print(f"标签写入：成功 {stats['tagged']} 首，失败 {stats['failed']} 首，"
+          f"{stats['files_per_sec']} 首/秒，{stats['mb_per_sec']} MB/秒")
+
+# ----------------- 批量模式 -----------------
+
+# 结果消息前缀 -> 清单中的 outcome
+OUTCOME_PREFIXES = {'[完成]': 'downloaded', '[复用]': 'reused', '[已存在]': 'exists',
+                    '[跳过]': 'skipped', '[失败]': 'failed'}
+
+def parse_batch_line(line):
+    """
+    解析批量列表中的一行
+    支持歌单/歌曲链接、"song 123" / "playlist 123"、纯ID（按歌单处理）；空行和 # 开头的行忽略
+    :param line: 一行文本
+    :return: (类型, ID) 或 None
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    parts = line.split(None, 1)
+    if len(parts) == 2 and parts[0].lower() in ('song', 'playlist'):
+        return parts[0].lower(), extract_id(parts[1].strip())
+    kind = 'song' if re.search(r'song\?id=|/song/', line) else 'playlist'
+    return kind, extract_id(line)
+
+def get_song_details(song_ids):
+    """
+    批量获取歌曲详情
+    :param song_ids: 歌曲ID列表
+    :return: 歌曲信息字典列表（找不到的歌曲不包含在内）
+    """
+    songs = []
+    for i in range(0, len(song_ids), 100):
+        batch = song_ids[i:i+100]
+        resp = api_get(f"{API_BASE}/song/detail", params={'ids': ','.join(str(sid) for sid in batch)})
+        songs.extend(resp.json().get('songs') or [])
+    return songs
+
+def outcome_of(msg):
+    for prefix, outcome in OUTCOME_PREFIXES.items():
+        if msg and msg.startswith(prefix):
+            return outcome
+    return 'unknown'
+
+def run_batch(lines, manifest_path=None):
+    """
+    批量下载多个歌单和歌曲：所有目标共用一条流水线（同一组下载线程和 API 限速），
+    多个歌单中重复的歌曲只下载一次，结束后写出 JSON 清单
+    :param lines: 批量列表的行
+    :param manifest_path: 清单输出路径，None 表示不写文件
+    :return: 清单字典（errors 为下载流程中的错误），没有目标或磁盘空间不足时返回 None
+    """
+    targets = []
+    for line in lines:
+        parsed = parse_batch_line(line)
+        if parsed and parsed not in targets:
+            targets.append(parsed)
+    if not targets:
+        print("批量列表中没有可下载的歌单或歌曲！")
+        return None
+    started_at = time.time()
+    events = event_log.bind(mode='batch')
+    events.emit('job_started', targets=len(targets))
+    target_info = {f'{kind}:{tid}': {'type': kind, 'id': tid, 'status': 'pending', 'tracks': 0,
+                                     'unique': 0, 'list_seconds': 0, 'error': ''}
+                   for kind, tid in targets}
+    membership = defaultdict(list)  # 歌曲ID -> 包含它的目标
+    queued = set()
+
+    def add_songs(key, songs):
+        info = target_info[key]
+        page = []
+        for song in songs:
+            membership[song['id']].append(key)
+            info['tracks'] += 1
+            if song['id'] not in queued:
+                queued.add(song['id'])
+                info['unique'] += 1
+                page.append(song)
+        return page
+
+    def pages():
+        song_ids = [tid for kind, tid in targets if kind == 'song']
+        if song_ids:
+            start = time.perf_counter()
+            try:
+                found = {str(song['id']): song for song in get_song_details(song_ids)}
+            except Exception as e:
+                found = {}
+                print(f"获取歌曲详情失败: {e}")
+            for sid in song_ids:
+                info = target_info[f'song:{sid}']
+                info['list_seconds'] = round(time.perf_counter() - start, 3)
+                if sid not in found:
+                    info.update(status='error', error='未找到该歌曲')
+            page = [p for sid in song_ids if sid in found for p in add_songs(f'song:{sid}', [found[sid]])]
+            if page:
+                yield page
+        for kind, pid in targets:
+            if kind != 'playlist':
+                continue
+            key = f'playlist:{pid}'
+            print(f"正在获取歌单（ID: {pid}）...")
+            start = time.perf_counter()
+            try:
+                for songs in playlist_pages(pid):
+                    page = add_songs(key, songs)
+                    if page:
+                        yield page
+            except Exception as e:
+                # 单个歌单失败不影响其它目标
+                target_info[key].update(status='error', error=f'歌单获取失败: {e}')
+                print(f"[失败] 歌单 {pid}: {e}")
+            target_info[key]['list_seconds'] = round(time.perf_counter() - start, 3)
+            if not target_info[key]['tracks'] and target_info[key]['status'] != 'error':
+                target_info[key].update(status='error', error='歌单无歌曲或获取失败')
+
+    batch_pages = pages()
+    report = None
+    expected_bytes = None
+    if PREFLIGHT:
+        try:
+            batch_pages, byte_progress = preflight_pages(batch_pages)
+        except DiskSpaceError as e:
+            print(e)
+            events.emit('job_finished', status='error', error=str(e))
+            return None
+        expected_bytes = byte_progress.total
+        report = progress_printer(sum(len(page) for page in batch_pages), byte_progress)
+
+    first_attempt = {}
+    songs = {}
+    exts = {}
+    def download(track, song_url):
+        first_attempt.setdefault(track.id, time.perf_counter())
+        exts[track.id] = song_url.type if song_url else 'mp3'
+        return download_song(track, song_url)
+    def on_result(track, msg):
+        if report:
+            report(track, msg)
+        else:
+            print(msg)
+        filename, filepath = song_filepath(track, exts.get(track.id, 'mp3'))
+        outcome = outcome_of(msg)
+        songs[track.id] = {
+            'id': track.id,
+            'name': track.name,
+            'artist': track.artists or track.artist,
+            'file': filepath if outcome in ('downloaded', 'reused', 'exists') else None,
+            'outcome': outcome,
+            'msg': msg,
+            'seconds': round(time.perf_counter() - first_attempt[track.id], 3) if track.id in first_attempt else 0,
+            'bytes': os.path.getsize(filepath) if outcome == 'downloaded' and os.path.exists(filepath) else 0,
+        }
+
+    errors = []
+    try:
+        count = run_pipeline(batch_pages, get_song_urls, download, on_result=on_result,
+                             workers=DOWNLOAD_WORKERS, events=events)
+    except PipelineError as e:
+        count = e.processed
+        errors = [str(err) or type(err).__name__ for err in e.errors]
+        for err in errors:
+            print(f"[错误] {err}")
+    finish_tagging()
+
+    for song_id, keys in membership.items():
+        if song_id in songs:
+            songs[song_id]['targets'] = keys
+    for key, info in target_info.items():
+        if info['status'] == 'error':
+            continue
+        failed = sum(1 for song_id, keys in membership.items()
+                     if key in keys and songs.get(song_id, {}).get('outcome') in ('failed', 'skipped', None))
+        info.update(status='partial' if failed else 'done', failed=failed)
+    finished_at = time.time()
+    totals = defaultdict(int)
+    for song in songs.values():
+        totals[song['outcome']] += 1
+        totals['bytes'] += song['bytes']
+    manifest = {
+        'run': event_log.run_id,
+        'started_at': started_at,
+        'finished_at': finished_at,
+        'seconds': round(finished_at - started_at, 3),
+        'workers': DOWNLOAD_WORKERS,
+        'api_rate': API_RATE,
+        'expected_bytes': expected_bytes,
+        'totals': dict(totals, targets=len(targets), songs=count,
+                       duplicates=sum(len(keys) for keys in membership.values()) - len(membership)),
+        'targets': list(target_info.values()),
+        'songs': list(songs.values()),
+        'errors': errors,
+    }
+    events.emit('job_finished', status='error' if errors else 'done', tracks=count, seconds=manifest['seconds'])
+    print(f"共 {len(targets)} 个目标，处理 {count} 首歌曲（跨歌单重复 {manifest['totals']['duplicates']} 首），"
+          f"用时 {manifest['seconds']:.1f} 秒")
+    if manifest_path:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        print(f"清单已写入 {manifest_path}")
+    return manifest
+
+# ----------------- 校验 -----------------
+
+def verify_library(deep=False, repair=False):
+    """
+    检查内容库中已下载的文件：默认只比较文件大小与下载时记录的大小，deep 时重新计算 sha256 与记录比较
+    :param deep: 是否逐个读取文件校验 sha256（较慢）
+    :param repair: 是否删除有问题的文件（移入隔离区，连同下载目录中的硬链接），下次下载时重新获取
+    :return: 有问题的文件数
+    """
+    total = len(content_store.entries())
+    print(f"正在{'校验' if deep else '检查'}内容库中的 {total} 个文件...")
+    bad = 0
+    for song_id, rel_path, problem in content_store.verify(deep):
+        bad += 1
+        print(f"[损坏] 歌曲 {song_id} {rel_path}: {problem}")
+        if repair:
+            for path in content_store.forget(song_id, link_dirs=[SAVE_DIR]):
+                print(f"  已删除 {path}")
+    if not bad:
+        print("全部正常。")
+    elif repair:
+        print(f"共 {bad} 个文件有问题，已移入隔离区，重新运行下载即可补全。")
+    else:
+        print(f"共 {bad} 个文件有问题，加 --repair 可删除后重新下载。")
+    return bad
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='网易云音乐歌单/歌曲下载，不带参数时按 config.json 下载')
+    parser.add_argument('--batch', metavar='FILE', help='批量模式：从文件（- 表示标准输入）读取歌单/歌曲ID或链接，每行一个')
+    parser.add_argument('--manifest', metavar='PATH', help='批量模式结束后写出的 JSON 清单路径')
+    parser.add_argument('--workers', type=int, help='全局并行下载线程数（默认取 config.json 的 DOWNLOAD_WORKERS）')
+    parser.add_argument('--rate', type=float, help='每秒最多请求 API 的次数（默认取 config.json 的 API_RATE，0 不限速）')
+    parser.add_argument('--verify', action='store_true', help='检查已下载的文件是否完整（按记录的大小，不访问网络）')
+    parser.add_argument('--deep', action='store_true', help='与 --verify 一起使用：重新计算 sha256 与记录比较')
+    parser.add_argument('--repair', action='store_true', help='与 --verify 一起使用：删除有问题的文件以便重新下载')
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    args = parse_args()
+    if args.workers:
+        DOWNLOAD_WORKERS = args.workers
+    if args.rate is not None:
+        API_RATE = args.rate
+        rate_limiter = RateLimiter(API_RATE)
+    if args.verify:
+        sys.exit(1 if verify_library(args.deep, args.repair) else 0)
+    if args.batch:
+        if args.batch == '-':
+            manifest = run_batch(sys.stdin.read().splitlines(), args.manifest)
+        else:
+            with open(args.batch, 'r', encoding='utf-8') as f:
+                manifest = run_batch(f.read().splitlines(), args.manifest)
+        sys.exit(0 if manifest and not manifest['errors'] else 1)
+    else:
+        sys.exit(main()) 
\ No newline at end of file
@@ -0,0 +1,135 @@
+import gzip
+import json
+import os
+import threading
+import uuid
+
+# 缓存中每首歌只保留这些字段（网页端列表、下载流水线用到的部分），完整的歌曲对象有几 KB
+CACHED_FIELDS = {
+    'id': {},
+    'name': {},
+    'ar': {'id': {}, 'name': {}},
+    'al': {'id': {}, 'name': {}, 'picUrl': {}},
+    'no': {},
+    'dt': {},
+}
+
+def project_fields(value, tree=CACHED_FIELDS):
+    """按字段树（见 web_downloader.parse_fields）裁剪对象，列表逐个元素裁剪，tree 为空时原样返回"""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [project_fields(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: project_fields(value[key], sub) for key, sub in tree.items() if key in value}
+
+def covers_fields(tree, cached=CACHED_FIELDS):
+    """:return: 按字段树 tree 裁剪所需的字段是否都在缓存中（tree 为 None 表示需要完整对象）"""
+    if tree is None:
+        return False
+    for key, sub in tree.items():
+        if key not in cached:
+            return False
+        # 缓存保留了该字段的完整值，或者只需要缓存中已有的子字段
+        if cached[key] and (not sub or not covers_fields(sub, cached[key])):
+            return False
+    return True
+
+class PlaylistCache:
+    """
+    歌单歌曲列表的本地缓存，每个歌单一个 gzip 压缩的 JSON Lines 文件：第一行为版本，之后每行一首歌（只保留 CACHED_FIELDS）
+    以 /playlist/detail 返回的 trackUpdateTime、updateTime、trackCount 作为版本：
+    版本不变时直接使用缓存的列表，只需一次歌单详情请求，不用重新翻页
+    读写都是逐页进行，内存占用与歌单大小无关
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def version_of(detail):
+        """
+        :param detail: /playlist/detail 返回的 playlist 字典
+        :return: 版本列表，详情中没有更新时间时返回 None（不使用缓存）
+        """
+        if not detail or not (detail.get('trackUpdateTime') or detail.get('updateTime')):
+            return None
+        return [detail.get('trackUpdateTime') or 0, detail.get('updateTime') or 0, detail.get('trackCount') or 0]
+
+    def _path(self, playlist_id):
+        return os.path.join(self.root, f'{int(playlist_id)}.jsonl.gz')
+
+    def _open(self, playlist_id, version):
+        """
+        :return: 版本一致时返回已读过版本行的缓存文件，否则 None
+        """
+        if version is None:
+            return None
+        f = None
+        try:
+            f = gzip.open(self._path(playlist_id), 'rt', encoding='utf-8')
+            header = json.loads(f.readline())
+        except (OSError, EOFError, ValueError):
+            header = None
+        with self._lock:
+            if header and header.get('version') == version:
+                self.hits += 1
+                return f
+            self.misses += 1
+        if f is not None:
+            f.close()
+        return None
+
+    def _read_pages(self, f, page_size, offset):
+        with f:
+            page = []
+            for n, line in enumerate(f):
+                if n < offset:
+                    continue
+                page.append(json.loads(line))
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+            if page:
+                yield page
+
+    def pages(self, playlist_id, version, fetch_pages, page_size=100, offset=0):
+        """
+        逐页返回歌单歌曲：缓存有效时从缓存切页（只有 CACHED_FIELDS 中的字段），否则调用 fetch_pages() 翻页，
+        边翻页边写入临时文件，完整翻完后替换缓存（中途出错或调用方提前停止时丢弃）
+        :param fetch_pages: 无参函数，返回从 offset 开始逐页产出歌曲列表的生成器
+        :param offset: 跳过前 offset 首（续传）
+        """
+        f = self._open(playlist_id, version)
+        if f is not None:
+            yield from self._read_pages(f, page_size, offset)
+            return
+        if offset or version is None:
+            # 续传时没有前面的歌曲，写不出完整的列表
+            yield from fetch_pages()
+            return
+        path = self._path(playlist_id)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        completed = False
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as out:
+                out.write(json.dumps({'version': version}) + '\n')
+                for page in fetch_pages():
+                    out.write(''.join(json.dumps(project_fields(song), ensure_ascii=False) + '\n' for song in page))
+                    yield page
+            os.replace(tmp_path, path)
+            completed = True
+            with self._lock:
+                self.stores += 1
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores}
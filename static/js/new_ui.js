@@ -0,0 +1,347 @@
+// ========== 全局变量 ==========
+let allSongs = [];
+let queue = [];
+let queuedIds = new Set();  // 队列中的歌曲ID（字符串），渲染每一行时判断是否已加入
+
+// ========== 工具函数 ==========
+function extractPlaylistId(input) {
+    let match = input.match(/playlist\?id=(\d+)/);
+    if (match) return match[1];
+    if (/^\d+$/.test(input)) return input;
+    return null;
+}
+function fetchPlaylistStream(pid, onBatch) {
+    // 流式读取 NDJSON，每收到一批歌曲就回调一次
+    // 返回的 Promise 在读完时得到 null；服务端中途出错（发送 {"error": ...} 行）或连接失败时得到错误信息，此前的歌曲已回调
+    return fetch(`/api/playlist_tracks?id=${pid}&stream=1&fields=id,name,ar.name,al.picUrl`).then(r => {
+        if (!r.ok) return `HTTP ${r.status}`;
+        let reader = r.body.getReader();
+        let decoder = new TextDecoder();
+        let buf = '';
+        function pump() {
+            return reader.read().then(({done, value}) => {
+                if (done) return null;
+                buf += decoder.decode(value, {stream: true});
+                let lines = buf.split('\n');
+                buf = lines.pop();
+                let batch = [];
+                for (let line of lines.filter(l => l)) {
+                    let song = JSON.parse(line);
+                    if (song.error) {
+                        if (batch.length) onBatch(batch);
+                        reader.cancel();
+                        return song.error;
+                    }
+                    batch.push(song);
+                }
+                if (batch.length) onBatch(batch);
+                return pump();
+            });
+        }
+        return pump();
+    }).catch(e => e.message || String(e));
+}
+function getArtist(song) {
+    if (song.ar && Array.isArray(song.ar)) {
+        return song.ar.map(a=>a.name).join('/');
+    }
+    if (song.artist) {
+        return song.artist;
+    }
+    if (song.artists && Array.isArray(song.artists)) {
+        return song.artists.map(a=>a.name).join('/');
+    }
+    return '';
+}
+function showModal(message, type='info') {
+    let color = {
+        info: '#f6723a',
+        success: '#388e3c',
+        error: '#d32f2f',
+        warning: '#fbc02d'
+    }[type] || '#f6723a';
+    let modal = document.createElement('div');
+    modal.id = 'info-modal';
+    modal.className = 'modal-anim';
+    modal.innerHTML = `
+      <div class="modal-backdrop" style="position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.3);z-index:9999;display:flex;align-items:center;justify-content:center;">
+        <div class="modal-content modal-content-anim" style="background:#fff;border-radius:10px;box-shadow:0 2px 16px #0002;padding:18px 20px;min-width:180px;max-width:260px;position:relative;">
+          <button onclick="document.body.removeChild(document.getElementById('info-modal'))" style="position:absolute;top:6px;right:8px;font-size:18px;border:none;background:none;">×</button>
+          <div style="color:${color};font-size:1em;">${message}</div>
+        </div>
+      </div>`;
+    document.body.appendChild(modal);
+}
+function showQrLoginModal() {
+    let modal = document.createElement('div');
+    modal.id = 'qr-modal';
+    modal.className = 'modal-anim';
+    modal.innerHTML = `
+      <div class="qr-modal-bg">
+        <div class="qr-modal-box modal-content-anim">
+          <button onclick="document.body.removeChild(document.getElementById('qr-modal'))" style="position:absolute;top:6px;right:8px;font-size:22px;border:none;background:none;">×</button>
+          <div id="qr-img-box" class="text-center mb-2"></div>
+          <div id="qr-status" class="text-center text-info mb-2" style="font-size:0.98em;">请使用网易云音乐App扫码登录</div>
+        </div>
+      </div>`;
+    document.body.appendChild(modal);
+    fetch('/api/qr_key').then(r=>r.json()).then(data=>{
+        let key = data.data.unikey;
+        fetch(`/api/qr_create?key=${key}`).then(r=>r.json()).then(data=>{
+            let qrimg = data.data.qrimg;
+            document.getElementById('qr-img-box').innerHTML = `<img src='${qrimg}' style='width:140px;height:140px;'>`;
+            pollQrStatus(key);
+        });
+    });
+}
+function pollQrStatus(key) {
+    let statusDiv = document.getElementById('qr-status');
+    let timer = setInterval(()=>{
+        fetch(`/api/qr_check?key=${key}`).then(r=>r.json()).then(data=>{
+            if(data.code === 800) {
+                statusDiv.innerText = '二维码已过期，请关闭后重试';
+                clearInterval(timer);
+            } else if(data.code === 801) {
+                statusDiv.innerText = '等待扫码...';
+            } else if(data.code === 802) {
+                statusDiv.innerText = '请在手机上确认登录';
+            } else if(data.code === 803) {
+                statusDiv.innerText = '登录成功！';
+                setTimeout(()=>{ document.body.removeChild(document.getElementById('qr-modal')); location.reload(); }, 1000);
+                clearInterval(timer);
+            }
+        });
+    }, 2000);
+}
+function checkLoginStatus(cb) {
+    fetch('/api/user_account').then(r=>r.json()).then(data=>{
+        if(data.code === 200 && data.profile && data.profile.nickname) {
+            document.getElementById('login-status').innerHTML = `<span class='text-success'>已登录：${data.profile.nickname}</span>`;
+            document.getElementById('qr-login-btn').style.display = 'none';
+            cb && cb(true);
+        } else {
+            document.getElementById('login-status').innerHTML = `<span class='text-danger'>未登录，请先 <a href='#' onclick='showQrLoginModal()'>扫码登录</a></span>`;
+            document.getElementById('qr-login-btn').style.display = '';
+            cb && cb(false);
+        }
+    });
+}
+// ========== 搜索功能 ==========
+document.getElementById('search-form').onsubmit = function(e) {
+    e.preventDefault();
+    let kw = document.getElementById('search-keyword').value.trim();
+    let stype = document.getElementById('search-type').value;
+    if(!kw) { showModal('请输入关键词', 'warning'); return; }
+    let defaultCover = '{{static:img/no-cover.svg}}';
+    fetch(`/api/search_songs?kw=${encodeURIComponent(kw)}`).then(r=>r.json()).then(data=>{
+        let res = document.getElementById('search-result');
+        res.innerHTML = '';
+        if(stype==='1' && data.songs && data.songs.length) {
+            // 分页
+            allSongs = data.songs.map(song => ({...song, cover: song.cover || defaultCover}));
+            renderSongList();
+        } else {
+            allSongs = [];
+            renderSongList();
+            res.innerHTML = '<div class="text-danger">未找到结果</div>';
+        }
+    });
+};
+// ========== 歌单ID/链接直达 ==========
+document.getElementById('fetch-btn').onclick = function() {
+    let val = document.getElementById('playlist-input').value.trim();
+    let pid = extractPlaylistId(val);
+    if(!pid) { showModal('请输入正确的歌单ID或链接','warning'); return; }
+    checkLoginStatus(function(loggedIn){
+        if(!loggedIn) { showQrLoginModal(); return; }
+        allSongs = [];
+        renderSongList();
+        document.getElementById('playlist-info').innerHTML = '加载中...';
+        fetchPlaylistStream(pid, batch => {
+            allSongs.push(...batch);
+            document.getElementById('playlist-info').innerHTML = `<b>已加载${allSongs.length}首歌...</b>`;
+            renderSongList();
+        }).then(error => {
+            if(error && allSongs.length) {
+                // 歌单只加载了一部分，不能显示成完整的歌曲数
+                document.getElementById('playlist-info').innerHTML = `<span class="text-danger">已加载${allSongs.length}首歌，歌单未能完整获取：${error}</span>`;
+                renderQueue();
+                return;
+            }
+            if(!allSongs.length) {
+                document.getElementById('playlist-info').innerHTML = `<span class="text-danger">未获取到歌曲，可能未登录或歌单不存在${error ? '（' + error + '）' : ''}</span>`;
+                queue = [];
+                queuedIds.clear();
+                renderQueue();
+                return;
+            }
+            document.getElementById('playlist-info').innerHTML = `<b>共${allSongs.length}首歌</b>`;
+            renderQueue();
+        });
+    });
+};
+// ========== 歌曲列表（虚拟列表）与队列按钮 ==========
+let songView = new VirtualList(document.getElementById('song-list'), songRow, {
+    onVisible: songs => prefetchHeads(songs.map(song => song.id))
+});
+function songRow(song, i) {
+    let cover = song.al && song.al.picUrl ? song.al.picUrl : (song.cover?song.cover:'');
+    let artists = song.ar ? song.ar.map(a=>a.name).join('/') : (song.artist?song.artist:'');
+    let inQueue = queuedIds.has(String(song.id));
+    return `<div class='song-row row align-items-center'>
+        <div class='col-auto'>${cover?`<img class='cover-img' src='/cover/${song.id}'>`:''}</div>
+        <div class='col'>
+            <b>${i+1}. ${song.name}</b><br>
+            <span class='text-secondary' style='font-size:0.93em;'>${artists}</span>
+        </div>
+        <div class='col-auto d-flex flex-column gap-1'>
+            <button class='btn btn-sm ${inQueue?'btn-danger':'btn-main'} mb-1' onclick='toggleQueue(allSongs[${i}])'>${inQueue?'<i class="bi bi-x-circle btn-icon"></i>移除队列':'<i class="bi bi-plus-circle btn-icon"></i>加入队列'}</button>
+            <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm mb-1" download target="_blank"><i class="bi bi-download btn-icon"></i>下载</a>
+            <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.name,artist:artists,cover:cover})})'><i class="bi bi-play-circle btn-icon"></i>试听</button>
+        </div>
+    </div>`;
+}
+function renderSongList() {
+    songView.setItems(allSongs);
+    document.getElementById('add-all-btn').style.display = allSongs.length ? '' : 'none';
+    document.getElementById('batch-download-btn').style.display = queue.length ? '' : 'none';
+    document.getElementById('remove-all-btn').style.display = queue.length ? '' : 'none';
+}
+// 预取试听开头：把当前可见的歌曲ID告诉服务端，服务端未开启预取时不再发送
+let prefetchedIds = new Set();
+let prefetchDisabled = false;
+function prefetchHeads(ids) {
+    if(prefetchDisabled) return;
+    ids = ids.slice(0, 10).filter(id => id && !prefetchedIds.has(String(id)));
+    if(!ids.length) return;
+    ids.forEach(id => prefetchedIds.add(String(id)));
+    fetch('/api/prefetch', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({ids})})
+        .then(r=>r.json()).then(data=>{ if(!data.enabled) prefetchDisabled = true; }).catch(()=>{});
+}
+function queueSong(song) {
+    return {type:'song', id:song.id, info:{name:song.name,artist:getArtist(song),cover:(song.al && song.al.picUrl) ? song.al.picUrl : (song.cover?song.cover:'')}};
+}
+let queueView = new VirtualList(document.getElementById('queue-list'), queueRow, {
+    onVisible: songs => prefetchHeads(songs.map(song => song.id))
+});
+function queueRow(song, idx) {
+    let cover = song.info && song.info.cover ? song.info.cover : '';
+    let artists = song.info && song.info.artist ? song.info.artist : '';
+    return `<div class="queue-item"><div class="row align-items-center">
+        <div class="col-auto">
+            ${cover?`<img class='cover-img' src='/cover/${song.id}'>`:''}
+        </div>
+        <div class="col">
+            <div class="fw-bold fs-6 mb-1">${song.info.name}</div>
+            <div class="text-secondary small mb-2">${artists}</div>
+            <div class="d-flex gap-2 justify-content-end">
+                <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.info.name,artist:artists,cover:cover})})'><i class="bi bi-play-circle btn-icon"></i>试听</button>
+                <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm" download target="_blank"><i class="bi bi-download btn-icon"></i>下载</a>
+                <button class='btn btn-sm btn-outline-danger' onclick='removeFromQueue(${idx})'><i class="bi bi-x-circle btn-icon"></i>移除</button>
+            </div>
+        </div>
+    </div></div>`;
+}
+function renderQueue() {
+    document.getElementById('queue-section').style.display = queue.length ? '' : 'none';
+    queueView.setItems(queue);
+    document.getElementById('batch-download-btn').style.display = queue.length ? '' : 'none';
+    document.getElementById('remove-all-btn').style.display = queue.length ? '' : 'none';
+}
+function addToQueue(song) {
+    if(!queuedIds.has(String(song.id))) {
+        queue.push(queueSong(song));
+        queuedIds.add(String(song.id));
+        songView.refresh();
+        renderQueue();
+    }
+}
+function removeFromQueue(idx) {
+    queuedIds.delete(String(queue[idx].id));
+    queue.splice(idx, 1);
+    renderSongList();
+    renderQueue();
+}
+function toggleQueue(song) {
+    if(!queuedIds.has(String(song.id))) {
+        queue.push(queueSong(song));
+        queuedIds.add(String(song.id));
+    } else {
+        queue.splice(queue.findIndex(q=>q.id==song.id), 1);
+        queuedIds.delete(String(song.id));
+    }
+    renderSongList();
+    renderQueue();
+}
+document.getElementById('add-all-btn').onclick = function() {
+    // 一次加入全部歌曲后只重绘一次
+    allSongs.forEach(song => {
+        if(!queuedIds.has(String(song.id))) {
+            queue.push(queueSong(song));
+            queuedIds.add(String(song.id));
+        }
+    });
+    renderSongList();
+    renderQueue();
+};
+document.getElementById('remove-all-btn').onclick = function() {
+    if(queue.length>0) {
+        queue = [];
+        queuedIds.clear();
+        renderSongList();
+        renderQueue();
+    }
+};
+document.getElementById('batch-download-btn').onclick = function() {
+    batchSequentialDownload();
+};
+function batchSequentialDownload() {
+    if (queue.length === 0) {
+        showModal('队列为空！','warning');
+        return;
+    }
+    let statusText = document.getElementById('batch-download-status');
+    let i = 0;
+    function downloadNext() {
+        if (i >= queue.length) {
+            statusText.innerText = '全部下载完成！';
+            showModal('全部下载完成！','success');
+            return;
+        }
+        let item = queue[i];
+        statusText.innerText = `正在下载第${i+1}首：${item.info.name}`;
+        let a = document.createElement('a');
+        a.href = `/proxy_download/${item.id}`;
+        a.download = '';
+        a.target = '_blank';
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+        i++;
+        setTimeout(downloadNext, 3000);
+    }
+    downloadNext();
+}
+// ========== 试听弹窗 ==========
+function showPreviewModal(song) {
+    let modal = document.getElementById('preview-modal');
+    modal.innerHTML = `<div class="qr-modal-bg" style="animation:fadeIn 0.3s;">
+      <div class="qr-modal-box modal-content-anim" style="min-width:340px;max-width:95vw;">
+        <button onclick="document.getElementById('preview-modal').innerHTML=''" style="position:absolute;top:8px;right:12px;font-size:22px;border:none;background:none;">×</button>
+        <div class="d-flex align-items-center mb-3">
+          ${song.cover?`<img src='/cover/${song.id}?s=256' style='width:80px;height:80px;border-radius:8px;border:2px solid #f6723a;object-fit:cover;'>`:''}
+          <div class="ms-3">
+            <b style="font-size:1.2em;">${song.name}</b><br>
+            <span class="text-secondary">${song.artist}</span>
+          </div>
+        </div>
+        <audio id="audio-preview" src="/proxy_download/${song.id}?preview=1" controls style="width:100%;"></audio>
+      </div>
+    </div>`;
+}
+// ========== 扫码登录按钮 ==========
+document.getElementById('qr-login-btn').onclick = function() {
+    showQrLoginModal();
+};
+// ========== 初始化 ==========
+checkLoginStatus();
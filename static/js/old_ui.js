@@ -0,0 +1,252 @@
+// 试听弹窗UI
+function showPreviewModal(song) {
+    if(document.getElementById('preview-modal')) document.getElementById('preview-modal').remove();
+    let cover = song.cover || (song.al && song.al.picUrl ? song.al.picUrl : '');
+    let imgHtml = cover ? `<img src="/cover/${song.id}?s=256" style="width:80px;height:80px;border-radius:8px;border:2px solid #0d6efd;object-fit:cover;">` : '';
+    let modal = document.createElement('div');
+    modal.id = 'preview-modal';
+    modal.innerHTML = `
+    <div style="position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.4);z-index:9999;display:flex;align-items:center;justify-content:center;">
+      <div style="background:#fff;border-radius:16px;box-shadow:0 4px 32px #0002;padding:32px 24px;min-width:320px;max-width:90vw;position:relative;">
+        <button onclick="document.getElementById('preview-modal').remove()" style="position:absolute;top:8px;right:12px;font-size:22px;border:none;background:none;">×</button>
+        <div class="d-flex align-items-center mb-3">
+          ${imgHtml}
+          <div class="ms-3">
+            <b style="font-size:1.2em;">${song.name}</b><br>
+            <span class="text-secondary">${song.artist}</span>
+          </div>
+        </div>
+        <audio id="audio-preview" src="/proxy_download/${song.id}?preview=1" controls style="width:100%;"></audio>
+        <div class="mt-2">
+          <input type="range" id="audio-progress" value="0" min="0" max="100" style="width:100%;">
+        </div>
+        <div class="d-flex justify-content-between text-secondary small mt-1">
+          <span id="audio-current">00:00</span>
+          <span id="audio-duration">00:00</span>
+        </div>
+      </div>
+    </div>`;
+    document.body.appendChild(modal);
+    let audio = document.getElementById('audio-preview');
+    let progress = document.getElementById('audio-progress');
+    let current = document.getElementById('audio-current');
+    let duration = document.getElementById('audio-duration');
+    audio.ontimeupdate = function() {
+      if(audio.duration) progress.value = audio.currentTime / audio.duration * 100;
+      current.innerText = formatTime(audio.currentTime);
+      duration.innerText = formatTime(audio.duration);
+    };
+    progress.oninput = function() {
+      if(audio.duration) audio.currentTime = progress.value / 100 * audio.duration;
+    };
+    function formatTime(sec) {
+      if(isNaN(sec)) return '00:00';
+      let m = Math.floor(sec/60), s = Math.floor(sec%60);
+      return (m<10?'0':'')+m+':' + (s<10?'0':'')+s;
+    }
+}
+let queue = [];
+// 预取试听开头：把当前可见的歌曲ID告诉服务端，服务端未开启预取时不再发送
+let prefetchedIds = new Set();
+let prefetchDisabled = false;
+function prefetchHeads(ids) {
+    if(prefetchDisabled) return;
+    ids = ids.slice(0, 10).filter(id => id && !prefetchedIds.has(String(id)));
+    if(!ids.length) return;
+    ids.forEach(id => prefetchedIds.add(String(id)));
+    fetch('/api/prefetch', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({ids})})
+        .then(r=>r.json()).then(data=>{ if(!data.enabled) prefetchDisabled = true; }).catch(()=>{});
+}
+// 队列用虚拟列表渲染，增删时只重绘可见的行
+let queueView = new VirtualList(document.getElementById('queue-list'), queueRow, {
+    onVisible: items => prefetchHeads(items.filter(item => item.type === 'song').map(item => item.id))
+});
+function queueRow(item, idx) {
+    let info = item.info;
+    let cover = info.al && info.al.picUrl ? info.al.picUrl : (info.cover ? info.cover : '');
+    let imgHtml = cover ? `<img class='cover-img' src='${item.type === 'song' ? `/cover/${item.id}` : cover}'>` : '';
+    let html = `${imgHtml}<b>${item.type === 'song' ? '🎵' : '📀'} ${info.name}</b> <span class='text-secondary'>${info.artist||info.creator||''}</span>
+    <button class='btn btn-sm btn-outline-danger float-end ms-2' onclick='removeFromQueue(${idx})'>移除</button>`;
+    if(item.type === 'song' && item.id) {
+        html += ` <a href="/proxy_download/${item.id}" class="btn btn-success btn-sm float-end" style="margin-right:8px;" download><svg xmlns='http://www.w3.org/2000/svg' width='16' height='16' fill='currentColor' class='bi bi-download' viewBox='0 0 16 16'><path d='M.5 9.9a.5.5 0 0 1 .5.5v2.5A1.5 1.5 0 0 0 2.5 14h11a1.5 1.5 0 0 0 1.5-1.5V10.4a.5.5 0 0 1 1 0v2.1A2.5 2.5 0 0 1 13.5 15h-11A2.5 2.5 0 0 1 0 12.5V10.4a.5.5 0 0 1 .5-.5z'/><path d='M7.646 11.854a.5.5 0 0 0 .708 0l3-3a.5.5 0 0 0-.708-.708L8.5 10.293V1.5a.5.5 0 0 0-1 0v8.793L5.354 8.146a.5.5 0 1 0-.708.708l3 3z'/></svg> 下载</a>`;
+        html += ` <button class="btn btn-info btn-sm float-end" style="margin-right:8px;" onclick='showPreviewModal(${JSON.stringify({id:item.id,name:info.name,artist:info.artist,cover:cover})})'>试听</button>`;
+    }
+    return `<div class="queue-item">${html}</div>`;
+}
+function renderQueue() {
+    queueView.setItems(queue);
+}
+function removeFromQueue(idx) {
+    queue.splice(idx, 1);
+    renderQueue();
+}
+document.getElementById('search-form').onsubmit = function(e) {
+    e.preventDefault();
+    let kw = document.getElementById('search-keyword').value.trim();
+    let stype = document.getElementById('search-type').value;
+    if(!kw) return;
+    let defaultCover = '{{static:img/no-cover.svg}}';
+    let url = stype==='1' ? `/api/search_songs?kw=${encodeURIComponent(kw)}` : `/search?kw=${encodeURIComponent(kw)}&stype=${stype}`;
+    fetch(url).then(r=>r.json()).then(data=>{
+        let res = document.getElementById('search-result');
+        res.innerHTML = '';
+        if(stype==='1' && data.songs && data.songs.length) {
+            // 先拼好全部结果再一次写入 DOM
+            res.innerHTML = data.songs.map(song => {
+                let cover = song.cover || defaultCover;
+                let btnId = `add-btn-${song.id}`;
+                let imgHtml = `<img class='cover-img' src='${song.cover ? `/cover/${song.id}` : cover}'>`;
+                let html = `<div class='song-card row align-items-center'>
+                    <div class='col-auto'>${imgHtml}</div>
+                    <div class='col'>
+                        <b>${song.name}</b><br>
+                        <span class='text-secondary'>${song.artist}</span><br>
+                        <span class='text-secondary'>${song.album}</span>
+                    </div>
+                    <div class='col-auto d-flex flex-column gap-2'>
+                        <button id='${btnId}' class='btn btn-primary mb-1' onclick='addToQueueUI(this, "song", "${song.id}", ${JSON.stringify({name:song.name,artist:song.artist,cover:cover})})'>加入队列</button>
+                        <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm" target="_blank">下载</a>
+                        <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.name,artist:song.artist,cover:cover})})'>试听</button>
+                    </div>
+                </div>`;
+                return html;
+            }).join('');
+            prefetchHeads(data.songs.map(song => song.id));
+        } else if(stype==='1000' && data.result && data.result.playlists) {
+            res.innerHTML = data.result.playlists.map(pl=>{
+                let cover = pl.coverImgUrl ? pl.coverImgUrl : defaultCover;
+                let html = `<div class='playlist-card row align-items-center'>
+                    <div class='col-auto'><img class='cover-img' src='${cover}'></div>
+                    <div class='col'>
+                        <b>${pl.name}</b><br>
+                        <span class='text-secondary'>by ${pl.creator.nickname}</span><br>
+                        <span class='text-secondary'>${pl.trackCount} 首歌</span>
+                    </div>
+                    <div class='col-auto'>
+                        <button class='btn btn-primary' onclick='fetchPlaylistSongs(${pl.id})'>查看歌单详情</button>
+                    </div>
+                </div>
+                <div id='playlist-detail-${pl.id}'></div>`;
+                return html;
+            }).join('');
+        } else {
+            res.innerHTML = '<div class="text-danger">未找到结果</div>';
+        }
+    });
+};
+function addToQueueUI(btn, type, id, info) {
+    queue.push({type, id, info});
+    renderQueue();
+    btn.classList.remove('btn-primary');
+    btn.classList.add('btn-danger');
+    btn.innerText = '已加入队列';
+    btn.disabled = true;
+}
+document.getElementById('start-btn').onclick = function() {
+    if(queue.length===0) return alert('请先添加任务到队列！');
+    fetch('/start', {
+        method: 'POST',
+        headers: {'Content-Type':'application/json'},
+        body: JSON.stringify({queue})
+    }).then(r=>r.json()).then(data=>{
+        updateStatus();
+    });
+};
+function updateStatus() {
+    fetch('/status').then(r=>r.json()).then(data=>{
+        let bar = document.getElementById('progress-bar');
+        let text = document.getElementById('status-text');
+        // 有预检得到的总字节数时按字节计算进度，否则按歌曲数
+        let percent = data.bytes_total ? Math.floor(data.bytes_done * 100 / data.bytes_total)
+            : (data.total ? Math.floor(data.current * 100 / data.total) : 0);
+        bar.style.width = percent + '%';
+        bar.innerText = percent + '%';
+        let eta = '';
+        if(data.bytes_total) {
+            eta = `  ${(data.bytes_done/1048576).toFixed(1)}/${(data.bytes_total/1048576).toFixed(1)} MB`;
+            if(data.eta_seconds != null) eta += `  剩余约 ${Math.floor(data.eta_seconds/60)}分${data.eta_seconds%60}秒`;
+        }
+        text.innerText = data.status === 'downloading' ? `下载中：${data.current}/${data.total}${eta}  ${data.msg}` : data.msg;
+        if(data.status === 'done') {
+            bar.classList.add('bg-success');
+        } else if(data.status === 'error') {
+            bar.classList.add('bg-danger');
+        } else {
+            bar.classList.remove('bg-success','bg-danger');
+        }
+        // 当前歌曲/歌单信息
+        let now = data.now;
+        let nowinfo = document.getElementById('now-info');
+        if(now && now.album && now.album.picUrl) {
+            let cover = now.album.picUrl ? now.album.picUrl : null;
+            let imgHtml = cover ? `<img class='cover-img me-3' src='${cover}'>` : '';
+            nowinfo.innerHTML = `${imgHtml}<b>${now.name}</b> <span class='text-secondary'>${now.artists.map(a=>a.name).join('/')}</span>`;
+        } else if(now && now.coverImgUrl) {
+            let cover = now.coverImgUrl ? now.coverImgUrl : null;
+            let imgHtml = cover ? `<img class='cover-img me-3' src='${cover}'>` : '';
+            nowinfo.innerHTML = `${imgHtml}<b>${now.name}</b>`;
+        } else {
+            nowinfo.innerHTML = '';
+        }
+    });
+}
+setInterval(updateStatus, 2000);
+updateStatus();
+renderQueue();
+
+function batchSequentialDownload() {
+    if (queue.length === 0) {
+        alert('队列为空！');
+        return;
+    }
+    let statusText = document.getElementById('batch-download-status');
+    let i = 0;
+    function downloadNext() {
+        if (i >= queue.length) {
+            statusText.innerText = '全部下载完成！';
+            return;
+        }
+        let item = queue[i];
+        if (item.type === 'song' && item.id) {
+            statusText.innerText = `正在下载第${i+1}首：${item.info.name}`;
+            // 创建临时a标签并点击
+            let a = document.createElement('a');
+            a.href = `/proxy_download/${item.id}`;
+            a.download = '';
+            a.target = '_blank';
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+        }
+        i++;
+        setTimeout(downloadNext, 3000); // 3秒后下载下一个
+    }
+    downloadNext();
+}
+
+// ========== 补充：获取歌单全部歌曲 ==========
+function fetchPlaylistSongs(pid) {
+    checkLoginStatus(function(loggedIn){
+        if(!loggedIn) { showQrLoginModal(); return; }
+        fetch(`/api/playlist_tracks?id=${pid}&limit=1000`)
+          .then(r => r.json())
+          .then(data => {
+              if(!data.songs || !data.songs.length) {
+                  document.getElementById('playlist-info').innerHTML = '<span class="text-danger">未获取到歌曲，可能未登录或歌单不存在</span>';
+                  document.getElementById('song-list').innerHTML = '';
+                  allSongs = [];
+                  queue = [];
+                  renderQueue();
+                  renderSongPagination();
+                  return;
+              }
+              document.getElementById('playlist-info').innerHTML = `<b>共${data.songs.length}首歌</b>`;
+              allSongs = data.songs;
+              currentPage = 1;
+              renderSongList();
+              renderQueue();
+              renderSongPagination();
+          });
+    });
+}
+window.fetchPlaylistSongs = fetchPlaylistSongs;
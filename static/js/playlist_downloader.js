@@ -0,0 +1,293 @@
+let allSongs = [];
+let queue = [];
+let queuedIds = new Set();  // 队列中的歌曲ID，渲染每一行时判断是否已加入
+function extractPlaylistId(input) {
+    let match = input.match(/playlist\?id=(\d+)/);
+    if (match) return match[1];
+    if (/^\d+$/.test(input)) return input;
+    return null;
+}
+function fetchPlaylistStream(pid, onBatch) {
+    // 流式读取 NDJSON，每收到一批歌曲就回调一次
+    // 返回的 Promise 在读完时得到 null；服务端中途出错（发送 {"error": ...} 行）或连接失败时得到错误信息，此前的歌曲已回调
+    return fetch(`/api/playlist_tracks?id=${pid}&stream=1&fields=id,name,ar.name,al.picUrl`).then(r => {
+        if (!r.ok) return `HTTP ${r.status}`;
+        let reader = r.body.getReader();
+        let decoder = new TextDecoder();
+        let buf = '';
+        function pump() {
+            return reader.read().then(({done, value}) => {
+                if (done) return null;
+                buf += decoder.decode(value, {stream: true});
+                let lines = buf.split('\n');
+                buf = lines.pop();
+                let batch = [];
+                for (let line of lines.filter(l => l)) {
+                    let song = JSON.parse(line);
+                    if (song.error) {
+                        if (batch.length) onBatch(batch);
+                        reader.cancel();
+                        return song.error;
+                    }
+                    batch.push(song);
+                }
+                if (batch.length) onBatch(batch);
+                return pump();
+            });
+        }
+        return pump();
+    }).catch(e => e.message || String(e));
+}
+function showQrLoginModal() {
+    let modal = document.getElementById('qr-modal');
+    modal.style.display = '';
+    modal.innerHTML = `<div class='qr-modal-bg'><div class='qr-modal-box'><div id='qr-img-box' class='text-center mb-2'></div><div id='qr-status' class='text-center text-info mb-2'>请使用网易云音乐App扫码登录</div><button class='btn btn-sm btn-outline-secondary' onclick='closeQrModal()' style='position:absolute;top:8px;right:12px;'>关闭</button></div></div>`;
+    fetch('/api/qr_key').then(r=>r.json()).then(data=>{
+        let key = data.data.unikey;
+        fetch(`/api/qr_create?key=${key}`).then(r=>r.json()).then(data=>{
+            let qrimg = data.data.qrimg;
+            document.getElementById('qr-img-box').innerHTML = `<img src='${qrimg}' style='width:180px;height:180px;'>`;
+            pollQrStatus(key);
+        });
+    });
+}
+function closeQrModal() {
+    document.getElementById('qr-modal').style.display = 'none';
+}
+function pollQrStatus(key) {
+    let statusDiv = document.getElementById('qr-status');
+    let timer = setInterval(()=>{
+        fetch(`/api/qr_check?key=${key}`).then(r=>r.json()).then(data=>{
+            if(data.code === 800) {
+                statusDiv.innerText = '二维码已过期，请关闭后重试';
+                clearInterval(timer);
+            } else if(data.code === 801) {
+                statusDiv.innerText = '等待扫码...';
+            } else if(data.code === 802) {
+                statusDiv.innerText = '请在手机上确认登录';
+            } else if(data.code === 803) {
+                statusDiv.innerText = '登录成功！';
+                setTimeout(()=>{ closeQrModal(); location.reload(); }, 1000);
+                clearInterval(timer);
+            }
+        });
+    }, 2000);
+}
+function checkLoginStatus(cb) {
+    fetch('/api/user_account').then(r=>r.json()).then(data=>{
+        if(data.code === 200 && data.profile && data.profile.nickname) {
+            document.getElementById('login-status').innerText = `已登录：${data.profile.nickname}`;
+            cb && cb(true);
+        } else {
+            document.getElementById('login-status').innerHTML = `<span class='text-danger'>未登录，请先 <a href='#' onclick='showQrLoginModal()'>扫码登录</a></span>`;
+            cb && cb(false);
+        }
+    });
+}
+let songView = new VirtualList(document.getElementById('song-list'), songRow, {
+    onVisible: songs => prefetchHeads(songs.map(song => song.id))
+});
+function songRow(song, idx) {
+    let cover = song.al && song.al.picUrl ? song.al.picUrl : '';
+    let artists = song.ar ? song.ar.map(a=>a.name).join('/') : '';
+    let inQueue = queuedIds.has(song.id);
+    return `<div class='song-row row align-items-center'>
+        <div class='col-auto'>${cover?`<img class='cover-img' src='/cover/${song.id}'>`:''}</div>
+        <div class='col'>
+            <b>${idx+1}. ${song.name}</b><br>
+            <span class='text-secondary'>${artists}</span>
+        </div>
+        <div class='col-auto d-flex flex-column gap-2'>
+            <button class='btn btn-${inQueue?'danger':'primary'} btn-sm mb-1' onclick='toggleQueue(allSongs[${idx}])'>${inQueue?'移除队列':'加入队列'}</button>
+            <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm mb-1" download target="_blank">下载</a>
+            <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.name,artist:artists,cover:cover})})'>试听</button>
+        </div>
+    </div>`;
+}
+function renderSongList() {
+    songView.setItems(allSongs);
+    // 控制分隔线和队列区显示
+    document.getElementById('divider-line').style.display = allSongs.length ? '' : 'none';
+    document.getElementById('queue-section').style.display = allSongs.length ? '' : 'none';
+    // 全部加入队列按钮逻辑
+    let allInQueue = allSongs.length > 0 && allSongs.every(song => queuedIds.has(song.id));
+    let addAllBtn = document.getElementById('add-all-btn');
+    addAllBtn.style.display = allSongs.length ? '' : 'none';
+    addAllBtn.disabled = allInQueue;
+    addAllBtn.innerText = allInQueue ? '已全部加入' : '全部加入队列';
+}
+// 预取试听开头：把当前可见的歌曲ID告诉服务端，服务端未开启预取时不再发送
+let prefetchedIds = new Set();
+let prefetchDisabled = false;
+function prefetchHeads(ids) {
+    if(prefetchDisabled) return;
+    ids = ids.slice(0, 10).filter(id => id && !prefetchedIds.has(String(id)));
+    if(!ids.length) return;
+    ids.forEach(id => prefetchedIds.add(String(id)));
+    fetch('/api/prefetch', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({ids})})
+        .then(r=>r.json()).then(data=>{ if(!data.enabled) prefetchDisabled = true; }).catch(()=>{});
+}
+let queueView = new VirtualList(document.getElementById('queue-list'), queueRow, {
+    onVisible: songs => prefetchHeads(songs.map(song => song.id))
+});
+function queueRow(song, idx) {
+    let cover = song.al && song.al.picUrl ? song.al.picUrl : '';
+    let artists = song.ar ? song.ar.map(a=>a.name).join('/') : '';
+    return `<div class="queue-item"><div class="row align-items-center">
+        <div class="col-auto">
+            ${cover?`<img class='cover-img' src='/cover/${song.id}'>`:''}
+        </div>
+        <div class="col">
+            <div class="fw-bold fs-6 mb-1">${song.name}</div>
+            <div class="text-secondary small mb-2">${artists}</div>
+            <div class="d-flex gap-2 justify-content-end">
+                <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.name,artist:artists,cover:cover})})'>试听</button>
+                <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm" download target="_blank">下载</a>
+                <button class='btn btn-sm btn-outline-danger' onclick='removeFromQueue(${idx})'>移除</button>
+            </div>
+        </div>
+    </div></div>`;
+}
+function renderQueue() {
+    queueView.setItems(queue);
+    document.getElementById('batch-download-btn').style.display = queue.length ? '' : 'none';
+}
+function addToQueue(song) {
+    if(!queuedIds.has(song.id)) {
+        queue.push(song);
+        queuedIds.add(song.id);
+        songView.refresh();
+        renderQueue();
+    }
+}
+function removeFromQueue(idx) {
+    queuedIds.delete(queue[idx].id);
+    queue.splice(idx, 1);
+    renderSongList();
+    renderQueue();
+}
+function toggleQueue(song) {
+    if(!queuedIds.has(song.id)) {
+        queue.push(song);
+        queuedIds.add(song.id);
+    } else {
+        queue.splice(queue.findIndex(q=>q.id===song.id), 1);
+        queuedIds.delete(song.id);
+    }
+    renderSongList();
+    renderQueue();
+}
+document.getElementById('add-all-btn').onclick = function() {
+    // 一次加入全部歌曲后只重绘一次
+    allSongs.forEach(song => {
+        if(!queuedIds.has(song.id)) {
+            queue.push(song);
+            queuedIds.add(song.id);
+        }
+    });
+    renderSongList();
+    renderQueue();
+};
+document.getElementById('batch-download-btn').onclick = function() {
+    batchSequentialDownload();
+};
+function batchSequentialDownload() {
+    if (queue.length === 0) {
+        alert('队列为空！');
+        return;
+    }
+    let statusText = document.getElementById('batch-download-status');
+    let i = 0;
+    function downloadNext() {
+        if (i >= queue.length) {
+            statusText.innerText = '全部下载完成！';
+            return;
+        }
+        let item = queue[i];
+        statusText.innerText = `正在下载第${i+1}首：${item.name}`;
+        let a = document.createElement('a');
+        a.href = `/proxy_download/${item.id}`;
+        a.download = '';
+        a.target = '_blank';
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+        i++;
+        setTimeout(downloadNext, 3000);
+    }
+    downloadNext();
+}
+function showPreviewModal(song) {
+    let modal = document.getElementById('preview-modal');
+    modal.innerHTML = `<div style="position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.4);z-index:9999;display:flex;align-items:center;justify-content:center;">
+      <div style="background:#fff;border-radius:16px;box-shadow:0 4px 32px #0002;padding:32px 24px;min-width:320px;max-width:90vw;position:relative;">
+        <button onclick="document.getElementById('preview-modal').innerHTML=''" style="position:absolute;top:8px;right:12px;font-size:22px;border:none;background:none;">×</button>
+        <div class="d-flex align-items-center mb-3">
+          ${song.cover?`<img src='/cover/${song.id}?s=256' style='width:80px;height:80px;border-radius:8px;border:2px solid #0d6efd;object-fit:cover;'>`:''}
+          <div class="ms-3">
+            <b style="font-size:1.2em;">${song.name}</b><br>
+            <span class="text-secondary">${song.artist}</span>
+          </div>
+        </div>
+        <audio id="audio-preview" src="/proxy_download/${song.id}?preview=1" controls style="width:100%;"></audio>
+      </div>
+    </div>`;
+}
+document.getElementById('fetch-btn').onclick = function() {
+    let val = document.getElementById('playlist-input').value.trim();
+    let pid = extractPlaylistId(val);
+    if(!pid) { alert('请输入正确的歌单ID或链接'); return; }
+    checkLoginStatus(function(loggedIn){
+        if(!loggedIn) { showQrLoginModal(); return; }
+        allSongs = [];
+        queue = [];
+        queuedIds.clear();
+        renderSongList();
+        document.getElementById('playlist-info').innerHTML = '加载中...';
+        fetchPlaylistStream(pid, batch => {
+            allSongs.push(...batch);
+            document.getElementById('playlist-info').innerHTML = `<b>已加载${allSongs.length}首歌...</b>`;
+            renderSongList();
+        }).then(error => {
+            if(error && allSongs.length) {
+                // 歌单只加载了一部分，不能显示成完整的歌曲数
+                document.getElementById('playlist-info').innerHTML = `<span class="text-danger">已加载${allSongs.length}首歌，歌单未能完整获取：${error}</span>`;
+                renderQueue();
+                return;
+            }
+            if(!allSongs.length) {
+                document.getElementById('playlist-info').innerHTML = `<span class="text-danger">未获取到歌曲，可能未登录或歌单不存在${error ? '（' + error + '）' : ''}</span>`;
+                renderQueue();
+                return;
+            }
+            document.getElementById('playlist-info').innerHTML = `<b>共${allSongs.length}首歌</b>`;
+            renderQueue();
+        });
+    });
+};
+checkLoginStatus();
+
+// ========== 补充：获取歌单全部歌曲 ==========
+function fetchPlaylistSongs(pid) {
+    checkLoginStatus(function(loggedIn){
+        if(!loggedIn) { showQrLoginModal(); return; }
+        fetch(`/api/playlist_tracks?id=${pid}&limit=1000`)
+          .then(r => r.json())
+          .then(data => {
+              if(!data.songs || !data.songs.length) {
+                  document.getElementById('playlist-info').innerHTML = '<span class="text-danger">未获取到歌曲，可能未登录或歌单不存在</span>';
+                  allSongs = [];
+                  queue = [];
+                  queuedIds.clear();
+                  renderSongList();
+                  renderQueue();
+                  return;
+              }
+              document.getElementById('playlist-info').innerHTML = `<b>共${data.songs.length}首歌</b>`;
+              allSongs = data.songs;
+              renderSongList();
+              renderQueue();
+          });
+    });
+}
+window.fetchPlaylistSongs = fetchPlaylistSongs;
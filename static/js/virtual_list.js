@@ -0,0 +1,65 @@
+// 虚拟列表：只把可见区域附近的行放进 DOM，滚动时在下一帧按需重绘，上万行也不卡
+// container 需限制高度并可滚动；renderRow(item, index) 返回一行的 HTML；行高取第一行的实际高度
+class VirtualList {
+    constructor(container, renderRow, options = {}) {
+        this.container = container;
+        this.renderRow = renderRow;
+        this.rowHeight = options.rowHeight || 0;
+        this.overscan = options.overscan || 6;
+        this.onVisible = options.onVisible || null;
+        this.items = [];
+        this.first = -1;
+        this.last = -1;
+        this.frame = 0;
+        this.spacer = document.createElement('div');
+        this.spacer.style.position = 'relative';
+        this.content = document.createElement('div');
+        this.content.style.cssText = 'position:absolute;top:0;left:0;right:0;';
+        this.spacer.appendChild(this.content);
+        container.innerHTML = '';
+        container.appendChild(this.spacer);
+        container.addEventListener('scroll', () => this.schedule(), {passive: true});
+        window.addEventListener('resize', () => this.refresh());
+    }
+    // 设置数据（同一个数组追加元素后也调用），多次调用在下一帧合并为一次重绘
+    setItems(items) {
+        this.items = items;
+        this.refresh();
+    }
+    // 数据内容变化（如是否已在队列中）时重绘可见的行
+    refresh() {
+        this.first = -1;
+        this.schedule();
+    }
+    schedule() {
+        if(this.frame) return;
+        this.frame = requestAnimationFrame(() => { this.frame = 0; this.render(); });
+    }
+    render() {
+        let total = this.items.length;
+        let height = this.rowHeight || 60;
+        let top = this.container.scrollTop;
+        let view = this.container.clientHeight || window.innerHeight;
+        let first = Math.max(0, Math.floor(top / height) - this.overscan);
+        let last = Math.min(total, Math.ceil((top + view) / height) + this.overscan);
+        this.spacer.style.height = (total * height) + 'px';
+        if(first === this.first && last === this.last) return;
+        this.first = first;
+        this.last = last;
+        let rowStyle = this.rowHeight ? `height:${height}px;overflow:hidden;` : '';
+        let rows = [];
+        for(let i = first; i < last; i++) {
+            rows.push(`<div style="display:flow-root;${rowStyle}">${this.renderRow(this.items[i], i)}</div>`);
+        }
+        this.content.style.transform = `translateY(${first * height}px)`;
+        this.content.innerHTML = rows.join('');
+        if(!this.rowHeight && this.content.firstElementChild && this.content.firstElementChild.offsetHeight) {
+            // 第一次渲染出可见的行后按实际高度确定行高，再按新行高重绘
+            this.rowHeight = this.content.firstElementChild.offsetHeight;
+            this.first = -1;
+            this.render();
+            return;
+        }
+        if(this.onVisible && last > first) this.onVisible(this.items.slice(first, last));
+    }
+}
@@ -0,0 +1,154 @@
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import requests
+try:
+    import brotli  # 可选依赖，未安装时只提供 gzip
+except ImportError:
+    brotli = None
+
+STATIC_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STATIC_PREFIX = '/static/'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# 第三方前端资源：运行 python static_assets.py --vendor 下载到 static/vendor 后由本机提供（可离线使用），
+# 没有下载时页面仍使用下面的 CDN 地址
+VENDOR_ASSETS = {
+    'vendor/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/bootstrap-icons.css',
+    'vendor/fonts/bootstrap-icons.woff2': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/fonts/bootstrap-icons.woff2',
+    'vendor/fonts/bootstrap-icons.woff': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/fonts/bootstrap-icons.woff',
+}
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt')
+# 页面和 CSS/JS 中引用资源的写法：{{static:css/new_ui.css}}
+STATIC_MARKER = re.compile(r'\{\{static:([^}]+)\}\}')
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+class StaticAsset:
+    """一个静态文件：内容、按内容生成的 ETag 和预先压缩好的编码，接口与 PrecompressedPage 相同"""
+    def __init__(self, name, body):
+        self.name = name
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or name.endswith(('.js', '.svg')):
+            self.content_type += '; charset=utf-8'
+        self.encoded = {}
+        if name.endswith(COMPRESSIBLE) and len(body) >= 1024:
+            self.encoded['gzip'] = gzip.compress(body, 9)
+            if brotli is not None:
+                self.encoded['br'] = brotli.compress(body, quality=11)
+
+    @property
+    def hashed_name(self):
+        """带内容指纹的文件名，如 js/new_ui.1a2b3c4d5e.js；内容变化后地址随之变化，浏览器可以永久缓存"""
+        base, ext = posixpath.splitext(self.name)
+        return f'{base}.{self.etag[:10]}{ext}'
+
+class StaticAssets:
+    """
+    启动时读取 static 目录下的全部文件，生成带指纹的地址
+    CSS 中 url() 引用的本地文件和 CSS/JS 中的 {{static:...}} 会替换为带指纹的地址，
+    因此被引用的文件先处理（图片、字体等 -> CSS -> JS）
+    """
+    def __init__(self, root=STATIC_ROOT):
+        self.root = root
+        self.assets = {}
+        self.hashed = {}
+        names = []
+        if os.path.isdir(root):
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    names.append(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/'))
+        order = {'.css': 1, '.js': 2}
+        for name in sorted(names, key=lambda n: (order.get(posixpath.splitext(n)[1], 0), n)):
+            with open(os.path.join(root, name), 'rb') as f:
+                body = f.read()
+            if name.endswith('.css'):
+                body = self._rewrite_css(name, body.decode('utf-8')).encode('utf-8')
+            if name.endswith(('.css', '.js')):
+                body = self.render(body.decode('utf-8')).encode('utf-8')
+            asset = StaticAsset(name, body)
+            self.assets[name] = asset
+            self.hashed[asset.hashed_name] = asset
+
+    def _rewrite_css(self, name, css):
+        def replace(match):
+            ref = match.group(2).strip()
+            if ref.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+                return match.group(0)
+            path, _, fragment = ref.partition('#')
+            path = path.split('?', 1)[0]
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(name), path))
+            if target not in self.assets:
+                return match.group(0)
+            return f'url("{self.url(target)}{"#" + fragment if fragment else ""}")'
+        return CSS_URL.sub(replace, css)
+
+    def url(self, name):
+        """
+        :param name: static 目录下的相对路径
+        :return: 带指纹的地址；第三方资源没有下载到本地时返回 CDN 地址
+        """
+        asset = self.assets.get(name)
+        if asset is not None:
+            return STATIC_PREFIX + asset.hashed_name
+        if name in VENDOR_ASSETS:
+            return VENDOR_ASSETS[name]
+        raise KeyError(f'静态文件不存在: {name}')
+
+    def render(self, text):
+        """把文本中的 {{static:...}} 替换为资源地址"""
+        return STATIC_MARKER.sub(lambda m: self.url(m.group(1).strip()), text)
+
+    def lookup(self, filename):
+        """
+        :param filename: /static/ 之后的路径
+        :return: (资源, 是否为带指纹的地址)，找不到时资源为 None
+        """
+        asset = self.hashed.get(filename)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(filename), False
+
+    def using_cdn(self):
+        """:return: 还没有下载到本地、仍从 CDN 加载的第三方资源"""
+        return [name for name in VENDOR_ASSETS if name not in self.assets]
+
+def vendor(root=STATIC_ROOT, force=False):
+    """下载 VENDOR_ASSETS 到 static 目录，已存在的文件跳过"""
+    for name, url in VENDOR_ASSETS.items():
+        path = os.path.join(root, *name.split('/'))
+        if os.path.exists(path) and not force:
+            print(f'已存在: {name}')
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        resp = requests.get(url, timeout=30)
+        resp.raise_for_status()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(resp.content)
+        os.replace(tmp_path, path)
+        print(f'已下载: {name} ({len(resp.content)} 字节)')
+
+def main():
+    parser = argparse.ArgumentParser(description='网页端静态资源')
+    parser.add_argument('--vendor', action='store_true', help='下载 Bootstrap 等第三方资源到 static/vendor，之后页面不再依赖 CDN')
+    parser.add_argument('--force', action='store_true', help='与 --vendor 一起使用，重新下载已存在的文件')
+    args = parser.parse_args()
+    if args.vendor:
+        vendor(force=args.force)
+    assets = StaticAssets()
+    for name in sorted(assets.assets):
+        print(f'{STATIC_PREFIX}{assets.assets[name].hashed_name}')
+    for name in assets.using_cdn():
+        print(f'{name}: 未下载，使用 {VENDOR_ASSETS[name]}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# web_downloader 导入时会在当前目录创建 Music_DownLoad、jobs.db、cache 等，测试在临时目录中进行
+os.chdir(tempfile.mkdtemp(prefix='netease-tests-'))
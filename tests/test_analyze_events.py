@@ -0,0 +1,62 @@
+import json
+
+from analyze_events import load_events, percentile, summarize, track_timelines
+from job_events import EventLog
+
+
+def track_events(song_id, queued, resolved, finished, **fields):
+    event = 'track_failed' if fields.get('outcome') == 'failed' else 'track_done'
+    return [
+        {'ts': queued, 'run': 'r1', 'job': 1, 'event': 'track_queued', 'song_id': song_id},
+        {'ts': resolved, 'run': 'r1', 'job': 1, 'event': 'track_resolved', 'song_id': song_id, 'has_url': True},
+        dict({'ts': finished, 'run': 'r1', 'job': 1, 'event': event, 'song_id': song_id}, **fields),
+    ]
+
+
+def sample():
+    return (track_events(1, 0, 1, 5, outcome='downloaded', bytes=1024 * 1024, duration_ms=4000, first_byte_ms=50)
+            + track_events(2, 0, 2, 12, outcome='downloaded', bytes=3 * 1024 * 1024, duration_ms=9000)
+            + track_events(3, 0, 3, 4, outcome='failed', error='HTTPError', duration_ms=100))
+
+
+def test_track_timelines_merge_events():
+    tracks = track_timelines(sample())
+    assert tracks[('r1', 1, 1)]['queued'] == 0 and tracks[('r1', 1, 1)]['resolved'] == 1
+    assert tracks[('r1', 1, 3)]['outcome'] == 'failed' and tracks[('r1', 1, 3)]['finished'] == 4
+
+
+def test_summarize_reports_throughput_slowest_and_failures():
+    report = summarize(sample(), bucket=10, top=2)
+    lines = report.splitlines()
+    assert lines[0].startswith('歌曲 3 首，用时 12.0 秒')
+    assert '共 4.0 MB' in lines[0]
+    assert lines[1] == '结果：downloaded 2，failed 1'
+    slowest = lines[lines.index('最慢的 2 首：') + 1:][:2]
+    assert [line.split()[0] for line in slowest] == ['2', '1']
+    assert 'HTTPError' in report.split('失败/跳过原因：')[1]
+    # 0~10 秒完成 2 首，10~20 秒完成 1 首
+    start = lines.index('吞吐（每 10 秒）：') + 1
+    assert [line.split()[:2] for line in lines[start:start + 2]] == [['0s', '2'], ['10s', '1']]
+
+
+def test_summarize_without_finished_tracks():
+    assert summarize([]) == '没有已完成的歌曲事件'
+
+
+def test_percentile():
+    assert percentile([], 50) == 0
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(range(100), 99) == 99
+
+
+def test_load_events_filters_and_skips_bad_lines(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    log = EventLog(str(path), run_id='r1')
+    log.bind(job=7).emit('track_done', song_id=1)
+    log.emit('job_started')
+    log.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('not json\n')
+        f.write(json.dumps({'ts': 0, 'run': 'r2', 'event': 'x', 'job': 7}) + '\n')
+    assert [e['event'] for e in load_events(str(path))] == ['x', 'track_done', 'job_started']
+    assert [e['song_id'] for e in load_events(str(path), run='r1', job='7')] == [1]
@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+import asgi_app
+import web_downloader as wd
+
+
+def run_request(path, method='GET', body=b'', headers=()):
+    """用 ASGI 协议调用 asgi_app.app，返回 (状态码, 响应头, 响应体)"""
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+             'headers': [(key.encode(), value.encode()) for key, value in headers],
+             'server': ('127.0.0.1', 5000), 'client': ('127.0.0.1', 1234), 'scheme': 'http',
+             'http_version': '1.1', 'root_path': ''}
+    sent = []
+
+    async def main():
+        done = asyncio.Event()
+        requested = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi_app.app(scope, receive, send)
+        done.set()
+
+    asyncio.run(main())
+    start = sent[0]
+    headers = {key.decode(): value.decode() for key, value in start['headers']}
+    return start['status'], headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+@pytest.fixture
+def no_lifespan(monkeypatch):
+    # 不发 lifespan 事件，相当于 uvicorn --lifespan off
+    monkeypatch.setattr(asgi_app, 'stream_slots', None)
+    monkeypatch.setattr(asgi_app, 'client', None)
+    started = []
+    monkeypatch.setattr(wd, 'lease_watch_pid', None)
+    monkeypatch.setattr(wd, 'start_background_jobs', lambda: started.append(True))
+    return started
+
+
+def test_lifespan_startup_and_shutdown(no_lifespan):
+    async def main():
+        messages = asyncio.Queue()
+        sent = []
+        await messages.put({'type': 'lifespan.startup'})
+        await messages.put({'type': 'lifespan.shutdown'})
+
+        async def send(message):
+            sent.append(message['type'])
+        await asgi_app.app({'type': 'lifespan'}, messages.get, send)
+        return sent
+
+    assert asyncio.run(main()) == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert asgi_app.stream_slots is not None
+    assert no_lifespan == [True]
+
+
+def test_metadata_route_served_natively(no_lifespan, monkeypatch):
+    monkeypatch.setattr(wd, 'get_song_details', lambda ids: [{'id': sid, 'name': f'歌曲{sid}'} for sid in ids])
+    status, headers, body = run_request('/api/song_detail?ids=1,2')
+    assert status == 200 and headers['content-type'] == 'application/json'
+    assert [song['id'] for song in json.loads(body)['songs']] == [1, 2]
+    # 关闭 lifespan 时由第一个请求继续未完成的任务
+    assert no_lifespan == [True]
+
+
+def test_other_routes_fall_back_to_flask(no_lifespan):
+    status, headers, body = run_request('/status')
+    assert status == 200 and 'server-timing' in headers
+    assert 'queued' in json.loads(body)
+
+
+def test_proxy_without_lifespan_creates_slots(no_lifespan, monkeypatch):
+    monkeypatch.setattr(wd, 'cached_song_url', lambda song_id, levels, refresh=False: None)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app.proxy_download({'type': 'http', 'headers': []}, None, send, {}, '1'))
+    assert sent[0]['status'] == 404
+    assert asgi_app.stream_slots is not None
+
+
+def test_proxy_rejects_when_slots_exhausted(no_lifespan, monkeypatch):
+    monkeypatch.setattr(asgi_app, 'MAX_STREAMS', 0)
+    rejected = asgi_app.stream_stats['rejected']
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app.proxy_download({'type': 'http', 'headers': []}, None, send, {}, '1'))
+    assert sent[0]['status'] == 503
+    assert asgi_app.stream_stats['rejected'] == rejected + 1
@@ -0,0 +1,150 @@
+import importlib
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from download_pipeline import RateLimiter
+from job_events import EventLog
+
+# 两个歌单有重叠的歌曲，单曲中一首也在歌单里，一首不存在
+PLAYLISTS = {'11': list(range(1, 6)), '12': list(range(4, 9))}
+SONGS = {str(sid): {'id': sid, 'name': f'歌曲{sid}', 'ar': [{'id': 1, 'name': '歌手'}], 'al': {'name': '专辑'}}
+         for sid in range(1, 10)}
+
+
+@pytest.fixture(scope='module')
+def npd():
+    # 命令行模块导入时读取当前目录的 config.json
+    if not os.path.exists('config.json'):
+        with open('config.json', 'w', encoding='utf-8') as f:
+            json.dump({}, f)
+    return importlib.import_module('netease_playlist_downloader')
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def upstream(npd, monkeypatch, tmp_path):
+    calls = []
+    lock = threading.Lock()
+
+    def fake_get(url, params=None, **kwargs):
+        with lock:
+            calls.append(time.monotonic())
+        params = dict(params or {})
+        if '?' in url:
+            url, query = url.split('?', 1)
+            params.update(pair.split('=', 1) for pair in query.split('&'))
+        path = url[len(npd.API_BASE):]
+        if path == '/playlist/detail':
+            return FakeResponse({'playlist': {}})
+        if path == '/playlist/track/all':
+            ids = PLAYLISTS[str(params['id'])]
+            offset, limit = int(params['offset']), int(params['limit'])
+            return FakeResponse({'songs': [SONGS[str(sid)] for sid in ids[offset:offset + limit]]})
+        if path == '/song/detail':
+            return FakeResponse({'songs': [SONGS[sid] for sid in params['ids'].split(',') if sid in SONGS]})
+        if path == '/song/url/v1':
+            return FakeResponse({'data': [{'id': int(sid), 'url': f'http://cdn/{sid}.mp3', 'size': 1000,
+                                           'type': 'mp3', 'level': params['level']}
+                                          for sid in params['id'].split(',')]})
+        raise AssertionError(f'未预期的请求 {url}')
+
+    monkeypatch.setattr(npd.requests, 'get', fake_get)
+    monkeypatch.setattr(npd, 'SONGS_PER_REQUEST', 2)
+    monkeypatch.setattr(npd, 'PREFLIGHT', False)
+    monkeypatch.setattr(npd, 'tag_stage', None)
+    monkeypatch.setattr(npd, 'event_log', EventLog(str(tmp_path / 'events.jsonl')))
+    monkeypatch.setattr(npd, 'SAVE_DIR', str(tmp_path / 'music'))
+    return calls
+
+
+@pytest.fixture
+def downloads(npd, monkeypatch):
+    state = {'active': 0, 'max_active': 0, 'done': []}
+    lock = threading.Lock()
+
+    def download_song(track, song_url):
+        with lock:
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+        time.sleep(0.05)
+        with lock:
+            state['active'] -= 1
+            state['done'].append(track.id)
+        return f'[完成] {track.name}'
+
+    monkeypatch.setattr(npd, 'download_song', download_song)
+    return state
+
+
+def read_events(npd):
+    with open(npd.event_log.path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_mixed_batch_limits_concurrency_and_dedupes(npd, upstream, downloads, monkeypatch):
+    monkeypatch.setattr(npd, 'DOWNLOAD_WORKERS', 3)
+    monkeypatch.setattr(npd, 'rate_limiter', RateLimiter(0))
+    manifest = npd.run_batch(['playlist 11', 'song 9', 'https://music.163.com/#/song?id=404',
+                              'https://music.163.com/#/playlist?id=12', 'song 1', 'song 9'])
+
+    # 9 首不同的歌曲各下载一次，同时下载的不超过 DOWNLOAD_WORKERS
+    assert sorted(downloads['done']) == list(range(1, 10))
+    assert 1 < downloads['max_active'] <= 3
+    assert manifest['totals']['songs'] == 9
+    assert manifest['totals']['duplicates'] == 3
+    assert manifest['totals']['downloaded'] == 9
+    targets = {f"{t['type']}:{t['id']}": t for t in manifest['targets']}
+    assert targets['playlist:11']['status'] == 'done' and targets['playlist:11']['tracks'] == 5
+    # 单曲先于歌单列出，歌单中重复的歌曲记在 tracks 但不计入 unique
+    assert targets['song:1']['unique'] == 1 and targets['playlist:11']['unique'] == 4
+    assert targets['playlist:12']['unique'] == 3
+    assert targets['song:404']['status'] == 'error'
+    finished = [e for e in read_events(npd) if e['event'] == 'job_finished']
+    assert len(finished) == 1 and finished[0]['status'] == 'done'
+
+
+def test_batch_api_requests_respect_rate(npd, upstream, downloads, monkeypatch):
+    rate = 20
+    monkeypatch.setattr(npd, 'DOWNLOAD_WORKERS', 4)
+    monkeypatch.setattr(npd, 'rate_limiter', RateLimiter(rate, burst=1))
+    npd.run_batch(['playlist 11', 'playlist 12', 'song 9'])
+
+    # 令牌桶容量为 1：第 n 个请求不早于第一个请求之后 n/rate 秒（下载线程、翻页线程共用同一个限速器）
+    assert len(upstream) >= 6
+    start = upstream[0]
+    for n, ts in enumerate(upstream):
+        assert ts - start >= n / rate - 0.01
+
+
+def test_single_song_error_finishes_job(npd, upstream, monkeypatch):
+    monkeypatch.setattr(npd, 'MODE', 1)
+    monkeypatch.setattr(npd, 'SONG_ID', '404')
+    monkeypatch.setattr(npd, 'get_single_song', lambda song_id: None)
+    assert npd.main() == 1
+    events = read_events(npd)
+    assert [e['event'] for e in events] == ['job_started', 'job_finished']
+    assert events[1]['status'] == 'error' and events[1]['error']
+
+
+def test_unexpected_error_finishes_job(npd, upstream, monkeypatch):
+    def boom(song_id):
+        raise ConnectionError('网络错误')
+    monkeypatch.setattr(npd, 'MODE', 1)
+    monkeypatch.setattr(npd, 'SONG_ID', '1')
+    monkeypatch.setattr(npd, 'get_single_song', boom)
+    with pytest.raises(ConnectionError):
+        npd.main()
+    finished = [e for e in read_events(npd) if e['event'] == 'job_finished']
+    assert len(finished) == 1
+    assert finished[0]['status'] == 'error' and finished[0]['error'] == '网络错误'
@@ -0,0 +1,88 @@
+import errno
+import hashlib
+import os
+
+import pytest
+
+import content_store
+from content_store import ContentStore, IntegrityError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentStore(str(tmp_path / 'store'))
+
+
+def test_preallocate_failure_removes_part_file(store, monkeypatch):
+    def no_space(f, size):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+    monkeypatch.setattr(content_store, 'preallocate', no_space)
+    with pytest.raises(OSError):
+        store.writer(1, expected_size=1000)
+    assert os.listdir(store.tmp_dir) == []
+
+
+def save(store, song_id, body, expected_length=0, md5='', **kwargs):
+    with store.writer(song_id, **kwargs) as w:
+        w.write(body)
+        return w.commit(expected_length, md5)
+
+
+def test_identical_audio_is_stored_once(store):
+    first = save(store, 1, b'same audio')
+    second = save(store, 2, b'same audio')
+    assert first == second and store.lookup(1) == store.lookup(2) == first
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_link_shares_the_blob(store, tmp_path):
+    blob = save(store, 1, b'audio', br=320000, level='exhigh')
+    target = tmp_path / 'A - S.mp3'
+    assert store.link(blob, str(target)) in ('hardlink', 'reflink', 'copy')
+    assert target.read_bytes() == b'audio'
+    assert store.quality(1) == (320000, 'exhigh')
+
+
+def test_forget_removes_links_but_keeps_shared_blob(store, tmp_path):
+    blob = save(store, 1, b'audio')
+    save(store, 2, b'audio')
+    folder = tmp_path / 'playlist'
+    folder.mkdir()
+    if store.link(blob, str(folder / 'a.mp3')) != 'hardlink':
+        pytest.skip('文件系统不支持硬链接')
+    assert store.forget(1, [str(folder)]) == [str(folder / 'a.mp3')]
+    assert store.lookup(1) is None
+    # 歌曲 2 仍引用同一个文件
+    assert store.lookup(2) == blob and os.path.exists(blob)
+
+
+def quarantined(store):
+    path = os.path.join(store.root, 'quarantine')
+    return os.listdir(path) if os.path.isdir(path) else []
+
+
+def test_truncated_download_is_quarantined(store):
+    with pytest.raises(IntegrityError, match='不完整'):
+        save(store, 1, b'half', expected_length=8)
+    assert store.lookup(1) is None
+    assert os.listdir(store.tmp_dir) == [] and len(quarantined(store)) == 1
+
+
+def test_md5_is_checked(store):
+    body = b'audio'
+    with pytest.raises(IntegrityError, match='MD5'):
+        save(store, 1, body, md5='0' * 32)
+    assert save(store, 1, body, md5=hashlib.md5(body).hexdigest().upper()) == store.lookup(1)
+
+
+def test_verify_reports_damaged_files(store):
+    good = save(store, 1, b'good audio')
+    bad = save(store, 2, b'bad audio')
+    missing = save(store, 3, b'missing audio')
+    with open(bad, 'r+b') as f:
+        f.write(b'B')
+    os.remove(missing)
+    assert [(sid, problem) for sid, _, problem in store.verify()] == [(3, '文件不存在')]
+    deep = {sid: problem for sid, _, problem in store.verify(deep=True)}
+    assert deep == {2: 'sha256 不符', 3: '文件不存在'}
+    assert os.path.exists(good)
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+import web_downloader as wd
+
+
+class FakeResp:
+    def __init__(self, status=200, content=b'jpeg', content_type='image/jpeg'):
+        self.status_code = status
+        self.content = content
+        self.headers = {'Content-Type': content_type} if content_type else {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f'HTTP {self.status_code}')
+
+
+@pytest.fixture
+def upstream(monkeypatch, tmp_path):
+    monkeypatch.setattr(wd, 'COVER_DIR', str(tmp_path))
+    monkeypatch.setattr(wd, 'cover_misses', wd.TTLCache(ttl=60, stale_ttl=0))
+    calls = {'detail': 0, 'cdn': 0}
+    state = {'pic': 'http://p/1.jpg', 'status': 200, 'type': 'image/jpeg'}
+
+    def get_song_details(ids):
+        calls['detail'] += 1
+        return [{'id': ids[0], 'al': {'picUrl': state['pic']}}]
+
+    def upstream_get(name, url, **kwargs):
+        calls['cdn'] += 1
+        return FakeResp(state['status'], content_type=state['type'])
+    monkeypatch.setattr(wd, 'get_song_details', get_song_details)
+    monkeypatch.setattr(wd, 'upstream_get', upstream_get)
+    return calls, state
+
+
+def test_cover_is_fetched_once(upstream):
+    calls, _ = upstream
+    path = wd.fetch_cover(1, 64)
+    assert open(path, 'rb').read() == b'jpeg'
+    assert wd.fetch_cover(1, 64) == path
+    assert calls == {'detail': 1, 'cdn': 1}
+    assert wd.cover_locks == {}
+
+
+def test_missing_cover_is_negatively_cached(upstream):
+    calls, state = upstream
+    state['pic'] = None
+    assert wd.fetch_cover(2, 64) is None
+    assert wd.fetch_cover(2, 64) is None
+    assert calls['detail'] == 1
+    assert wd.cover_locks == {}
+
+
+def test_fetch_error_releases_lock_and_is_cached(upstream):
+    calls, state = upstream
+    state['status'] = 500
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            wd.fetch_cover(3, 64)
+    assert calls['cdn'] == 1
+    assert wd.cover_locks == {}
+    assert not [name for name in os.listdir(wd.COVER_DIR) if name.endswith('.tmp')]
+
+
+def test_cover_keeps_upstream_content_type(upstream):
+    _, state = upstream
+    state['type'] = 'image/png; charset=binary'
+    path = wd.fetch_cover(4, 64)
+    assert path.endswith('4_64.png') and wd.cover_mimetype(path) == 'image/png'
+    resp = wd.app.test_client().get('/cover/4?s=64')
+    assert resp.status_code == 200 and resp.mimetype == 'image/png'
+    state['type'] = None
+    assert wd.cover_mimetype(wd.fetch_cover(5, 64)) == 'image/jpeg'
+
+
+def test_non_image_response_is_an_error(upstream):
+    _, state = upstream
+    state['type'] = 'text/html'
+    with pytest.raises(RuntimeError, match='text/html'):
+        wd.fetch_cover(6, 64)
+    assert os.listdir(wd.COVER_DIR) == []
+
+
+def test_cover_cache_is_bounded(upstream, monkeypatch):
+    monkeypatch.setattr(wd, 'cover_etags', wd.TTLCache(maxsize=2, ttl=60, stale_ttl=0))
+    monkeypatch.setattr(wd, 'COVER_TRIM_EVERY', 1)
+    monkeypatch.setattr(wd, 'COVER_BUDGET_BYTES', 8)
+    paths = []
+    for song_id in range(10, 15):
+        paths.append(wd.fetch_cover(song_id, 64))
+        wd.cover_etag(paths[-1])
+        os.utime(paths[-1], (song_id, song_id))
+    # 每张 4 字节，预算 8 字节：只保留最近的两张
+    assert sorted(os.listdir(wd.COVER_DIR)) == ['13_64.jpg', '14_64.jpg']
+    assert wd.cover_etags.stats()['size'] == 2
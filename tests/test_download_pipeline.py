@@ -0,0 +1,198 @@
+import threading
+
+import pytest
+
+from content_store import IntegrityError
+from download_pipeline import (ByteProgress, PipelineError, SongUrl, UrlExpiredError, level_rank, resolve_levels,
+                               run_pipeline, song_url_from_item)
+
+
+def song(i):
+    return {'id': i, 'name': f'S{i}', 'ar': [{'name': f'A{i}'}], 'al': {'name': 'Al'}}
+
+
+def url(i, tag='v1'):
+    return SongUrl(url=f'http://cdn/{i}?{tag}', size=100, br=128000, md5='', type='mp3', level='standard')
+
+
+def resolve(ids):
+    return {i: url(i) for i in ids}
+
+
+def run(*args, timeout=5, **kwargs):
+    # 流水线卡死时测试失败而不是一直挂起
+    result = {}
+
+    def target():
+        try:
+            result['count'] = run_pipeline(*args, **kwargs)
+        except Exception as e:
+            result['error'] = e
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), 'run_pipeline 未结束'
+    return result
+
+
+def test_all_tracks_processed():
+    results = []
+    out = run([[song(1), song(2)], [song(3)]], resolve, lambda t, u: f'ok {t.id} {u.url}',
+              on_result=lambda t, msg: results.append(msg), workers=2)
+    assert out == {'count': 3}
+    assert sorted(results) == [f'ok {i} http://cdn/{i}?v1' for i in (1, 2, 3)]
+
+
+def test_listing_error_after_some_tracks_is_raised():
+    def pages():
+        yield [song(1), song(2)]
+        raise RuntimeError('第二页获取失败')
+    done = []
+    out = run(pages(), resolve, lambda t, u: 'ok', on_result=lambda t, msg: done.append(t.id))
+    assert isinstance(out['error'], PipelineError)
+    assert out['error'].processed == 2
+    assert '第二页获取失败' in str(out['error'])
+    assert sorted(done) == [1, 2]
+
+
+def test_resolve_error_is_raised():
+    def bad_resolve(ids):
+        raise RuntimeError('song/url 失败')
+    out = run([[song(1)]], bad_resolve, lambda t, u: 'ok' if u else '[失败] 无链接')
+    assert isinstance(out['error'], PipelineError)
+    assert out['error'].processed == 1
+
+
+def test_failing_callback_does_not_hang():
+    def on_result(track, msg):
+        raise ValueError('回调出错')
+    pages = [[song(i) for i in range(50)]]
+    out = run(pages, resolve, lambda t, u: 'ok', on_result=on_result, lookahead=2, queue_size=2)
+    assert isinstance(out['error'], PipelineError)
+    assert out['error'].processed == 50
+    assert len(out['error'].errors) == 50
+
+
+def test_expired_url_is_refreshed():
+    calls = []
+    resolved = []
+
+    def resolve_counted(ids):
+        resolved.append(list(ids))
+        return {i: url(i, f'v{len(resolved)}') for i in ids}
+
+    def download(track, song_url):
+        calls.append(song_url.url)
+        if song_url.url.endswith('v1'):
+            raise UrlExpiredError('403')
+        return 'ok'
+    results = []
+    out = run([[song(1)]], resolve_counted, download, on_result=lambda t, msg: results.append(msg))
+    assert out == {'count': 1}
+    assert calls == ['http://cdn/1?v1', 'http://cdn/1?v2']
+    assert results == ['ok']
+
+
+def test_refresh_gives_up_after_max_refresh():
+    def download(track, song_url):
+        raise UrlExpiredError('403')
+    results = []
+    run([[song(1)]], resolve, download, on_result=lambda t, msg: results.append(msg), max_refresh=2)
+    assert results[0].startswith('[失败]') and '2次' in results[0]
+
+
+def test_stale_url_refreshed_before_download():
+    resolved = []
+
+    def resolve_counted(ids):
+        resolved.append(list(ids))
+        return {i: url(i, f'v{len(resolved)}') for i in ids}
+    seen = []
+    run([[song(1)]], resolve_counted, lambda t, u: seen.append(u.url) or 'ok', url_max_age=-1)
+    assert seen == ['http://cdn/1?v2']
+
+
+def test_integrity_error_redownloads():
+    attempts = []
+
+    def download(track, song_url):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise IntegrityError('md5 不符')
+        return 'ok'
+    results = []
+    run([[song(1)]], resolve, download, on_result=lambda t, msg: results.append(msg), max_verify_retries=2)
+    assert results == ['ok'] and len(attempts) == 3
+
+
+def test_download_exception_becomes_failure_message():
+    def download(track, song_url):
+        raise OSError('disk')
+    results = []
+    out = run([[song(1)]], resolve, download, on_result=lambda t, msg: results.append(msg))
+    assert out == {'count': 1}
+    assert results[0].startswith('[失败]')
+
+
+def test_pipeline_error_message_lists_first_errors():
+    e = PipelineError([RuntimeError(str(i)) for i in range(5)], 0)
+    assert str(e).startswith('0; 1; 2') and '5 个错误' in str(e)
+    with pytest.raises(PipelineError):
+        raise e
+
+
+def test_cancel_stops_without_processing_remaining_tracks():
+    cancel = threading.Event()
+    done = []
+
+    def download(track, url):
+        # 第一首下载时租约失效
+        cancel.set()
+        return 'ok'
+    out = run([[song(i) for i in range(1, 6)], [song(6)]], resolve, download,
+              on_result=lambda t, msg: done.append(t.id), url_batch=1, cancel=cancel)
+    assert out == {'count': 1}
+    assert done == [1]
+
+
+def test_byte_progress_counts_only_downloaded_tracks():
+    progress = ByteProgress({1: 100, 2: 300, 3: 600})
+    progress.add(1)
+    progress.add(2, downloaded=False)
+    stats = progress.snapshot()
+    assert (stats['bytes_done'], stats['bytes_total']) == (100, 700)
+    # 同一首歌重复回调不重复计入
+    progress.add(1)
+    assert progress.snapshot()['bytes_done'] == 100
+
+
+def test_resolve_levels_falls_back_per_song():
+    available = {1: 'lossless', 2: 'exhigh', 3: None}
+    calls = []
+
+    def fetch(ids, level):
+        calls.append((list(ids), level))
+        return [{'id': i, 'url': f'http://cdn/{i}.{level}' if available[i] == level else None,
+                 'br': 320000, 'type': 'FLAC' if level == 'lossless' else None, 'level': level} for i in ids]
+    urls = resolve_levels([1, 2, 3], ['lossless', 'exhigh', 'standard'], fetch)
+    assert calls == [([1, 2, 3], 'lossless'), ([2, 3], 'exhigh'), ([3], 'standard')]
+    assert urls[1].type == 'flac' and urls[1].level == 'lossless'
+    assert urls[2].type == 'mp3' and urls[2].url == 'http://cdn/2.exhigh'
+    assert 3 not in urls
+
+
+def test_resolve_levels_batches_of_100():
+    sizes = []
+
+    def fetch(ids, level):
+        sizes.append(len(ids))
+        return [{'id': i, 'url': f'http://cdn/{i}'} for i in ids]
+    assert len(resolve_levels(range(250), ['standard', 'higher'], fetch)) == 250
+    assert sizes == [100, 100, 50]
+
+
+def test_song_url_from_item_and_level_rank():
+    assert song_url_from_item({'id': 1, 'url': None}) is None
+    assert song_url_from_item({'id': 1, 'url': 'u'}) == SongUrl('u', 0, 0, '', 'mp3', '')
+    assert level_rank('standard') < level_rank('exhigh') < level_rank('hires')
+    assert level_rank('unknown') == -1
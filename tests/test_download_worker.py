@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+import pytest
+
+import web_downloader as wd
+from job_store import JobStore
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    monkeypatch.setattr(wd, 'job_store', store)
+    monkeypatch.setattr(wd, 'worker_thread', None)
+    monkeypatch.setattr(wd, 'song_worker_thread', None)
+
+    def run_job(job, events, cancel=None):
+        store.set_job_status(job['id'], 'done', 'ok')
+    monkeypatch.setattr(wd, 'run_playlist_job', run_job)
+    monkeypatch.setattr(wd, 'run_song_job', run_job)
+    return store
+
+
+def wait_workers(timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        threads = [t for t in (wd.worker_thread, wd.song_worker_thread) if t is not None]
+        if not any(t.is_alive() for t in threads):
+            return
+        time.sleep(0.01)
+    raise AssertionError('下载线程未退出')
+
+
+def test_job_added_while_worker_exits_is_processed(store, monkeypatch):
+    claim = store.claim_job
+    added = []
+
+    def claim_then_start(*args, **kwargs):
+        job = claim(*args, **kwargs)
+        if job is None and not added and threading.current_thread() is wd.worker_thread:
+            # 领取落空、线程即将退出时 /start 加入新任务
+            added.append(store.add_job('playlist', 1))
+            wd.ensure_worker()
+        return job
+    monkeypatch.setattr(store, 'claim_job', claim_then_start)
+    wd.ensure_worker()
+    wait_workers()
+    assert added and store.get_job(added[0])['status'] == 'done'
+
+
+def test_exited_worker_is_restarted(store):
+    wd.ensure_worker()
+    wait_workers()
+    assert wd.worker_thread is None and wd.song_worker_thread is None
+    job_id = store.add_job('song', 2)
+    wd.ensure_worker()
+    wait_workers()
+    assert store.get_job(job_id)['status'] == 'done'
+
+
+def test_first_request_resumes_and_takes_over_expired_lease(store, monkeypatch):
+    monkeypatch.setattr(wd, 'lease_watch_pid', None)
+    monkeypatch.setattr(wd, 'JOB_LEASE_SECONDS', 0.4)
+    # 其它机器上的进程领取后崩溃，启动时租约还没到期
+    job_id = store.add_job('playlist', 1)
+    store.claim_job('otherhost:1', 0.4)
+    wd.app.test_client().get('/API_Document.html')
+    assert wd.lease_watch_pid == os.getpid()
+    deadline = time.time() + 5
+    while store.get_job(job_id)['status'] != 'done' and time.time() < deadline:
+        time.sleep(0.02)
+    job = store.get_job(job_id)
+    assert job['status'] == 'done' and job['worker_id'] == wd.WORKER_ID
+
+
+def test_background_jobs_start_once_per_process(store, monkeypatch):
+    calls = []
+    monkeypatch.setattr(wd, 'lease_watch_pid', None)
+    monkeypatch.setattr(wd, 'resume_jobs', lambda: calls.append('resume'))
+    monkeypatch.setattr(wd, 'watch_leases', lambda: calls.append('watch'))
+    wd.start_background_jobs()
+    client = wd.app.test_client()
+    client.get('/API_Document.html')
+    client.get('/API_Document.html')
+    time.sleep(0.05)
+    assert calls == ['resume', 'watch']
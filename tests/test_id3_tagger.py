@@ -0,0 +1,147 @@
+import os
+import threading
+
+import pytest
+
+import id3_tagger
+from content_store import ContentStore
+from id3_tagger import TagStage, build_id3v2, id3v2_size, tag_file
+
+AUDIO = b'\xff\xfb\x90\x00' + bytes(range(256)) * 8
+TAGS = {'title': '晴天', 'artist': '周杰伦', 'album': '叶惠美', 'track_no': 3, 'cover_url': ''}
+
+
+def read_frames(data):
+    """解析 ID3v2.3 标签中的帧：{帧ID: 内容}"""
+    end = id3v2_size(data[:10])
+    frames, pos = {}, 10
+    while pos + 10 <= end:
+        frame_id = data[pos:pos + 4].decode('ascii')
+        size = int.from_bytes(data[pos + 4:pos + 8], 'big')
+        frames[frame_id] = data[pos + 10:pos + 10 + size]
+        pos += 10 + size
+    return frames
+
+
+def text(payload):
+    assert payload[0] == 1
+    return payload[1:].decode('utf-16')
+
+
+def test_build_and_size_round_trip():
+    tag = build_id3v2(TAGS, cover=b'jpegdata')
+    assert id3v2_size(tag + AUDIO) == len(tag)
+    frames = read_frames(tag + AUDIO)
+    assert (text(frames['TIT2']), text(frames['TPE1']), text(frames['TALB']), text(frames['TRCK'])) == \
+        ('晴天', '周杰伦', '叶惠美', '3')
+    assert frames['APIC'] == b'\x00image/jpeg\x00\x03\x00jpegdata'
+    assert id3v2_size(AUDIO) == 0 and id3v2_size(b'ID3') == 0
+
+
+def test_tag_file_writes_a_new_file_and_replaces_old_tag(tmp_path):
+    src = tmp_path / 'song.mp3'
+    src.write_bytes(build_id3v2({'title': 'old'}) + AUDIO)
+    before = src.read_bytes()
+    result = tag_file(str(src), TAGS, str(tmp_path))
+    assert src.read_bytes() == before
+    data = open(result['tmp_path'], 'rb').read()
+    assert data[id3v2_size(data[:10]):] == AUDIO
+    assert text(read_frames(data)['TIT2']) == '晴天'
+    assert result['size'] == len(data)
+
+
+def test_tag_file_embeds_cover(tmp_path, monkeypatch):
+    class Resp:
+        content = b'cover'
+
+        def raise_for_status(self):
+            pass
+    monkeypatch.setattr(id3_tagger.requests, 'get', lambda url, **kwargs: Resp())
+    src = tmp_path / 'song.mp3'
+    src.write_bytes(AUDIO)
+    result = tag_file(str(src), dict(TAGS, cover_url='http://p/1.jpg'), str(tmp_path))
+    assert read_frames(open(result['tmp_path'], 'rb').read())['APIC'].endswith(b'cover')
+
+
+def test_shared_blob_is_not_modified(tmp_path):
+    store = ContentStore(str(tmp_path / 'store'))
+    blobs = []
+    for song_id in (1, 2):
+        with store.writer(song_id) as w:
+            w.write(AUDIO)
+            blobs.append(w.commit())
+    assert blobs[0] == blobs[1]
+    link = tmp_path / 'A-S.mp3'
+    store.link(blobs[0], str(link))
+    result = tag_file(blobs[0], TAGS, store.tmp_dir)
+    tagged = store.commit_tagged(1, blobs[0], result['tmp_path'], result['sha256'], result['size'], [str(link)])
+    assert tagged != blobs[0] and store.lookup(1) == tagged and store.is_tagged(1)
+    # 歌曲 2 仍是原来的文件，内容库校验不报错
+    assert store.lookup(2) == blobs[0] and open(blobs[0], 'rb').read() == AUDIO and not store.is_tagged(2)
+    assert list(store.verify(deep=True)) == []
+    assert link.read_bytes() == open(tagged, 'rb').read()
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_unshared_old_blob_is_removed_and_stale_result_dropped(tmp_path):
+    store = ContentStore(str(tmp_path / 'store'))
+    with store.writer(1) as w:
+        w.write(AUDIO)
+        blob = w.commit()
+    result = tag_file(blob, TAGS, store.tmp_dir)
+    stale = tag_file(blob, TAGS, store.tmp_dir)
+    tagged = store.commit_tagged(1, blob, result['tmp_path'], result['sha256'], result['size'])
+    assert not os.path.exists(blob) and list(store.verify(deep=True)) == []
+    # 记录已指向新文件，同一首歌重复的标签结果被丢弃
+    assert store.commit_tagged(1, blob, stale['tmp_path'], stale['sha256'], stale['size']) is None
+    assert store.lookup(1) == tagged and os.listdir(store.tmp_dir) == []
+
+
+def wait_stage(stage, total):
+    stage.close()
+    stats = stage.stats()
+    assert stats['tagged'] + stats['failed'] == total
+    return stats
+
+
+def test_tag_stage_runs_in_process_pool(tmp_path):
+    src = tmp_path / 'song.mp3'
+    src.write_bytes(AUDIO)
+    done = []
+    stage = TagStage(str(tmp_path), processes=1)
+    stage.submit(str(src), TAGS, on_done=lambda result: done.append(open(result['tmp_path'], 'rb').read()))
+    # 没有回调的任务，临时文件被删除
+    stage.submit(str(src), TAGS)
+    stats = wait_stage(stage, 2)
+    assert stats['tagged'] == 2 and stats['failed'] == 0
+    assert done[0].endswith(AUDIO) and sorted(os.listdir(tmp_path)) == ['song.mp3']
+
+
+def test_tag_stage_counts_failures(tmp_path):
+    stage = TagStage(str(tmp_path), processes=1)
+    stage.submit(str(tmp_path / 'missing.mp3'), TAGS)
+    src = tmp_path / 'song.mp3'
+    src.write_bytes(AUDIO)
+
+    def broken_callback(result):
+        raise RuntimeError('写入索引失败')
+    stage.submit(str(src), TAGS, on_done=broken_callback)
+    stats = wait_stage(stage, 2)
+    assert stats['failed'] == 2 and sorted(os.listdir(tmp_path)) == ['song.mp3']
+
+
+def test_broken_pool_does_not_stop_feeder(tmp_path):
+    class BrokenPool:
+        def submit(self, *args):
+            raise RuntimeError('BrokenProcessPool')
+
+        def shutdown(self, wait=True):
+            pass
+    stage = TagStage(str(tmp_path), processes=1)
+    stage._pool = BrokenPool()
+    stage._feeder = threading.Thread(target=stage._feed, daemon=True)
+    stage._feeder.start()
+    for _ in range(3):
+        stage.submit('x.mp3', TAGS)
+    stats = wait_stage(stage, 3)
+    assert stats['failed'] == 3
@@ -0,0 +1,93 @@
+import sqlite3
+import time
+
+import pytest
+
+from download_pipeline import compact_track
+from job_store import JobStore, LeaseLostError
+
+
+def track(i):
+    return compact_track({'id': i, 'name': f'S{i}', 'ar': [{'name': 'A'}], 'al': {'name': 'Al'}})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+def test_claim_in_order_and_only_once(store):
+    first = store.add_job('playlist', 1)
+    second = store.add_job('song', 2)
+    assert store.claim_job('w1', 60)['id'] == first
+    assert store.claim_job('w2', 60)['id'] == second
+    assert store.claim_job('w3', 60) is None
+
+
+def test_claim_filters_by_type(store):
+    store.add_job('playlist', 1)
+    song_job = store.add_job('song', 2)
+    assert store.claim_job('w1', 60, 'song')['id'] == song_job
+
+
+def test_expired_lease_is_taken_over(store):
+    job_id = store.add_job('playlist', 1)
+    store.claim_job('w1', -1)
+    job = store.claim_job('w2', 60)
+    assert job['id'] == job_id and job['status'] == 'running'
+    assert not store.renew_lease(job_id, 'w1', 60)
+    assert store.renew_lease(job_id, 'w2', 60)
+
+
+def test_writes_from_old_worker_are_ignored(store):
+    job_id = store.add_job('playlist', 1)
+    store.claim_job('w1', -1)
+    tracks = store.add_tracks(job_id, [track(1)], worker_id='w1')
+    store.claim_job('w2', 60)
+    assert not store.set_job_status(job_id, 'error', 'old', worker_id='w1')
+    store.set_progress(job_id, worker_id='w1', msg='old')
+    store.mark_track(job_id, tracks[0].idx, 'ok', worker_id='w1')
+    store.mark_listed(job_id, worker_id='w1')
+    with pytest.raises(LeaseLostError):
+        store.add_tracks(job_id, [track(2)], worker_id='w1')
+    job = store.get_job(job_id)
+    assert (job['status'], job['listed'], job['progress'].get('msg')) == ('running', 0, None)
+    assert store.track_counts(job_id) == (1, 0)
+    assert store.set_job_status(job_id, 'done', 'ok', worker_id='w2')
+
+
+def test_duplicate_songs_are_marked_by_position(store):
+    job_id = store.add_job('playlist', 1)
+    tracks = store.add_tracks(job_id, [track(7), track(8), track(7)])
+    assert [t.idx for t in tracks] == [0, 1, 2]
+    store.mark_track(job_id, tracks[0].idx, 'ok')
+    pending = store.pending_tracks(job_id)
+    assert [(t.id, t.idx) for t in pending] == [(8, 1), (7, 2)]
+    more = store.add_tracks(job_id, [track(9)])
+    assert more[0].idx == 3
+
+
+def test_failed_prefix_marks_failed(store):
+    job_id = store.add_job('playlist', 1)
+    tracks = store.add_tracks(job_id, [track(1)])
+    store.mark_track(job_id, tracks[0].idx, '[失败] 无链接')
+    assert store.track_counts(job_id) == (1, 1)
+    assert store.pending_tracks(job_id) == []
+
+
+def test_old_database_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, target_id TEXT NOT NULL, "
+        "info TEXT NOT NULL DEFAULT '{}', status TEXT NOT NULL DEFAULT 'queued', listed INTEGER NOT NULL DEFAULT 0, "
+        "msg TEXT NOT NULL DEFAULT '', created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO jobs (type, target_id, created_at, updated_at) VALUES ('song', '5', ?, ?)",
+                 (time.time(), time.time()))
+    conn.commit()
+    conn.close()
+    store = JobStore(path)
+    job = store.claim_job('w1', 60)
+    assert job['target_id'] == '5' and job['progress'] == {}
+    assert store.renew_lease(job['id'], 'w1', 60)
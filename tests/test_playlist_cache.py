@@ -0,0 +1,84 @@
+import gzip
+import os
+
+import pytest
+
+from playlist_cache import PlaylistCache, covers_fields, project_fields
+
+SONGS = [{'id': i, 'name': f'S{i}', 'ar': [{'id': 1, 'name': 'A', 'tns': []}], 'al': {'name': 'Al', 'picUrl': 'p'},
+          'privilege': {'fee': 8}} for i in range(250)]
+SLIM = [project_fields(song) for song in SONGS]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PlaylistCache(str(tmp_path / 'playlists'))
+
+
+def fetcher(calls, songs=SONGS, page_size=100, fail_after=None):
+    def fetch_pages():
+        calls.append(1)
+        for n, i in enumerate(range(0, len(songs), page_size)):
+            if fail_after is not None and n == fail_after:
+                raise RuntimeError('翻页失败')
+            yield songs[i:i + page_size]
+    return fetch_pages
+
+
+def test_version_of():
+    assert PlaylistCache.version_of({'trackUpdateTime': 5, 'updateTime': 3, 'trackCount': 2}) == [5, 3, 2]
+    assert PlaylistCache.version_of({'trackCount': 2}) is None
+    assert PlaylistCache.version_of(None) is None
+
+
+def test_full_listing_is_cached_until_version_changes(cache):
+    calls = []
+    assert sum(cache.pages(1, [1, 1, 250], fetcher(calls)), []) == SONGS
+    pages = list(cache.pages(1, [1, 1, 250], fetcher(calls), offset=120))
+    assert calls == [1] and [len(p) for p in pages] == [100, 30]
+    assert pages[0][0] == SLIM[120] and 'privilege' not in pages[0][0] and 'tns' not in pages[0][0]['ar'][0]
+    list(cache.pages(1, [2, 1, 250], fetcher(calls)))
+    assert calls == [1, 1]
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'stores': 2}
+
+
+def test_cache_file_is_json_lines(cache):
+    list(cache.pages(1, [1, 1, 250], fetcher([])))
+    with gzip.open(cache._path(1), 'rt', encoding='utf-8') as f:
+        assert sum(1 for _ in f) == 251
+
+
+def test_partial_listing_is_not_cached(cache):
+    calls = []
+    with pytest.raises(RuntimeError):
+        list(cache.pages(1, [1, 1, 250], fetcher(calls, fail_after=1)))
+    # 调用方提前停止
+    pages = cache.pages(1, [1, 1, 250], fetcher(calls))
+    next(pages)
+    pages.close()
+    # 续传时只拿到后半部分
+    list(cache.pages(1, [1, 1, 250], fetcher(calls, songs=SONGS[100:]), offset=100))
+    assert os.listdir(cache.root) == [] and cache.stats()['stores'] == 0
+
+
+def test_without_version_cache_is_bypassed(cache):
+    calls = []
+    list(cache.pages(1, None, fetcher(calls)))
+    list(cache.pages(1, None, fetcher(calls)))
+    assert calls == [1, 1] and cache.stats()['stores'] == 0
+
+
+def test_corrupt_cache_file_is_a_miss(cache):
+    with open(cache._path(1), 'wb') as f:
+        f.write(b'not gzip')
+    calls = []
+    assert sum(cache.pages(1, [1, 1, 250], fetcher(calls)), []) == SONGS
+    assert calls == [1] and cache.stats()['misses'] == 1
+
+
+def test_covers_fields():
+    assert covers_fields({'id': {}, 'name': {}, 'ar': {'name': {}}, 'al': {'picUrl': {}}})
+    assert not covers_fields(None)
+    assert not covers_fields({'ar': {}})
+    assert not covers_fields({'privilege': {}})
+    assert not covers_fields({'al': {'size': {}}})
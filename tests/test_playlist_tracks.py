@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import web_downloader as wd
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(wd, 'get_cookie', lambda: '')
+    monkeypatch.setattr(wd, 'playlist_cache', wd.PlaylistCache(str(tmp_path / 'playlists')))
+    monkeypatch.setattr(wd, 'get_playlist_detail', lambda pid, headers: {'trackUpdateTime': 1, 'trackCount': 3})
+    return wd.app.test_client()
+
+
+def song(i):
+    return {'id': i, 'name': f'S{i}', 'ar': [{'name': 'A'}], 'al': {'picUrl': 'p'}, 'privilege': {}}
+
+
+def test_stream_ends_with_error_line_when_listing_fails(client, monkeypatch):
+    def pages(pid, headers, limit, first_limit, offset):
+        yield [song(1), song(2)]
+        raise RuntimeError('第二页获取失败')
+    monkeypatch.setattr(wd, 'iter_playlist_track_pages', pages)
+    resp = client.get('/api/playlist_tracks?id=9&stream=1&fields=id,name')
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert lines == [{'id': 1, 'name': 'S1'}, {'id': 2, 'name': 'S2'}, {'error': '第二页获取失败'}]
+    # 不完整的列表不写入缓存
+    assert wd.playlist_cache.stats()['stores'] == 0
+
+
+def test_stream_projects_fields_and_uses_cache(client, monkeypatch):
+    calls = []
+
+    def pages(pid, headers, limit, first_limit, offset):
+        calls.append(pid)
+        yield [song(1), song(2), song(3)]
+    monkeypatch.setattr(wd, 'iter_playlist_track_pages', pages)
+    url = '/api/playlist_tracks?id=9&stream=1&fields=id,ar.name'
+    first = client.get(url).get_data(as_text=True)
+    assert client.get(url).get_data(as_text=True) == first
+    assert json.loads(first.splitlines()[0]) == {'id': 1, 'ar': [{'name': 'A'}]}
+    assert len(calls) == 1
+    # 需要缓存中没有的字段时直接翻页
+    assert client.get('/api/playlist_tracks?id=9').get_json()['songs'][0] == song(1)
+    assert len(calls) == 2
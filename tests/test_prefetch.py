@@ -0,0 +1,70 @@
+import logging
+import os
+
+import pytest
+
+import web_downloader as wd
+from download_pipeline import SongUrl
+
+HEAD = b'x' * 1000
+
+
+class FakeAudio:
+    def __init__(self, fail=False):
+        self.status_code = 206
+        self.fail = fail
+
+    def iter_content(self, chunk_size=8192):
+        yield HEAD[:500]
+        if self.fail:
+            raise ConnectionError('连接中断')
+        yield HEAD[500:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream(monkeypatch, tmp_path):
+    monkeypatch.setattr(wd, 'HEAD_DIR', str(tmp_path))
+    monkeypatch.setattr(wd, 'song_url_cache', wd.TTLCache(ttl=60, stale_ttl=0))
+    state = {'urls_fail': False, 'cdn_fail': set()}
+
+    def get_song_urls(ids, levels):
+        if state['urls_fail']:
+            raise RuntimeError('song/url 失败')
+        return {sid: SongUrl(f'http://cdn/{sid}', len(HEAD), 128000, '', 'mp3', 'standard') for sid in ids}
+
+    def get(url, **kwargs):
+        return FakeAudio(fail=int(url.rsplit('/', 1)[1]) in state['cdn_fail'])
+    monkeypatch.setattr(wd, 'get_song_urls', get_song_urls)
+    monkeypatch.setattr(wd.requests, 'get', get)
+    return state
+
+
+def test_failed_head_is_logged_and_not_cached(upstream, caplog):
+    upstream['cdn_fail'].add(2)
+    wd.prefetch_inflight.update([1, 2])
+    with caplog.at_level(logging.WARNING, logger=wd.app.logger.name):
+        wd.prefetch_batch([1, 2])
+    assert wd.read_head(1) == HEAD
+    assert not os.path.exists(wd.head_path(2)) and os.listdir(wd.HEAD_DIR) == [os.path.basename(wd.head_path(1))]
+    assert '预取 2 失败' in caplog.text
+    assert not wd.prefetch_inflight & {1, 2}
+    # 之后可以重新预取
+    upstream['cdn_fail'].clear()
+    wd.prefetch_batch([2])
+    assert wd.read_head(2) == HEAD
+
+
+def test_failed_url_lookup_does_not_raise_or_cache(upstream, caplog):
+    upstream['urls_fail'] = True
+    wd.prefetch_inflight.add(3)
+    with caplog.at_level(logging.WARNING, logger=wd.app.logger.name):
+        wd.prefetch_batch([3])
+    assert '预取下载链接失败' in caplog.text
+    assert wd.song_url_cache.get((3, (wd.PREVIEW_LEVEL,))) is None
+    assert 3 not in wd.prefetch_inflight and os.listdir(wd.HEAD_DIR) == []
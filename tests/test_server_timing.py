@@ -0,0 +1,52 @@
+import json
+import os
+import re
+
+import pytest
+
+import web_downloader as wd
+
+
+class FakeResponse:
+    def json(self):
+        return {'songs': [{'id': 1, 'name': '歌曲1'}]}
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(wd.requests, 'get', lambda url, params=None, **kwargs: FakeResponse())
+    monkeypatch.setattr(wd, 'song_detail_cache', wd.TTLCache(maxsize=100, ttl=60, stale_ttl=0))
+    monkeypatch.setattr(wd, 'SLOW_LOG_PATH', str(tmp_path / 'slow_requests.jsonl'))
+    return wd.app.test_client()
+
+
+def test_server_timing_lists_upstream_app_and_total(client):
+    resp = client.get('/api/song_detail?ids=1')
+    entries = resp.headers['Server-Timing'].split(', ')
+    assert re.fullmatch(r'song_detail;dur=\d+\.\d;desc="x1"', entries[0])
+    assert re.fullmatch(r'app;dur=\d+\.\d', entries[1])
+    assert re.fullmatch(r'total;dur=\d+\.\d', entries[2])
+    durations = {entry.split(';')[0]: float(entry.split('dur=')[1].split(';')[0]) for entry in entries}
+    assert durations['total'] >= durations['song_detail']
+
+    # 缓存命中时没有上游阶段
+    resp = client.get('/api/song_detail?ids=1')
+    assert [entry.split(';')[0] for entry in resp.headers['Server-Timing'].split(', ')] == ['app', 'total']
+
+
+def test_slow_request_log_threshold(client, monkeypatch):
+    monkeypatch.setattr(wd, 'SLOW_REQUEST_MS', 10 ** 6)
+    client.get('/api/song_detail?ids=1')
+    assert not os.path.exists(wd.SLOW_LOG_PATH)
+
+    # ID 2 不在缓存中，这次请求包含上游阶段
+    monkeypatch.setattr(wd, 'SLOW_REQUEST_MS', 0)
+    client.get('/api/song_detail?ids=1,2')
+    with open(wd.SLOW_LOG_PATH, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 1
+    record = records[0]
+    assert record['method'] == 'GET' and record['path'] == '/api/song_detail?ids=1,2'
+    assert record['status'] == 200
+    assert list(record['timings']) == ['song_detail'] and record['timings']['song_detail']['count'] == 1
+    assert record['total_ms'] >= record['timings']['song_detail']['ms']
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+import web_downloader as wd
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    state = {'batches': [], 'active': 0, 'max_active': 0}
+    lock = threading.Lock()
+
+    def fake_get(url, params=None, **kwargs):
+        assert url.endswith('/song/detail')
+        ids = [int(sid) for sid in params['ids'].split(',')]
+        with lock:
+            state['batches'].append(ids)
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+        # 前面的批次返回得更晚，结果仍要按传入顺序
+        time.sleep(0.1 if ids[0] == 1 else 0.03)
+        with lock:
+            state['active'] -= 1
+        return FakeResponse({'songs': [{'id': sid, 'name': f'歌曲{sid}'} for sid in ids if sid < 900]})
+
+    monkeypatch.setattr(wd.requests, 'get', fake_get)
+    monkeypatch.setattr(wd, 'song_detail_cache', wd.TTLCache(maxsize=100, ttl=60, stale_ttl=0))
+    return state
+
+
+def test_partial_hit_fetches_only_missing_ids(upstream):
+    wd.song_detail_cache.set(1, {'id': 1, 'name': '缓存1'})
+    wd.song_detail_cache.set(2, {'id': 2, 'name': '缓存2'})
+    songs = wd.get_song_details(['3', 1, 4, 2, 3, 999])
+    # 缓存命中与新请求的结果按传入顺序合并，重复ID各返回一次，找不到的ID省略
+    assert [song['id'] for song in songs] == [3, 1, 4, 2, 3]
+    assert songs[1]['name'] == '缓存1'
+    assert upstream['batches'] == [[3, 4, 999]]
+
+    upstream['batches'].clear()
+    assert [song['id'] for song in wd.get_song_details([4, 3])] == [4, 3]
+    assert upstream['batches'] == []
+
+
+def test_missing_ids_fan_out_in_parallel_batches(upstream, monkeypatch):
+    monkeypatch.setattr(wd, 'DETAIL_BATCH_SIZE', 3)
+    songs = wd.get_song_details(range(1, 11))
+    assert [song['id'] for song in songs] == list(range(1, 11))
+    assert sorted(upstream['batches']) == [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10]]
+    assert upstream['max_active'] > 1
+    assert wd.song_detail_cache.get(10)['name'] == '歌曲10'
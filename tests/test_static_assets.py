@@ -0,0 +1,51 @@
+import pytest
+
+from static_assets import STATIC_PREFIX, VENDOR_ASSETS, StaticAssets
+
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / 'img').mkdir()
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'img' / 'logo.svg').write_text('<svg/>')
+    (tmp_path / 'css' / 'app.css').write_text('.a { background: url("../img/logo.svg#x"); } .b { background: url(data:x) }')
+    (tmp_path / 'js' / 'app.js').write_text('const logo = "{{static:img/logo.svg}}";')
+    return tmp_path
+
+
+def test_hashed_urls_change_with_content(root):
+    assets = StaticAssets(str(root))
+    url = assets.url('js/app.js')
+    assert url.startswith(STATIC_PREFIX + 'js/app.') and url.endswith('.js')
+    (root / 'js' / 'app.js').write_text('const changed = 1;')
+    assert StaticAssets(str(root)).url('js/app.js') != url
+
+
+def test_references_are_rewritten(root):
+    assets = StaticAssets(str(root))
+    logo = assets.url('img/logo.svg')
+    css = assets.assets['css/app.css'].body.decode()
+    assert f'url("{logo}#x")' in css and 'url(data:x)' in css
+    assert assets.assets['js/app.js'].body.decode() == f'const logo = "{logo}";'
+
+
+def test_lookup_by_hashed_and_plain_name(root):
+    assets = StaticAssets(str(root))
+    asset, immutable = assets.lookup(assets.url('img/logo.svg')[len(STATIC_PREFIX):])
+    assert asset.name == 'img/logo.svg' and immutable
+    assert assets.lookup('img/logo.svg') == (asset, False)
+    assert assets.lookup('missing.js') == (None, False)
+
+
+def test_vendor_assets_fall_back_to_cdn(root):
+    assets = StaticAssets(str(root))
+    assert assets.url('vendor/bootstrap.min.css') == VENDOR_ASSETS['vendor/bootstrap.min.css']
+    assert set(assets.using_cdn()) == set(VENDOR_ASSETS)
+    (root / 'vendor').mkdir()
+    (root / 'vendor' / 'bootstrap.min.css').write_text('body{}')
+    assets = StaticAssets(str(root))
+    assert assets.url('vendor/bootstrap.min.css').startswith(STATIC_PREFIX + 'vendor/')
+    assert 'vendor/bootstrap.min.css' not in assets.using_cdn()
+    with pytest.raises(KeyError):
+        assets.url('css/missing.css')
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from web_downloader import TTLCache
+
+
+def test_fresh_hit_and_lru_bound():
+    cache = TTLCache(maxsize=2, ttl=60, stale_ttl=0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # a 变为最近使用
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_expired_entry_is_reloaded():
+    cache = TTLCache(ttl=0.01, stale_ttl=0)
+    assert cache.get_or_load('k', lambda: 1) == 1
+    time.sleep(0.02)
+    assert cache.get_or_load('k', lambda: 2) == 2
+
+
+def test_uncacheable_result_is_not_stored():
+    cache = TTLCache()
+    assert cache.get_or_load('k', lambda: {'code': 500}, cacheable=lambda v: v['code'] == 200) == {'code': 500}
+    assert cache.get('k') is None
+
+
+def test_stale_value_returned_while_refreshing():
+    cache = TTLCache(ttl=0.01, stale_ttl=60)
+    cache.set('k', 'old')
+    time.sleep(0.02)
+    refreshed = threading.Event()
+
+    def loader():
+        refreshed.set()
+        return 'new'
+    assert cache.get_or_load('k', loader) == 'old'
+    assert refreshed.wait(2)
+    deadline = time.monotonic() + 2
+    while cache.get('k') != 'new' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get('k') == 'new'
+    assert cache.stats()['stale_hits'] == 1
+
+
+def test_concurrent_misses_load_once():
+    cache = TTLCache(ttl=60)
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(2)
+        return 'v'
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('k', loader))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)  # 让其余调用都在等同一把锁
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results == ['v'] * 8
+    assert len(calls) == 1
+    assert cache._key_locks == {}
+
+
+def test_late_caller_shares_lock_with_waiter():
+    # A 加载失败（不缓存）并释放锁后 B 开始加载；这时到来的 C 必须等 B，而不是新建一把锁并发回源
+    cache = TTLCache(ttl=60)
+    active = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def loader():
+        with lock:
+            active.append(1)
+            if len(active) > 1:
+                overlaps.append(len(active))
+        time.sleep(0.1)
+        with lock:
+            active.pop()
+        return None
+
+    def call():
+        cache.get_or_load('k', loader, cacheable=lambda v: v is not None)
+    threads = []
+    for gap in (0, 0.05, 0.1):  # A 在 0 秒、B 在 A 加载中、C 在 B 加载中到来
+        time.sleep(gap)
+        t = threading.Thread(target=call)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join(5)
+    assert overlaps == []
+    assert cache._key_locks == {}
+
+
+def test_loader_error_releases_key_lock():
+    cache = TTLCache()
+
+    def loader():
+        raise RuntimeError('boom')
+    try:
+        cache.get_or_load('k', loader)
+    except RuntimeError:
+        pass
+    assert cache._key_locks == {}
@@ -0,0 +1,105 @@
+import threading
+import time
+from contextlib import ExitStack
+
+import pytest
+
+import web_downloader as wd
+from download_pipeline import SongUrl
+from upstream_qos import BULK, INTERACTIVE, PriorityGate
+
+
+def enter_later(gate, lane, entered, release):
+    def target():
+        with gate.slot(lane):
+            entered.set()
+            release.wait(5)
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    return t
+
+
+def test_bulk_cannot_use_reserved_connections():
+    gate = PriorityGate(max_connections=3, reserved=1, bulk_bps_under_load=0)
+    release = threading.Event()
+    bulk = [threading.Event() for _ in range(3)]
+    for entered in bulk:
+        enter_later(gate, BULK, entered, release)
+    assert bulk[0].wait(1) and bulk[1].wait(1)
+    assert not bulk[2].wait(0.1)
+    interactive = threading.Event()
+    enter_later(gate, INTERACTIVE, interactive, release)
+    assert interactive.wait(1)
+    release.set()
+    assert bulk[2].wait(1)
+
+
+def test_waiting_interactive_goes_before_bulk():
+    gate = PriorityGate(max_connections=1, reserved=0, bulk_bps_under_load=0)
+    release_first, release_rest = threading.Event(), threading.Event()
+    first = threading.Event()
+    enter_later(gate, BULK, first, release_first)
+    assert first.wait(1)
+    interactive, bulk = threading.Event(), threading.Event()
+    enter_later(gate, INTERACTIVE, interactive, release_rest)
+    while not gate.stats()['waiting'][INTERACTIVE]:
+        time.sleep(0.01)
+    enter_later(gate, BULK, bulk, release_rest)
+    release_first.set()
+    assert interactive.wait(1)
+    assert not bulk.is_set()
+    release_rest.set()
+    assert bulk.wait(1)
+
+
+def test_stream_throttles_bulk_without_using_a_connection():
+    gate = PriorityGate(max_connections=1, reserved=0, bulk_bps_under_load=1024 * 1024)
+    with gate.stream(INTERACTIVE):
+        assert gate.interactive_busy()
+        with gate.slot(BULK):
+            gate.throttle(BULK, 1024)
+        gate.throttle(INTERACTIVE, 1024)
+    assert gate.throttled_seconds == pytest.approx(1 / 1024)
+    assert not gate.interactive_busy()
+
+
+class FakeAudio:
+    def __init__(self, status):
+        self.status_code = status
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f'HTTP {self.status_code}')
+
+    def close(self):
+        self.closed = True
+
+
+def test_open_audio_holds_connection_only_until_headers(monkeypatch):
+    gate = PriorityGate(max_connections=1, reserved=0, bulk_bps_under_load=0)
+    monkeypatch.setattr(wd, 'upstream_gate', gate)
+    responses = [FakeAudio(403), FakeAudio(206)]
+    monkeypatch.setattr(wd.requests, 'get', lambda url, **kwargs: responses.pop(0))
+
+    def refresh(song_id, levels, refresh=False):
+        # 重新获取链接本身也要占用一个连接名额
+        with gate.slot(INTERACTIVE):
+            return SongUrl(url='http://cdn/new', size=1, br=0, md5='', type='mp3', level='standard')
+    monkeypatch.setattr(wd, 'cached_song_url', refresh)
+    old = SongUrl(url='http://cdn/old', size=1, br=0, md5='', type='mp3', level='standard')
+    result = {}
+    stack = ExitStack()
+
+    def target():
+        result['audio'] = wd.open_audio(1, old, ('standard',), 100, stack)
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(5)
+    assert not t.is_alive(), '重新获取链接时死锁'
+    r, skip = result['audio']
+    assert (r.status_code, skip) == (206, 0)
+    stats = gate.stats()
+    assert stats['active'][INTERACTIVE] == 0 and stats['streams'][INTERACTIVE] == 1
+    stack.close()
+    assert r.closed and gate.stats()['streams'][INTERACTIVE] == 0
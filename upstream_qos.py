@@ -0,0 +1,111 @@
+import threading
+import time
+from contextlib import contextmanager
+
+INTERACTIVE = 'interactive'  # 试听、单曲下载、页面发起的 API 请求
+BULK = 'bulk'                # 后台歌单任务
+
+_local = threading.local()
+
+@contextmanager
+def use_lane(lane):
+    """在当前线程中指定后续上游请求使用的通道"""
+    previous = getattr(_local, 'lane', None)
+    _local.lane = lane
+    try:
+        yield
+    finally:
+        _local.lane = previous
+
+def thread_lane():
+    """:return: 当前线程通过 use_lane 指定的通道，没有指定返回 None"""
+    return getattr(_local, 'lane', None)
+
+def with_lane(lane, func):
+    """包装函数，使其（在任意线程中被调用时）使用指定通道"""
+    def wrapper(*args, **kwargs):
+        with use_lane(lane):
+            return func(*args, **kwargs)
+    return wrapper
+
+class PriorityGate:
+    """
+    上游连接调度：所有到网易云 API / 音频 CDN 的连接分两个通道
+    - 交互通道可以使用任意空闲连接，另有 reserved 个连接只留给交互通道
+    - 批量通道只能使用其余连接；有交互请求在等待时不再发放新连接
+    - 有交互连接在进行时，批量下载按 bulk_bps_under_load 限速，把带宽让给交互请求
+    """
+    def __init__(self, max_connections=6, reserved=2, bulk_bps_under_load=256 * 1024):
+        self.max_connections = max_connections
+        self.reserved = min(reserved, max_connections - 1)
+        self.bulk_bps_under_load = bulk_bps_under_load
+        self._cond = threading.Condition()
+        self._active = {INTERACTIVE: 0, BULK: 0}
+        self._waiting = {INTERACTIVE: 0, BULK: 0}
+        self._streams = {INTERACTIVE: 0, BULK: 0}
+        self.throttled_seconds = 0.0
+        self.waits = {INTERACTIVE: 0.0, BULK: 0.0}
+
+    def _can_enter(self, lane):
+        total = self._active[INTERACTIVE] + self._active[BULK]
+        if lane == INTERACTIVE:
+            return total < self.max_connections
+        return (total < self.max_connections and self._waiting[INTERACTIVE] == 0
+                and self._active[BULK] < self.max_connections - self.reserved)
+
+    @contextmanager
+    def slot(self, lane):
+        """占用一个上游连接，退出时释放"""
+        start = time.perf_counter()
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while not self._can_enter(lane):
+                    self._cond.wait()
+            finally:
+                self._waiting[lane] -= 1
+            self._active[lane] += 1
+            self.waits[lane] += time.perf_counter() - start
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[lane] -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def stream(self, lane):
+        """
+        登记一个不占用连接名额的上游音频流（试听/代理下载建立连接后的传输阶段）：不等待也不受 max_connections 限制，
+        交互通道的流只用于让批量下载在试听期间限速
+        """
+        with self._cond:
+            self._streams[lane] += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._streams[lane] -= 1
+
+    def interactive_busy(self):
+        return self._active[INTERACTIVE] > 0 or self._waiting[INTERACTIVE] > 0 or self._streams[INTERACTIVE] > 0
+
+    def throttle(self, lane, nbytes):
+        """
+        批量下载每读完一块调用一次：有交互请求时按限速补足耗时，交互请求结束后立即恢复全速
+        """
+        if lane != BULK or not self.bulk_bps_under_load or not self.interactive_busy():
+            return
+        delay = nbytes / self.bulk_bps_under_load
+        self.throttled_seconds += delay
+        time.sleep(delay)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': dict(self._active),
+                'waiting': dict(self._waiting),
+                'streams': dict(self._streams),
+                'wait_seconds': {lane: round(v, 3) for lane, v in self.waits.items()},
+                'bulk_throttled_seconds': round(self.throttled_seconds, 3),
+            }
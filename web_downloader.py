@@ -1,32 +1,110 @@
 import os
 import re
+import sys
 import threading
 import requests
-from flask import Flask, render_template_string, request, jsonify, Response, stream_with_context, session, make_response, send_from_directory
+from download_pipeline import (EXPIRED_STATUS, ByteProgress, DiskSpaceError, PipelineError, UrlExpiredError,
+                               compact_track, preflight, resolve_levels, run_pipeline)
+from job_store import JobStore, default_worker_id
+from content_store import ContentStore, IntegrityError
+from playlist_cache import PlaylistCache, covers_fields, project_fields
+from static_assets import IMMUTABLE_MAX_AGE, StaticAssets
+from job_events import EventLog, TransferTimer
+from upstream_qos import BULK, INTERACTIVE, PriorityGate, thread_lane, use_lane, with_lane
+from id3_tagger import TagStage, tags_from_track
+from flask import Flask, request, jsonify, Response, stream_with_context, session, make_response, send_from_directory, send_file, g, has_request_context
 import time
 import urllib.parse
 import json
+import hashlib
+import gzip
+import unicodedata
+import cProfile
+import io
+import pstats
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import brotli  # 可选依赖，未安装时只提供 gzip
+except ImportError:
+    brotli = None
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)  # /static 由下面的 serve_static 提供（带指纹和压缩）
 app.secret_key = 'your_secret_key'
 
 # 下载保存目录
 SAVE_DIR = os.path.join(os.getcwd(), 'Music_DownLoad')
 os.makedirs(SAVE_DIR, exist_ok=True)
+# 内容库：同一首歌只下载一次，其它位置用硬链接
+content_store = ContentStore(os.path.join(SAVE_DIR, '.store'))
 
-# 全局任务队列和状态
-download_queue = []  # [{'type': 'song'/'playlist', 'id': xxx, 'info': {...}}]
-progress = {
-    'status': 'idle',  # idle, downloading, done, error
-    'current': 0,
-    'total': 0,
-    'msg': '',
-    'detail': '',
-    'now': None  # 当前下载歌曲/歌单信息
-}
+# 任务队列持久化在 jobs.db（见 job_store.py），重启后自动继续未完成的任务
+job_store = JobStore(os.path.join(os.getcwd(), 'jobs.db'))
+worker_thread = None
+song_worker_thread = None  # 单曲任务单独一个线程，不排在歌单任务后面
+worker_lock = threading.Lock()
+# 任务和每首歌的生命周期事件（JSONL），用 analyze_events.py 分析
+event_log = EventLog(os.path.join(os.getcwd(), 'logs', 'job_events.jsonl'))
+
+# 本进程的标识和任务租约：进程退出后租约到期，未完成的任务由其它进程接手
+WORKER_ID = default_worker_id()
+JOB_LEASE_SECONDS = 60
+WORKER_POLL_SECONDS = 2  # 独立下载进程（--worker）没有任务时的轮询间隔
+lease_watch_pid = None  # 已恢复任务并启动租约巡检的进程号（gunicorn --preload 等导入后再 fork，子进程需各自启动）
 
 API_BASE = 'https://163api.qijieya.cn'
 SONGS_PER_REQUEST = 1000  # 每次请求歌单歌曲的最大数量
+DOWNLOAD_WORKERS = 2  # 歌单任务的并行下载线程数
+ID3_TAGGING = False  # 下载完成后是否写入 ID3 标签和封面（在单独的进程池中进行）
+# 歌单任务先列出全部歌曲、按文件大小检查剩余空间再开始下载，并显示按字节的进度；
+# 预检要先获取全部下载链接，下载时再获取一次，/song/url 请求量翻倍且要等列完才开始下载，默认关闭（边列边下）
+PREFLIGHT = False
+DISK_RESERVE_BYTES = 200 * 1024 * 1024  # 预检时下载完成后至少保留的剩余空间
+# 音质等级（/song/url/v1 的 level）：standard < higher < exhigh < lossless < hires
+PREVIEW_LEVEL = 'standard'  # 试听用低码率，省带宽、起播快
+DOWNLOAD_LEVELS = ('exhigh', 'higher', 'standard')  # 下载按顺序尝试，前一个等级拿不到链接时降级
+UPGRADE_QUALITY = False  # 已下载的文件码率低于本次可获取的码率时重新下载替换
+# 上游连接调度：试听/单曲下载/页面请求走交互通道，歌单任务走批量通道（见 upstream_qos.py）
+UPSTREAM_CONNECTIONS = 6  # 本进程同时打开的上游连接上限
+INTERACTIVE_RESERVED = 2  # 只留给交互通道的连接数
+BULK_BPS_UNDER_LOAD = 256 * 1024  # 有交互请求时每个批量下载的限速（字节/秒）
+upstream_gate = PriorityGate(UPSTREAM_CONNECTIONS, INTERACTIVE_RESERVED, BULK_BPS_UNDER_LOAD)
+tag_stage = TagStage(content_store.tmp_dir, processes=2) if ID3_TAGGING else None
+
+# ----------------- 请求耗时统计 -----------------
+
+SLOW_REQUEST_MS = 1000  # 超过该耗时的请求写入慢请求日志
+SLOW_LOG_PATH = os.path.join(os.getcwd(), 'logs', 'slow_requests.jsonl')
+os.makedirs(os.path.dirname(SLOW_LOG_PATH), exist_ok=True)
+slow_log_lock = threading.Lock()
+# /debug/profile 会在服务端执行任意页面请求并返回 cProfile 结果，只在显式开启时可用
+PROFILER_ENABLED = os.environ.get('NETEASE_PROFILER') == '1'
+
+@contextmanager
+def timed(name):
+    """记录当前请求中某个阶段的耗时，同名阶段累加；不在请求上下文中（后台线程）时不记录"""
+    if not has_request_context() or 'timings' not in g:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        total, count = g.timings.get(name, (0.0, 0))
+        g.timings[name] = (total + (time.perf_counter() - start) * 1000, count + 1)
+
+def current_lane():
+    # 显式指定的通道优先；页面请求（含试听）走交互通道，后台线程默认走批量通道
+    lane = thread_lane()
+    if lane:
+        return lane
+    return INTERACTIVE if has_request_context() else BULK
+
+def upstream_get(name, url, **kwargs):
+    # 计时包含等待上游连接的时间
+    with timed(name), upstream_gate.slot(current_lane()):
+        return requests.get(url, **kwargs)
 
 # 工具函数
 
@@ -42,73 +120,324 @@ def sanitize_filename(name):
     return ''.join(c for c in name if c not in '\\/:*?\"<>|')
 
 def get_song_detail(song_id):
-    url = f"{API_BASE}/song/detail?ids={song_id}"
-    resp = requests.get(url)
-    data = resp.json()
-    if 'songs' in data and data['songs']:
-        return data['songs'][0]
-    return None
+    songs = get_song_details([song_id])
+    return songs[0] if songs else None
 
-def get_playlist_detail(playlist_id):
+def get_playlist_detail(playlist_id, headers=None):
     url = f"{API_BASE}/playlist/detail?id={playlist_id}"
-    resp = requests.get(url)
+    resp = upstream_get('playlist_detail', url, headers=headers)
     data = resp.json()
     if 'playlist' in data:
         return data['playlist']
     return None
 
-def get_all_tracks(playlist_id):
-    tracks = []
-    offset = 0
-    while True:
-        url = f"{API_BASE}/playlist/track/all?id={playlist_id}&limit={SONGS_PER_REQUEST}&offset={offset}"
-        resp = requests.get(url)
-        data = resp.json()
-        if 'songs' not in data or not data['songs']:
-            break
-        tracks.extend(data['songs'])
-        if len(data['songs']) < SONGS_PER_REQUEST:
-            break
-        offset += SONGS_PER_REQUEST
-    return tracks
-
-def get_song_urls(song_ids):
-    urls = {}
-    for i in range(0, len(song_ids), 100):
-        batch = song_ids[i:i+100]
-        ids_str = ','.join(str(sid) for sid in batch)
-        url = f"{API_BASE}/song/url?id={ids_str}"
-        resp = requests.get(url)
-        data = resp.json()
-        for item in data.get('data', []):
-            urls[item['id']] = item['url']
-    return urls
-
-def download_song(song, url):
-    artist = song['ar'][0]['name']
-    name = song['name']
-    filename = sanitize_filename(f"{artist}-{name}.mp3")
-    filepath = os.path.join(SAVE_DIR, filename)
-    if os.path.exists(filepath):
-        return f"[已存在] {filename}"
-    if not url:
+def fetch_song_url_items(song_ids, level):
+    params = {'id': ','.join(str(sid) for sid in song_ids), 'level': level}
+    resp = upstream_get('song_url', f"{API_BASE}/song/url/v1", params=params)
+    return resp.json().get('data') or []
+
+def get_song_urls(song_ids, levels=None):
+    # levels 默认为下载音质；试听传入 (PREVIEW_LEVEL,)
+    return resolve_levels(song_ids, levels or DOWNLOAD_LEVELS, fetch_song_url_items)
+
+def song_filepath(track, ext='mp3'):
+    filename = sanitize_filename(f"{track.artist}-{track.name}.{ext}")
+    return filename, os.path.join(SAVE_DIR, filename)
+
+def upgrade_from(track, song_url):
+    """:return: 已下载文件的码率（低于本次可获取的码率时），否则 0"""
+    if not song_url:
+        return 0
+    stored_br, _ = content_store.quality(track.id)
+    return stored_br if 0 < stored_br < song_url.br else 0
+
+def needs_download(track):
+    filename, filepath = song_filepath(track)
+    return not os.path.exists(filepath) and not content_store.lookup(track.id)
+
+def queue_tagging(track, blob_path, filepath):
+    # 带标签的文件另存为这首歌自己的内容库文件（不改共用的原文件），filepath 改为链接到它；已写过的不再重复；ID3 只用于 mp3
+    if tag_stage is None or not blob_path.endswith('.mp3') or content_store.is_tagged(track.id):
+        return
+    tag_stage.submit(blob_path, tags_from_track(track),
+                     on_done=lambda result: content_store.commit_tagged(track.id, blob_path, result['tmp_path'],
+                                                                        result['sha256'], result['size'], [filepath]))
+
+def download_song(track, song_url):
+    ext = song_url.type if song_url else 'mp3'
+    filename, filepath = song_filepath(track, ext)
+    old_br = upgrade_from(track, song_url)
+    upgrade = bool(old_br) and UPGRADE_QUALITY
+    if os.path.exists(filepath) and not upgrade:
+        event_log.note(outcome='exists')
+        hint = f" (可升级: {old_br // 1000}k → {song_url.br // 1000}k)" if old_br else ''
+        return f"[已存在] {filename}{hint}"
+    blob_path = None if upgrade else content_store.lookup(track.id)
+    if blob_path and blob_path.endswith(f'.{ext}'):
+        # 其它歌单/文件名已下载过这首歌，直接链接，不再下载
+        content_store.link(blob_path, filepath)
+        queue_tagging(track, blob_path, filepath)
+        event_log.note(outcome='reused')
+        return f"[复用] {filename}"
+    if not song_url:
+        event_log.note(outcome='skipped')
         return f"[跳过] {filename} (无下载链接)"
+    timer = TransferTimer(event_log)
+    lane = current_lane()
     try:
-        with requests.get(url, stream=True) as r:
+        with upstream_gate.slot(lane), requests.get(song_url.url, stream=True) as r:
+            if r.status_code in EXPIRED_STATUS:
+                raise UrlExpiredError(f'HTTP {r.status_code}')
             r.raise_for_status()
-            with open(filepath, 'wb') as f:
+            # 按 Content-Length（没有时用 /song/url 返回的大小）和 md5 在写入的同时校验，不再重读文件
+            expected_length = 0 if r.headers.get('content-encoding') else int(r.headers.get('content-length') or 0)
+            with content_store.writer(track.id, song_url.size, ext, song_url.br, song_url.level) as blob:
                 for chunk in r.iter_content(chunk_size=8192):
                     if chunk:
-                        f.write(chunk)
+                        blob.write(chunk)
+                        timer.update(len(chunk))
+                        upstream_gate.throttle(lane, len(chunk))
+                blob_path = blob.commit(expected_length or song_url.size, song_url.md5)
+        timer.finish()
+        content_store.link(blob_path, filepath)
+        queue_tagging(track, blob_path, filepath)
+        event_log.note(outcome='downloaded', br=song_url.br, level=song_url.level)
+        if upgrade:
+            return f"[完成] {filename} (音质升级: {old_br // 1000}k → {song_url.br // 1000}k)"
         return f"[完成] {filename}"
+    except IntegrityError:
+        # 文件已隔离，由流水线重新下载
+        timer.finish()
+        raise
+    except UrlExpiredError:
+        raise
     except Exception as e:
+        timer.finish()
+        event_log.note(outcome='failed', error=type(e).__name__)
         return f"[失败] {filename}: {e}"
 
-def search_api(keyword, stype):
-    url = f"{API_BASE}/search?keywords={keyword}&type={stype}"
-    resp = requests.get(url)
+def search_api(keyword, stype, limit=30, offset=0):
+    params = {'keywords': keyword, 'type': stype, 'limit': limit, 'offset': offset}
+    resp = upstream_get('search', f"{API_BASE}/search", params=params)
     return resp.json()
 
+# ----------------- 缓存 -----------------
+
+class TTLCache:
+    """
+    带过期时间的 LRU 缓存
+    - 超过 ttl 但未超过 ttl+stale_ttl 的条目先返回旧值，同时后台刷新（stale-while-revalidate）
+    - 同一个 key 的并发未命中只回源一次
+    """
+    def __init__(self, maxsize=256, ttl=300, stale_ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self._key_locks = {}  # key -> [锁, 等待/持有该锁的调用数]，计数归零才删除
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key, now):
+        # 调用方需持有 self._lock；返回 (value, 'fresh'/'stale') 或 (None, None)
+        entry = self._data.get(key)
+        if entry is None:
+            return None, None
+        value, stored_at = entry
+        age = now - stored_at
+        if age < self.ttl:
+            self._data.move_to_end(key)
+            return value, 'fresh'
+        if age < self.ttl + self.stale_ttl:
+            self._data.move_to_end(key)
+            return value, 'stale'
+        del self._data[key]
+        return None, None
+
+    def get(self, key):
+        with self._lock:
+            value, state = self._lookup(key, time.monotonic())
+            if state == 'fresh':
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader, cacheable=None):
+        with self._lock:
+            value, state = self._lookup(key, time.monotonic())
+            if state == 'fresh':
+                self.hits += 1
+                return value
+            if state == 'stale':
+                self.stale_hits += 1
+                refresh = key not in self._refreshing
+                if refresh:
+                    self._refreshing.add(key)
+            else:
+                self.misses += 1
+                key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+                key_lock[1] += 1
+        if state == 'stale':
+            if refresh:
+                threading.Thread(target=self._refresh, args=(key, loader, cacheable), daemon=True).start()
+            return value
+        try:
+            with key_lock[0]:
+                # 等锁期间可能已被其它请求加载
+                with self._lock:
+                    value, state = self._lookup(key, time.monotonic())
+                if state != 'fresh':
+                    value = loader()
+                    if cacheable is None or cacheable(value):
+                        self.set(key, value)
+        finally:
+            # 还有调用在等这把锁时不能删除，否则后来的调用会新建一把锁并重复回源
+            with self._lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self._key_locks[key]
+        return value
+
+    def _refresh(self, key, loader, cacheable):
+        try:
+            value = loader()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+        except Exception:
+            app.logger.exception('缓存后台刷新失败: %s', key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+            }
+
+SEARCH_CACHE_TTL = 300  # 搜索结果新鲜期（秒）
+SEARCH_CACHE_STALE_TTL = 1800  # 过期后仍可先返回旧值、后台刷新的时长（秒）
+search_cache = TTLCache(maxsize=512, ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL)
+
+def normalize_search_key(keyword, stype, limit=30, offset=0):
+    # 全角转半角、合并空白、忽略大小写，让"周杰伦 "和"周杰伦"命中同一条缓存
+    keyword = ' '.join(unicodedata.normalize('NFKC', keyword or '').split()).lower()
+    try:
+        stype = int(stype)
+    except (TypeError, ValueError):
+        stype = 1
+    try:
+        limit = min(max(int(limit), 1), 100)
+    except (TypeError, ValueError):
+        limit = 30
+    try:
+        offset = max(int(offset), 0)
+    except (TypeError, ValueError):
+        offset = 0
+    return keyword, stype, limit, offset
+
+def cached_search(keyword, stype, limit=30, offset=0):
+    key = normalize_search_key(keyword, stype, limit, offset)
+    return search_cache.get_or_load(
+        key,
+        lambda: search_api(*key),
+        cacheable=lambda data: isinstance(data, dict) and data.get('code') == 200,
+    )
+
+DETAIL_BATCH_SIZE = 100  # 每次 /song/detail 请求的最大ID数
+detail_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='song-detail')
+
+def fetch_song_details(song_ids):
+    """分批并行请求 /song/detail，按传入顺序返回找到的歌曲"""
+    song_ids = [int(sid) for sid in song_ids]
+    batches = [song_ids[i:i+DETAIL_BATCH_SIZE] for i in range(0, len(song_ids), DETAIL_BATCH_SIZE)]
+    lane = current_lane()
+    def fetch(batch):
+        with upstream_gate.slot(lane):
+            resp = requests.get(f'{API_BASE}/song/detail', params={'ids': ','.join(str(sid) for sid in batch)})
+        return resp.json().get('songs') or []
+    by_id = {}
+    # 各批在线程池中并行请求，耗时按整体计入当前请求
+    with timed('song_detail'):
+        for songs in detail_pool.map(fetch, batches):
+            for song in songs:
+                by_id[song['id']] = song
+    return [by_id[sid] for sid in song_ids if sid in by_id]
+
+SONG_DETAIL_TTL = 3600  # 歌曲详情（歌名、歌手、封面）变化很少，缓存一小时
+song_detail_cache = TTLCache(maxsize=20000, ttl=SONG_DETAIL_TTL, stale_ttl=0)
+
+def get_song_details(song_ids):
+    """
+    按歌曲ID逐个查缓存，只请求缺失的ID（分批并行），结果按传入顺序合并返回
+    """
+    song_ids = [int(sid) for sid in song_ids]
+    found = {}
+    missing = []
+    for sid in song_ids:
+        if sid in found:
+            continue
+        song = song_detail_cache.get(sid)
+        if song is not None:
+            found[sid] = song
+        elif sid not in missing:
+            missing.append(sid)
+    if missing:
+        for song in fetch_song_details(missing):
+            song_detail_cache.set(song['id'], song)
+            found[song['id']] = song
+    return [found[sid] for sid in song_ids if sid in found]
+
+def parse_song_ids(raw):
+    # 兼容 "1,2,3"、"[1, 2, 3]" 等写法，忽略非数字项
+    return [int(part) for part in re.findall(r'\d+', raw or '')]
+
+def compact_search_song(song, detail=None):
+    artists = song.get('artists') or song.get('ar') or []
+    album = song.get('album') or song.get('al') or {}
+    cover = ((detail or {}).get('al') or {}).get('picUrl') or album.get('picUrl') or ''
+    return {
+        'id': song['id'],
+        'name': song.get('name', ''),
+        'artist': '/'.join(a.get('name', '') for a in artists),
+        'album': album.get('name', ''),
+        'cover': cover,
+        'duration': song.get('duration') or song.get('dt') or (detail or {}).get('dt'),
+    }
+
+song_search_cache = TTLCache(maxsize=512, ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL)
+
+def search_songs_with_covers(keyword, limit=30, offset=0):
+    key = normalize_search_key(keyword, 1, limit, offset)
+    def load():
+        data = cached_search(*key)
+        result = data.get('result') or {}
+        songs = result.get('songs') or []
+        if data.get('code') != 200:
+            return {'code': data.get('code'), 'msg': data.get('msg') or data.get('message', ''), 'songs': []}
+        details = {d['id']: d for d in get_song_details([song['id'] for song in songs])} if songs else {}
+        return {
+            'code': 200,
+            'total': result.get('songCount', len(songs)),
+            'songs': [compact_search_song(song, details.get(song['id'])) for song in songs],
+        }
+    return song_search_cache.get_or_load(key, load, cacheable=lambda data: data.get('code') == 200)
+
 COOKIE_DIR = os.path.join(os.getcwd(), 'cookies')
 os.makedirs(COOKIE_DIR, exist_ok=True)
 
@@ -122,6 +451,10 @@ def set_user_key(uniqid):
     session.permanent = True
 
 def get_cookie():
+    with timed('cookie'):
+        return read_cookie()
+
+def read_cookie():
     uniqid = get_user_key()
     if not uniqid:
         return ''
@@ -143,21 +476,73 @@ def get_cookie():
 def make_session_permanent():
     session.permanent = True
 
+@app.before_request
+def start_background():
+    if lease_watch_pid != os.getpid():
+        start_background_jobs()
+
+@app.before_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    g.timings = {}
+
+@app.after_request
+def add_server_timing(resp):
+    if 'request_start' not in g:
+        return resp
+    total_ms = (time.perf_counter() - g.request_start) * 1000
+    upstream_ms = sum(ms for ms, _ in g.timings.values())
+    entries = [f'{name};dur={ms:.1f};desc="x{count}"' for name, (ms, count) in g.timings.items()]
+    entries.append(f'app;dur={max(total_ms - upstream_ms, 0):.1f}')
+    entries.append(f'total;dur={total_ms:.1f}')
+    resp.headers['Server-Timing'] = ', '.join(entries)
+    if total_ms >= SLOW_REQUEST_MS:
+        record = {
+            'ts': time.time(),
+            'method': request.method,
+            'path': request.full_path,
+            'status': resp.status_code,
+            'total_ms': round(total_ms, 1),
+            'timings': {name: {'ms': round(ms, 1), 'count': count} for name, (ms, count) in g.timings.items()},
+        }
+        with slow_log_lock, open(SLOW_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return resp
+
+@app.route('/debug/profile')
+def debug_profile():
+    # 用 cProfile 执行一次指定请求（带上当前用户的 Cookie），返回按累计耗时排序的统计
+    if not PROFILER_ENABLED:
+        return '性能分析未开启，请设置环境变量 NETEASE_PROFILER=1 后重启', 404
+    path = request.args.get('path', '')
+    if not path.startswith('/') or path.startswith('/debug/profile'):
+        return '参数 path 需为站内路径，如 /api/playlist_tracks?id=123', 400
+    profiler = cProfile.Profile()
+    client = app.test_client()
+    profiler.enable()
+    inner = client.get(path, headers={'Cookie': request.headers.get('Cookie', '')})
+    inner.get_data()
+    profiler.disable()
+    out = io.StringIO()
+    out.write(f'{path} -> {inner.status_code}\nServer-Timing: {inner.headers.get("Server-Timing", "")}\n\n')
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(request.args.get('limit', 40, type=int))
+    return Response(out.getvalue(), content_type='text/plain; charset=utf-8')
+
 @app.route('/api/qr_key')
 def qr_key():
-    resp = requests.get(f'{API_BASE}/login/qr/key', params={'timestamp': int(time.time()*1000)})
+    resp = upstream_get('qr', f'{API_BASE}/login/qr/key', params={'timestamp': int(time.time()*1000)})
     return jsonify(resp.json())
 
 @app.route('/api/qr_create')
 def qr_create():
     key = request.args.get('key')
-    resp = requests.get(f'{API_BASE}/login/qr/create', params={'key': key, 'qrimg': 'true', 'timestamp': int(time.time()*1000)})
+    resp = upstream_get('qr', f'{API_BASE}/login/qr/create', params={'key': key, 'qrimg': 'true', 'timestamp': int(time.time()*1000)})
     return jsonify(resp.json())
 
 @app.route('/api/qr_check')
 def qr_check():
     key = request.args.get('key')
-    resp = requests.get(f'{API_BASE}/login/qr/check', params={'key': key, 'timestamp': int(time.time()*1000)})
+    resp = upstream_get('qr', f'{API_BASE}/login/qr/check', params={'key': key, 'timestamp': int(time.time()*1000)})
     data = resp.json()
     if data.get('code') == 803 and 'cookie' in data:
         uniqid = str(int(time.time() * 1000)) + '_' + key
@@ -174,114 +559,717 @@ def user_account():
     print('当前cookie:', get_cookie())
     cookies = get_cookie()
     headers = {'Cookie': cookies}
-    resp = requests.get(f'{API_BASE}/user/account', headers=headers)
+    resp = upstream_get('user_account', f'{API_BASE}/user/account', headers=headers)
     return jsonify(resp.json())
 
+def iter_playlist_track_pages(pid, headers, limit=1000, first_limit=None, offset=0):
+    """逐页获取歌单歌曲，每拿到一页就 yield 一次；first_limit 可让第一页更小以便尽快返回"""
+    page_limit = first_limit or limit
+    while True:
+        resp = upstream_get('playlist_page', f'{API_BASE}/playlist/track/all', params={'id': pid, 'limit': page_limit, 'offset': offset}, headers=headers)
+        data = resp.json()
+        if 'songs' not in data or not data['songs']:
+            break
+        yield data['songs']
+        if len(data['songs']) < page_limit:
+            break
+        offset += page_limit
+        page_limit = limit
+
+# 歌单歌曲列表缓存：先用一次 /playlist/detail 判断歌单是否有变化，没变时不再翻页
+playlist_cache = PlaylistCache(os.path.join(os.getcwd(), 'cache', 'playlists'))
+
+def playlist_pages(pid, headers, limit=1000, first_limit=None, offset=0, cached=True):
+    """
+    同 iter_playlist_track_pages，歌单未变化时从缓存返回
+    详情请求使用调用方的 cookie，请求失败（如无权查看的私人歌单）时不读缓存，直接翻页
+    :param cached: 为 False 时不读写缓存（需要缓存中没有保留的字段时）
+    """
+    if not cached:
+        return iter_playlist_track_pages(pid, headers, limit, first_limit, offset)
+    try:
+        version = PlaylistCache.version_of(get_playlist_detail(pid, headers))
+    except Exception:
+        version = None
+    return playlist_cache.pages(pid, version, lambda: iter_playlist_track_pages(pid, headers, limit, first_limit, offset),
+                                page_size=limit, offset=offset)
+
+def parse_fields(raw):
+    """把 fields=id,name,ar.name,al.picUrl 解析成嵌套字典 {'id': {}, 'ar': {'name': {}}, ...}"""
+    if not raw:
+        return None
+    tree = {}
+    for field in raw.split(','):
+        node = tree
+        for part in field.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree or None
+
 @app.route('/api/playlist_tracks')
 def playlist_tracks():
     pid = request.args.get('id')
+    fields = parse_fields(request.args.get('fields'))
     cookies = get_cookie()
     headers = {'Cookie': cookies}
+    # 缓存只保留部分字段，请求其它字段或完整歌曲对象时直接翻页
+    cached = covers_fields(fields)
+    if request.args.get('stream') in ('1', 'true', 'ndjson'):
+        # 流式模式：每行一首歌（NDJSON），每拿到一页就立即发送
+        def generate():
+            try:
+                for songs in playlist_pages(pid, headers, first_limit=100, cached=cached):
+                    yield ''.join(json.dumps(project_fields(song, fields), ensure_ascii=False) + '\n' for song in songs)
+            except Exception as e:
+                yield json.dumps({'error': str(e)}, ensure_ascii=False) + '\n'
+        return Response(generate(), content_type='application/x-ndjson; charset=utf-8')
     # 自动翻页获取全部歌曲
     all_tracks = []
-    offset = 0
-    limit = 1000
-    while True:
-        resp = requests.get(f'{API_BASE}/playlist/track/all', params={'id': pid, 'limit': limit, 'offset': offset}, headers=headers)
-        data = resp.json()
-        if 'songs' not in data or not data['songs']:
-            break
-        all_tracks.extend(data['songs'])
-        if len(data['songs']) < limit:
-            break
-        offset += limit
+    for songs in playlist_pages(pid, headers, cached=cached):
+        all_tracks.extend(project_fields(song, fields) for song in songs)
     return jsonify({'songs': all_tracks})
 
+# ----------------- 试听预取 -----------------
+
+# 页面渲染搜索结果/歌单/队列后，预先获取前几首的下载链接和音频开头，点试听时先从本地播放开头
+PREFETCH_ENABLED = False  # 默认关闭
+PREFETCH_TOP_N = 10  # 每次最多预取的歌曲数
+PREFETCH_HEAD_BYTES = 384 * 1024  # 每首预取的字节数（128kbps 约 24 秒）
+PREFETCH_BUDGET_BYTES = 64 * 1024 * 1024  # 预取缓存占用上限，超出后删除最久未用的
+SONG_URL_TTL = 300  # 下载链接缓存时间（秒），签名链接过期后会自动重新获取
+HEAD_DIR = os.path.join(os.getcwd(), 'cache', 'heads')
+os.makedirs(HEAD_DIR, exist_ok=True)
+song_url_cache = TTLCache(maxsize=2000, ttl=SONG_URL_TTL, stale_ttl=0)
+prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+prefetch_inflight = set()
+prefetch_lock = threading.Lock()
+
+def cached_song_url(song_id, levels, refresh=False):
+    song_id = int(song_id)
+    key = (song_id, tuple(levels))
+    if not refresh:
+        song_url = song_url_cache.get(key)
+        if song_url:
+            return song_url
+    song_url = get_song_urls([song_id], levels).get(song_id)
+    if song_url:
+        song_url_cache.set(key, song_url)
+    return song_url
+
+def head_path(song_id):
+    # 开头按试听音质缓存，只用于试听，剩余部分也必须按同一音质获取
+    return os.path.join(HEAD_DIR, f'{int(song_id)}.{PREVIEW_LEVEL}.head')
+
+def read_head(song_id):
+    path = head_path(song_id)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    os.utime(path)  # 记录使用时间，按最久未用淘汰
+    return data
+
+def trim_dir(directory, budget):
+    """目录中的文件总大小超过 budget 时，按修改时间（读取时会更新）删除最久未用的"""
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.tmp'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= budget:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+def trim_heads():
+    trim_dir(HEAD_DIR, PREFETCH_BUDGET_BYTES)
+
+def fetch_head(song_id, song_url):
+    # 预取属于投机性工作，走批量通道，不占用给试听预留的连接
+    with upstream_gate.slot(BULK), requests.get(song_url.url, stream=True, timeout=10,
+                                                headers={'Range': f'bytes=0-{PREFETCH_HEAD_BYTES - 1}'}) as r:
+        if r.status_code not in (200, 206):
+            return
+        data = bytearray()
+        for chunk in r.iter_content(chunk_size=8192):
+            data += chunk
+            if len(data) >= PREFETCH_HEAD_BYTES:
+                break
+    tmp_path = f'{head_path(song_id)}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(bytes(data[:PREFETCH_HEAD_BYTES]))
+    os.replace(tmp_path, head_path(song_id))
+
+def prefetch_batch(song_ids):
+    # 在线程池中执行，出错只记录日志；失败的歌曲不写入链接缓存和开头缓存，之后可以再次预取
+    try:
+        levels = (PREVIEW_LEVEL,)
+        missing = [sid for sid in song_ids if not song_url_cache.get((sid, levels))]
+        if missing:
+            try:
+                urls = get_song_urls(missing, levels)
+            except Exception:
+                app.logger.warning('预取下载链接失败: %s', missing, exc_info=True)
+                return
+            for sid, song_url in urls.items():
+                song_url_cache.set((sid, levels), song_url)
+        for sid in song_ids:
+            song_url = song_url_cache.get((sid, levels))
+            if song_url:
+                try:
+                    fetch_head(sid, song_url)
+                except Exception:
+                    app.logger.warning('预取 %s 失败', sid, exc_info=True)
+        trim_heads()
+    finally:
+        with prefetch_lock:
+            prefetch_inflight.difference_update(song_ids)
+
+@app.route('/api/prefetch', methods=['POST'])
+def api_prefetch():
+    if not PREFETCH_ENABLED:
+        return jsonify({'code': 200, 'enabled': False, 'queued': 0})
+    song_ids = parse_song_ids(','.join(str(sid) for sid in (request.get_json(silent=True) or {}).get('ids') or []))
+    with prefetch_lock:
+        todo = [sid for sid in song_ids if sid not in prefetch_inflight and not os.path.exists(head_path(sid))]
+        todo = todo[:PREFETCH_TOP_N]
+        prefetch_inflight.update(todo)
+    if todo:
+        prefetch_pool.submit(prefetch_batch, todo)
+    return jsonify({'code': 200, 'enabled': True, 'queued': len(todo)})
+
+def open_audio(song_id, song_url, levels, offset, stack):
+    """
+    打开音频流，从 offset 字节开始（Range 请求）；链接过期时重新获取一次
+    交互通道的连接名额只在建立连接、收到响应头期间占用（重新获取链接时已释放，不会嵌套占用），
+    之后音频流通过 upstream_gate.stream 登记（与 asgi_app 相同），长时间试听不占名额；
+    流的登记和响应本身都放在 stack 上，由调用方在响应关闭时释放
+    :return: (响应, 需要丢弃的开头字节数)，CDN 不支持 Range 时返回完整内容，需丢弃 offset 字节
+    """
+    for attempt in range(2):
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with upstream_gate.slot(INTERACTIVE):
+            r = requests.get(song_url.url, headers=headers, stream=True)
+        if r.status_code in EXPIRED_STATUS and attempt == 0:
+            r.close()
+            song_url = cached_song_url(song_id, levels, refresh=True)
+            if not song_url:
+                break
+            continue
+        stack.callback(r.close)
+        r.raise_for_status()
+        stack.enter_context(upstream_gate.stream(INTERACTIVE))
+        return r, (offset if offset and r.status_code == 200 else 0)
+    raise UrlExpiredError(f'{song_id} 下载链接失效')
+
+def skip_bytes(chunks, n):
+    for chunk in chunks:
+        if n >= len(chunk):
+            n -= len(chunk)
+            continue
+        yield chunk[n:]
+        n = 0
+
 @app.route('/proxy_download/<song_id>')
 def proxy_download(song_id):
-    url_api = f'{API_BASE}/song/url?id={song_id}'
-    resp = requests.get(url_api)
-    data = resp.json()
-    song_url = data['data'][0]['url']
+    # preview=1 为试听：使用低码率，可命中预取的开头；否则按下载音质
+    preview = request.args.get('preview') == '1'
+    levels = (PREVIEW_LEVEL,) if preview else DOWNLOAD_LEVELS
+    song_url = cached_song_url(song_id, levels)
     if not song_url:
         return '无法获取下载链接', 404
-    detail_api = f'{API_BASE}/song/detail?ids={song_id}'
-    detail = requests.get(detail_api).json()
-    song = detail['songs'][0]
+    song = get_song_detail(song_id)
+    if not song:
+        return '未找到该歌曲', 404
     artists = song.get('artists') or song.get('ar')
-    filename = f"{artists[0]['name']}-{song['name']}.mp3"
+    filename = f"{artists[0]['name']}-{song['name']}.{song_url.type}"
     quoted_filename = urllib.parse.quote(filename)
-    def generate():
-        with requests.get(song_url, stream=True) as r:
-            for chunk in r.iter_content(chunk_size=8192):
+    # 音频流传输期间登记为交互通道的流（批量下载随之限速），响应关闭时（包括客户端中途断开）注销
+    stack = ExitStack()
+    head = read_head(song_id) if PREFETCH_ENABLED and preview else None
+    if head:
+        # 已预取开头：立即返回本地缓存，播放开始后再从断点处连上游取剩余部分
+        def generate():
+            yield head
+            r, skip = open_audio(song_id, song_url, levels, len(head), stack)
+            yield from skip_bytes((chunk for chunk in r.iter_content(chunk_size=8192) if chunk), skip)
+    else:
+        # 先连上音频 CDN 再返回响应，连接耗时计入 Server-Timing
+        with timed('audio_connect'):
+            try:
+                upstream, _ = open_audio(song_id, song_url, levels, 0, stack)
+            except Exception:
+                stack.close()
+                raise
+        def generate():
+            for chunk in upstream.iter_content(chunk_size=8192):
                 if chunk:
                     yield chunk
     headers = {
         'Content-Disposition': f"attachment; filename*=UTF-8''{quoted_filename}"
     }
-    return Response(stream_with_context(generate()), headers=headers, content_type='audio/mpeg')
+    content_type = 'audio/flac' if song_url.type == 'flac' else 'audio/mpeg'
+    resp = Response(stream_with_context(generate()), headers=headers, content_type=content_type)
+    resp.call_on_close(stack.close)
+    return resp
+
+COVER_DIR = os.path.join(os.getcwd(), 'cache', 'covers')
+os.makedirs(COVER_DIR, exist_ok=True)
+COVER_SIZES = (64, 128, 256)  # 允许的缩略图边长，页面只显示 44~80px，足够覆盖高分屏
+COVER_MAX_AGE = 7 * 24 * 3600
+COVER_BUDGET_BYTES = 256 * 1024 * 1024  # 封面缓存占用上限，超出后删除最久未用的
+COVER_TRIM_EVERY = 100  # 每新缓存这么多张封面检查一次占用
+# 按 CDN 返回的 Content-Type 保存和返回封面，没有 Content-Type 时按 jpeg 处理
+COVER_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp', 'image/gif': '.gif'}
+COVER_MIMETYPES = {ext: mimetype for mimetype, ext in COVER_TYPES.items()}
+cover_locks = {}
+cover_locks_lock = threading.Lock()
+cover_etags = TTLCache(maxsize=4096, ttl=COVER_MAX_AGE, stale_ttl=0)  # path -> (mtime_ns, etag)
+cover_stores = [0]  # 新缓存的封面数，用于定期检查占用
+COVER_MISS_TTL = 60  # 无封面或拉取失败的结果缓存时间（秒），期间同一封面的请求不再回源
+cover_misses = TTLCache(maxsize=4096, ttl=COVER_MISS_TTL, stale_ttl=0)  # path -> 失败原因，无封面为 ''
+
+def cover_size(raw):
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        return 128
+    for allowed in COVER_SIZES:
+        if size <= allowed:
+            return allowed
+    return COVER_SIZES[-1]
+
+def cached_cover(base):
+    """
+    :param base: 不带扩展名的缓存路径
+    :return: 已缓存的封面路径；最近无封面返回 None；都没有返回 False。最近拉取失败时抛出 RuntimeError
+    """
+    for ext in COVER_MIMETYPES:
+        path = base + ext
+        try:
+            os.utime(path)  # 记录使用时间，按最久未用淘汰
+        except OSError:
+            continue
+        return path
+    missed = cover_misses.get(base)
+    if missed is None:
+        return False
+    if missed:
+        raise RuntimeError(missed)
+    return None
+
+def fetch_cover(song_id, size):
+    """从 CDN 拉取指定尺寸的封面写入磁盘缓存，返回文件路径（扩展名按图片类型）；无封面返回 None"""
+    base = os.path.join(COVER_DIR, f'{song_id}_{size}')
+    cached = cached_cover(base)
+    if cached is not False:
+        return cached
+    with cover_locks_lock:
+        lock = cover_locks.setdefault(base, threading.Lock())
+    try:
+        with lock:
+            # 等锁期间前一个请求可能已经拉到或确认没有封面
+            cached = cached_cover(base)
+            if cached is not False:
+                return cached
+            try:
+                songs = get_song_details([song_id])
+                pic_url = (songs[0].get('al') or {}).get('picUrl') if songs else None
+                if not pic_url:
+                    cover_misses.set(base, '')
+                    return None
+                # 网易云图片 CDN 支持 ?param=宽y高 直接返回缩放后的图片
+                resp = upstream_get('cover_cdn', pic_url, params={'param': f'{size}y{size}'}, timeout=10)
+                resp.raise_for_status()
+                content_type = (resp.headers.get('Content-Type') or 'image/jpeg').split(';')[0].strip().lower()
+                if content_type not in COVER_TYPES:
+                    raise RuntimeError(f'不支持的封面类型: {content_type}')
+            except Exception as e:
+                cover_misses.set(base, str(e) or type(e).__name__)
+                raise
+            path = base + COVER_TYPES[content_type]
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(resp.content)
+            os.replace(tmp_path, path)
+        with cover_locks_lock:
+            cover_stores[0] += 1
+            trim = cover_stores[0] % COVER_TRIM_EVERY == 0
+        if trim:
+            trim_dir(COVER_DIR, COVER_BUDGET_BYTES)
+        return path
+    finally:
+        with cover_locks_lock:
+            cover_locks.pop(base, None)
+
+def cover_etag(path):
+    mtime_ns = os.stat(path).st_mtime_ns
+    cached = cover_etags.get(path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    with open(path, 'rb') as f:
+        etag = hashlib.sha1(f.read()).hexdigest()
+    cover_etags.set(path, (mtime_ns, etag))
+    return etag
+
+def cover_mimetype(path):
+    return COVER_MIMETYPES.get(os.path.splitext(path)[1], 'image/jpeg')
+
+@app.route('/cover/<int:song_id>')
+def cover(song_id):
+    size = cover_size(request.args.get('s'))
+    try:
+        path = fetch_cover(song_id, size)
+    except Exception as e:
+        return f'封面获取失败: {e}', 502
+    if not path:
+        return '该歌曲没有封面', 404
+    resp = send_file(path, mimetype=cover_mimetype(path), etag=cover_etag(path), max_age=COVER_MAX_AGE, conditional=True)
+    resp.cache_control.public = True
+    return resp
 
 @app.route('/api/song_detail')
 def api_song_detail():
-    ids = request.args.get('ids')
-    resp = requests.get(f'{API_BASE}/song/detail?ids={ids}')
-    return jsonify(resp.json())
+    # 已缓存的ID直接返回，只向上游请求缺失部分；超长ID列表自动分批
+    song_ids = parse_song_ids(request.args.get('ids'))
+    return jsonify({'code': 200, 'songs': get_song_details(song_ids)})
 
 # 下载线程
 
-def download_worker():
-    while True:
-        if not download_queue:
-            progress.update({'status': 'idle', 'current': 0, 'total': 0, 'msg': '', 'now': None})
+def journaled_pages(job):
+    """先交出日志中已记录但未完成的歌曲，再从已记录的位置继续翻页，新列出的歌曲先写日志再下载"""
+    pending = job_store.pending_tracks(job['id'])
+    if pending:
+        yield pending
+    if job['listed']:
+        return
+    recorded, _ = job_store.track_counts(job['id'])
+    pages = playlist_pages(job['target_id'], {}, limit=SONGS_PER_REQUEST,
+                           first_limit=None if recorded else 100, offset=recorded)
+    for songs in pages:
+        tracks = [compact_track(song) for song in songs]
+        # 租约已失效时抛出 LeaseLostError，不再记录新页
+        yield job_store.add_tracks(job['id'], tracks, worker_id=WORKER_ID)
+    job_store.mark_listed(job['id'], worker_id=WORKER_ID)
+
+def preflight_job(job):
+    """
+    列出并记录整个歌单，按 /song/url 返回的文件大小检查剩余空间
+    :return: (待下载歌曲的页列表, ByteProgress)
+    """
+    pages = list(journaled_pages(job))
+    tracks = [track for page in pages for track in page]
+    sizes = preflight(tracks, get_song_urls, SAVE_DIR, needs_download, DISK_RESERVE_BYTES)
+    return pages, ByteProgress(sizes)
+
+def run_playlist_job(job, events, cancel=None):
+    """
+    :param cancel: threading.Event，租约失效时被设置，流水线随即停止，之后不再写入该任务
+    """
+    _, finished = job_store.track_counts(job['id'])
+    # 续传时从已完成的数量开始计
+    job_store.set_progress(job['id'], current=finished, total=finished, now=job['info'], msg='', worker_id=WORKER_ID)
+    byte_progress = None
+    pages = journaled_pages(job)
+    if PREFLIGHT:
+        job_store.set_progress(job['id'], msg='正在列出歌单并检查磁盘空间...', worker_id=WORKER_ID)
+        try:
+            pages, byte_progress = preflight_job(job)
+        except DiskSpaceError as e:
+            job_store.set_job_status(job['id'], 'error', str(e), worker_id=WORKER_ID)
+            return
+        except Exception as e:
+            job_store.set_job_status(job['id'], 'error', f'歌单获取失败: {e}', worker_id=WORKER_ID)
+            return
+        job_store.set_progress(job['id'], total=finished + sum(len(page) for page in pages), msg='',
+                               worker_id=WORKER_ID, **byte_progress.snapshot())
+    result_lock = threading.Lock()
+    done = [finished]
+    def on_listed(listed):
+        # 未预检时边翻页边下载，total 随翻页进度增长
+        if not PREFLIGHT:
+            job_store.set_progress(job['id'], total=finished + listed, worker_id=WORKER_ID)
+    def on_result(track, msg):
+        # 按位置记录，同一首歌在歌单中出现多次时各自记录
+        job_store.mark_track(job['id'], track.idx, msg, worker_id=WORKER_ID)
+        with result_lock:
+            done[0] += 1
+            extra = {}
+            if byte_progress:
+                byte_progress.add(track.id, msg.startswith('[完成]'))
+                extra = byte_progress.snapshot()
+            job_store.set_progress(job['id'], current=done[0], msg=msg, now=track._asdict(), worker_id=WORKER_ID,
+                                   **extra)
+    try:
+        run_pipeline(pages, get_song_urls, download_song, on_result=on_result,
+                     on_listed=on_listed, workers=DOWNLOAD_WORKERS, events=events, cancel=cancel)
+    except PipelineError as e:
+        # 已处理的歌曲已记入日志，重新开始该任务时只处理剩余部分
+        job_store.set_job_status(job['id'], 'error', f'已处理 {e.processed} 首后出错: {e}，可重新开始该任务继续', worker_id=WORKER_ID)
+        return
+    except Exception as e:
+        job_store.set_job_status(job['id'], 'error', f'歌单获取失败: {e}', worker_id=WORKER_ID)
+        return
+    if cancel is not None and cancel.is_set():
+        return
+    if not job_store.track_counts(job['id'])[0]:
+        job_store.set_job_status(job['id'], 'error', '歌单无歌曲或获取失败', worker_id=WORKER_ID)
+        return
+    if not job_store.get_job(job['id'])['listed']:
+        # 翻页中途出错：已列出的歌曲已处理完，保留日志，重新入队后会从出错的位置继续翻页
+        job_store.set_job_status(job['id'], 'error', '歌单未能完整获取，可重新开始该任务继续', worker_id=WORKER_ID)
+        return
+    job_store.set_job_status(job['id'], 'done', '全部下载完成！', worker_id=WORKER_ID)
+
+def run_song_job(job, events, cancel=None):
+    song = get_song_detail(job['target_id'])
+    if not song:
+        job_store.set_job_status(job['id'], 'error', '未找到该歌曲', worker_id=WORKER_ID)
+        return
+    job_store.set_progress(job['id'], current=0, total=1, now=compact_track(song)._asdict(), msg='', worker_id=WORKER_ID)
+    results = []
+    # 单曲下载走交互通道，不被批量任务挤占
+    try:
+        run_pipeline([[song]], with_lane(INTERACTIVE, get_song_urls), with_lane(INTERACTIVE, download_song),
+                     on_result=lambda track, msg: results.append(msg), events=events, cancel=cancel)
+    except PipelineError as e:
+        job_store.set_job_status(job['id'], 'error', f'下载失败: {e}', worker_id=WORKER_ID)
+        return
+    if cancel is not None and cancel.is_set():
+        return
+    msg = results[0] if results else '[失败] 未能获取下载链接'
+    job_store.set_progress(job['id'], current=1, msg=msg, worker_id=WORKER_ID)
+    job_store.set_job_status(job['id'], 'done', msg, worker_id=WORKER_ID)
+
+def keep_lease(job_id, stop, lost):
+    # 下载期间定期续约；续约失败说明本进程卡顿过久、任务已被其它进程接手，设置 lost 让下载停止
+    while not stop.wait(JOB_LEASE_SECONDS / 3):
+        if not job_store.renew_lease(job_id, WORKER_ID, JOB_LEASE_SECONDS):
+            print(f'任务 {job_id} 的租约已失效，可能已由其它进程接手，停止下载')
+            lost.set()
             break
-        task = download_queue.pop(0)
-        if task['type'] == 'song':
-            song = get_song_detail(task['id'])
-            if not song:
-                progress.update({'status': 'error', 'msg': '未找到该歌曲', 'now': None})
-                continue
-            urls = get_song_urls([song['id']])
-            url = urls.get(song['id'])
-            progress.update({'status': 'downloading', 'current': 1, 'total': 1, 'now': song, 'msg': ''})
-            msg = download_song(song, url)
-            progress.update({'current': 1, 'msg': msg, 'status': 'done'})
-        elif task['type'] == 'playlist':
-            tracks = get_all_tracks(task['id'])
-            total = len(tracks)
-            progress.update({'status': 'downloading', 'current': 0, 'total': total, 'now': task['info'], 'msg': ''})
-            if not tracks:
-                progress.update({'status': 'error', 'msg': '歌单无歌曲或获取失败', 'now': None})
-                continue
-            song_ids = [song['id'] for song in tracks]
-            urls = get_song_urls(song_ids)
-            for idx, song in enumerate(tracks, 1):
-                url = urls.get(song['id'])
-                msg = download_song(song, url)
-                progress.update({'current': idx, 'msg': msg, 'now': song})
-            progress.update({'status': 'done', 'msg': '全部下载完成！', 'now': None})
+
+def download_worker(poll=False, job_type=None):
+    """
+    领取并执行 jobs.db 中的任务，多个进程可同时运行
+    :param poll: 为 True 时没有任务也不退出，持续等待新任务（独立下载进程使用）
+    :param job_type: 只领取该类型的任务（单曲线程只处理 song，不用排在大歌单后面）
+    """
+    while True:
+        job = job_store.claim_job(WORKER_ID, JOB_LEASE_SECONDS, job_type)
+        if not job and not poll:
+            # /start 可能在上面领取之后、本线程退出之前加入任务，此时 ensure_worker 看到线程还活着不会再启动新线程；
+            # 在 worker_lock 内再领取一次，确实没有任务才登记退出
+            with worker_lock:
+                job = job_store.claim_job(WORKER_ID, JOB_LEASE_SECONDS, job_type)
+                if not job:
+                    forget_worker(threading.current_thread())
+                    return
+        if not job:
+            time.sleep(WORKER_POLL_SECONDS)
+            continue
+        events = event_log.bind(job=job['id'], worker=WORKER_ID)
+        events.emit('job_started', type=job['type'], target_id=job['target_id'], resumed=job['status'] == 'running')
+        start = time.perf_counter()
+        stop = threading.Event()
+        lost = threading.Event()
+        threading.Thread(target=keep_lease, args=(job['id'], stop, lost), daemon=True).start()
+        try:
+            if job['type'] == 'song':
+                with use_lane(INTERACTIVE):
+                    run_song_job(job, events, lost)
+            elif job['type'] == 'playlist':
+                run_playlist_job(job, events, lost)
+            else:
+                job_store.set_job_status(job['id'], 'error', f"未知任务类型: {job['type']}", worker_id=WORKER_ID)
+        except Exception as e:
+            # 任何未处理的异常（如链接失效、上游出错）都不能让下载线程退出，否则任务会一直停在 running
+            job_store.set_job_status(job['id'], 'error', f'下载失败: {e}', worker_id=WORKER_ID)
+        finally:
+            stop.set()
+        final = job_store.get_job(job['id'])
+        if lost.is_set() and final['worker_id'] != WORKER_ID:
+            # 任务已由其它进程接手，数据库中的状态属于新进程
+            final = {'status': 'lease_lost', 'msg': ''}
+        events.emit('job_finished', status=final['status'], msg=final['msg'],
+                    duration_ms=round((time.perf_counter() - start) * 1000, 1))
+
+def forget_worker(thread):
+    """下载线程退出前调用（需持有 worker_lock），之后 ensure_worker 会启动新线程"""
+    global worker_thread, song_worker_thread
+    if worker_thread is thread:
+        worker_thread = None
+    if song_worker_thread is thread:
+        song_worker_thread = None
+
+def ensure_worker():
+    global worker_thread, song_worker_thread
+    with worker_lock:
+        if worker_thread is None or not worker_thread.is_alive():
+            worker_thread = threading.Thread(target=download_worker, daemon=True)
+            worker_thread.start()
+        if song_worker_thread is None or not song_worker_thread.is_alive():
+            song_worker_thread = threading.Thread(target=download_worker, kwargs={'job_type': 'song'}, daemon=True)
+            song_worker_thread.start()
+
+def resume_jobs():
+    """启动时调用：日志中还有未完成的任务就继续下载（本机已退出进程的租约先作废）"""
+    job_store.release_dead_leases()
+    if job_store.count_jobs('queued', 'running'):
+        ensure_worker()
+
+def watch_leases():
+    # 其它进程（可能在别的机器上）崩溃后，它的任务要等租约到期才能接手；定期检查，不依赖新的 /start 请求
+    while True:
+        time.sleep(JOB_LEASE_SECONDS / 2)
+        if lease_watch_pid != os.getpid():
+            return
+        try:
+            resume_jobs()
+        except Exception:
+            app.logger.warning('检查未完成任务失败', exc_info=True)
+
+def start_background_jobs():
+    """
+    每个提供服务的进程调用一次（重复调用无效果）：继续未完成的任务，并启动租约巡检线程
+    python web_downloader.py 启动时、ASGI lifespan 启动时调用；gunicorn 等其它服务器在第一个请求时调用
+    """
+    global lease_watch_pid
+    with worker_lock:
+        if lease_watch_pid == os.getpid():
+            return
+        lease_watch_pid = os.getpid()
+    resume_jobs()
+    threading.Thread(target=watch_leases, daemon=True).start()
+
+@app.route('/start', methods=['POST'])
+def start():
+    items = (request.get_json(silent=True) or {}).get('queue') or []
+    job_ids = []
+    for item in items:
+        if item.get('type') not in ('song', 'playlist') or not item.get('id'):
+            continue
+        job_id = job_store.add_job(item['type'], extract_id(item['id']), item.get('info'))
+        event_log.emit('job_queued', job=job_id, type=item['type'], target_id=extract_id(item['id']))
+        job_ids.append(job_id)
+    if job_ids:
+        ensure_worker()
+    return jsonify({'code': 200, 'jobs': job_ids})
+
+@app.route('/status')
+def status():
+    # 进度保存在 jobs.db，无论请求落在哪个进程都能看到所有进程的任务
+    running, last = job_store.progress_snapshot()
+    if running:
+        current = running[0]
+        data = {'status': 'downloading', 'current': 0, 'total': 0, 'msg': '', 'now': current['info']}
+        data.update(current['progress'])
+    elif last:
+        data = {'status': last['status'], 'current': last['progress'].get('current', 0),
+                'total': last['progress'].get('total', 0), 'msg': last['msg'], 'now': None}
+    else:
+        data = {'status': 'idle', 'current': 0, 'total': 0, 'msg': '', 'now': None}
+    data['queued'] = job_store.count_jobs('queued', 'running')
+    data['workers'] = [{'job': job['id'], 'worker': job['worker_id'], 'current': job['progress'].get('current', 0),
+                        'total': job['progress'].get('total', 0)} for job in running]
+    if tag_stage is not None:
+        data['tagging'] = tag_stage.stats()
+    data['upstream'] = upstream_gate.stats()
+    return jsonify(data)
 
 # ----------------- Flask 路由 -----------------
 
+class PrecompressedPage:
+    """启动时预先编码并压缩好的静态页面，按 Accept-Encoding 直接返回，支持 ETag/304"""
+    content_type = 'text/html; charset=utf-8'
+
+    def __init__(self, html):
+        self.body = html.encode('utf-8')
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.encoded = {'gzip': gzip.compress(self.body, 9)}
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(self.body, quality=11)
+
+def serve_page(page, immutable=False):
+    """
+    :param page: PrecompressedPage 或 StaticAsset
+    :param immutable: 带内容指纹的地址，允许浏览器永久缓存；否则每次都向服务器确认（ETag）
+    """
+    if page.etag in [etag.split('-')[0] for etag in request.if_none_match.as_set()]:
+        resp = Response(status=304)
+        resp.set_etag(page.etag)
+        return resp
+    encoding = None
+    for candidate in ('br', 'gzip'):
+        if candidate in page.encoded and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    if encoding:
+        resp = Response(page.encoded[encoding], content_type=page.content_type)
+        resp.headers['Content-Encoding'] = encoding
+        resp.set_etag(f'{page.etag}-{encoding}')
+    else:
+        resp = Response(page.body, content_type=page.content_type)
+        resp.set_etag(page.etag)
+    resp.vary.add('Accept-Encoding')
+    if immutable:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = IMMUTABLE_MAX_AGE
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp
+
+# 页面引用的 CSS/JS/图片放在 static 目录，启动时生成带内容指纹的地址（见 static_assets.py）
+static_assets = StaticAssets()
+if static_assets.using_cdn():
+    print('static/vendor 中缺少 Bootstrap 等前端资源，页面暂从 CDN 加载；运行 python static_assets.py --vendor 下载到本地')
+
+@app.route('/static/<path:filename>')
+def serve_static(filename):
+    asset, immutable = static_assets.lookup(filename)
+    if asset is None:
+        return 'Not Found', 404
+    return serve_page(asset, immutable)
+
+JSON_COMPRESS_MIN_SIZE = 1024  # 小于该字节数的 JSON 不压缩
+
+@app.after_request
+def compress_json(resp):
+    if (resp.mimetype != 'application/json' or resp.status_code != 200 or resp.direct_passthrough
+            or resp.is_streamed or 'Content-Encoding' in resp.headers):
+        return resp
+    data = resp.get_data()
+    if len(data) < JSON_COMPRESS_MIN_SIZE:
+        return resp
+    if brotli is not None and request.accept_encodings['br']:
+        resp.set_data(brotli.compress(data, quality=4))
+        resp.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        resp.set_data(gzip.compress(data, 6))
+        resp.headers['Content-Encoding'] = 'gzip'
+    resp.vary.add('Accept-Encoding')
+    return resp
+
 HTML = '''
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
     <title>网易云音乐下载器</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-    <style>
-        body { background: #f8f9fa; }
-        .container { max-width: 700px; margin-top: 40px; }
-        .progress { height: 30px; }
-        .status-area { min-height: 40px; margin-top: 10px; }
-        .cover-img { width: 80px; height: 80px; object-fit: cover; border-radius: 8px; border: 2px solid #0d6efd; }
-        .song-card, .playlist-card { background: #fff; border: 1px solid #e3eafc; border-radius: 12px; box-shadow: 0 2px 8px #e3eafc55; margin-bottom: 16px; padding: 16px; }
-        .queue-list { list-style: none; padding: 0; }
-        .queue-list li { background: #e9f2ff; border-radius: 8px; margin-bottom: 8px; padding: 8px 12px; }
-        .btn-primary { background: #0d6efd; border: none; }
-        .btn-primary:hover { background: #0b5ed7; }
-        .form-label { color: #0d6efd; }
-    </style>
+    <link href="{{static:vendor/bootstrap.min.css}}" rel="stylesheet">
+    <link href="{{static:css/old_ui.css}}" rel="stylesheet">
 </head>
 <body>
 <div class="container shadow p-4 bg-white rounded">
@@ -302,303 +1290,39 @@ HTML = '''
     <div id="search-result"></div>
     <hr>
     <h5 class="text-primary">下载队列</h5>
-    <ul class="queue-list" id="queue-list"></ul>
+    <div class="queue-list" id="queue-list"></div>
     <button class="btn btn-primary mb-3 ms-2" onclick="batchSequentialDownload()">批量顺序下载</button>
     <div id="batch-download-status" class="mb-3 text-info"></div>
     <div class="status-area mt-3">
         <div id="now-info" class="mt-3"></div>
     </div>
 </div>
-<script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js"></script>
-<script>
-// 试听弹窗UI
-function showPreviewModal(song) {
-    if(document.getElementById('preview-modal')) document.getElementById('preview-modal').remove();
-    let cover = song.cover || (song.al && song.al.picUrl ? song.al.picUrl : '');
-    let imgHtml = cover ? `<img src="${cover}" style="width:80px;height:80px;border-radius:8px;border:2px solid #0d6efd;object-fit:cover;">` : '';
-    let modal = document.createElement('div');
-    modal.id = 'preview-modal';
-    modal.innerHTML = `
-    <div style="position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.4);z-index:9999;display:flex;align-items:center;justify-content:center;">
-      <div style="background:#fff;border-radius:16px;box-shadow:0 4px 32px #0002;padding:32px 24px;min-width:320px;max-width:90vw;position:relative;">
-        <button onclick="document.getElementById('preview-modal').remove()" style="position:absolute;top:8px;right:12px;font-size:22px;border:none;background:none;">×</button>
-        <div class="d-flex align-items-center mb-3">
-          ${imgHtml}
-          <div class="ms-3">
-            <b style="font-size:1.2em;">${song.name}</b><br>
-            <span class="text-secondary">${song.artist}</span>
-          </div>
-        </div>
-        <audio id="audio-preview" src="/proxy_download/${song.id}" controls style="width:100%;"></audio>
-        <div class="mt-2">
-          <input type="range" id="audio-progress" value="0" min="0" max="100" style="width:100%;">
-        </div>
-        <div class="d-flex justify-content-between text-secondary small mt-1">
-          <span id="audio-current">00:00</span>
-          <span id="audio-duration">00:00</span>
-        </div>
-      </div>
-    </div>`;
-    document.body.appendChild(modal);
-    let audio = document.getElementById('audio-preview');
-    let progress = document.getElementById('audio-progress');
-    let current = document.getElementById('audio-current');
-    let duration = document.getElementById('audio-duration');
-    audio.ontimeupdate = function() {
-      if(audio.duration) progress.value = audio.currentTime / audio.duration * 100;
-      current.innerText = formatTime(audio.currentTime);
-      duration.innerText = formatTime(audio.duration);
-    };
-    progress.oninput = function() {
-      if(audio.duration) audio.currentTime = progress.value / 100 * audio.duration;
-    };
-    function formatTime(sec) {
-      if(isNaN(sec)) return '00:00';
-      let m = Math.floor(sec/60), s = Math.floor(sec%60);
-      return (m<10?'0':'')+m+':' + (s<10?'0':'')+s;
-    }
-}
-let queue = [];
-function renderQueue() {
-    let ql = document.getElementById('queue-list');
-    ql.innerHTML = '';
-    queue.forEach((item, idx) => {
-        let info = item.info;
-        let cover = info.al && info.al.picUrl ? info.al.picUrl : (info.cover ? info.cover : '');
-        let imgHtml = cover ? `<img class='cover-img' src='${cover}'>` : '';
-        let html = `${imgHtml}<b>${item.type === 'song' ? '🎵' : '📀'} ${info.name}</b> <span class='text-secondary'>${info.artist||info.creator||''}</span>
-        <button class='btn btn-sm btn-outline-danger float-end ms-2' onclick='removeFromQueue(${idx})'>移除</button>`;
-        if(item.type === 'song' && item.id) {
-            html += ` <a href="/proxy_download/${item.id}" class="btn btn-success btn-sm float-end" style="margin-right:8px;" download><svg xmlns='http://www.w3.org/2000/svg' width='16' height='16' fill='currentColor' class='bi bi-download' viewBox='0 0 16 16'><path d='M.5 9.9a.5.5 0 0 1 .5.5v2.5A1.5 1.5 0 0 0 2.5 14h11a1.5 1.5 0 0 0 1.5-1.5V10.4a.5.5 0 0 1 1 0v2.1A2.5 2.5 0 0 1 13.5 15h-11A2.5 2.5 0 0 1 0 12.5V10.4a.5.5 0 0 1 .5-.5z'/><path d='M7.646 11.854a.5.5 0 0 0 .708 0l3-3a.5.5 0 0 0-.708-.708L8.5 10.293V1.5a.5.5 0 0 0-1 0v8.793L5.354 8.146a.5.5 0 1 0-.708.708l3 3z'/></svg> 下载</a>`;
-            html += ` <button class="btn btn-info btn-sm float-end" style="margin-right:8px;" onclick='showPreviewModal(${JSON.stringify({id:item.id,name:info.name,artist:info.artist,cover:cover})})'>试听</button>`;
-        }
-        let li = document.createElement('li');
-        li.innerHTML = html;
-        ql.appendChild(li);
-    });
-}
-function removeFromQueue(idx) {
-    queue.splice(idx, 1);
-    renderQueue();
-}
-document.getElementById('search-form').onsubmit = function(e) {
-    e.preventDefault();
-    let kw = document.getElementById('search-keyword').value.trim();
-    let stype = document.getElementById('search-type').value;
-    if(!kw) return;
-    let defaultCover = 'https://via.placeholder.com/60x60?text=No+Cover';
-    fetch(`/search?kw=${encodeURIComponent(kw)}&stype=${stype}`).then(r=>r.json()).then(data=>{
-        let res = document.getElementById('search-result');
-        res.innerHTML = '';
-        if(stype==='1' && data.result && data.result.songs) {
-            let ids = data.result.songs.map(song => song.id).join(',');
-            fetch(`/api/song_detail?ids=${ids}`).then(r=>r.json()).then(detailData => {
-                let id2cover = {};
-                detailData.songs.forEach(song => {
-                    id2cover[song.id] = song.al && song.al.picUrl ? song.al.picUrl : defaultCover;
-                });
-                data.result.songs.forEach((song, idx) => {
-                    let cover = id2cover[song.id] || defaultCover;
-                    let btnId = `add-btn-${song.id}`;
-                    let imgHtml = `<img class='cover-img' src='${cover}'>`;
-                    let html = `<div class='song-card row align-items-center'>
-                        <div class='col-auto'>${imgHtml}</div>
-                        <div class='col'>
-                            <b>${song.name}</b><br>
-                            <span class='text-secondary'>${song.artists.map(a=>a.name).join("/")}</span><br>
-                            <span class='text-secondary'>${song.album.name}</span>
-                        </div>
-                        <div class='col-auto d-flex flex-column gap-2'>
-                            <button id='${btnId}' class='btn btn-primary mb-1' onclick='addToQueueUI(this, "song", "${song.id}", ${JSON.stringify({name:song.name,artist:song.artists.map(a=>a.name).join("/"),cover:cover})})'>加入队列</button>
-                            <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm" target="_blank">下载</a>
-                            <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.name,artist:song.artists.map(a=>a.name).join("/"),cover:cover})})'>试听</button>
-                        </div>
-                    </div>`;
-                    res.innerHTML += html;
-                });
-            });
-        } else if(stype==='1000' && data.result && data.result.playlists) {
-            data.result.playlists.forEach(pl=>{
-                let cover = pl.coverImgUrl ? pl.coverImgUrl : defaultCover;
-                let html = `<div class='playlist-card row align-items-center'>
-                    <div class='col-auto'><img class='cover-img' src='${cover}'></div>
-                    <div class='col'>
-                        <b>${pl.name}</b><br>
-                        <span class='text-secondary'>by ${pl.creator.nickname}</span><br>
-                        <span class='text-secondary'>${pl.trackCount} 首歌</span>
-                    </div>
-                    <div class='col-auto'>
-                        <button class='btn btn-primary' onclick='fetchPlaylistSongs(${pl.id})'>查看歌单详情</button>
-                    </div>
-                </div>
-                <div id='playlist-detail-${pl.id}'></div>`;
-                res.innerHTML += html;
-            });
-        } else {
-            res.innerHTML = '<div class="text-danger">未找到结果</div>';
-        }
-    });
-};
-function addToQueueUI(btn, type, id, info) {
-    queue.push({type, id, info});
-    renderQueue();
-    btn.classList.remove('btn-primary');
-    btn.classList.add('btn-danger');
-    btn.innerText = '已加入队列';
-    btn.disabled = true;
-}
-document.getElementById('start-btn').onclick = function() {
-    if(queue.length===0) return alert('请先添加任务到队列！');
-    fetch('/start', {
-        method: 'POST',
-        headers: {'Content-Type':'application/json'},
-        body: JSON.stringify({queue})
-    }).then(r=>r.json()).then(data=>{
-        updateStatus();
-    });
-};
-function updateStatus() {
-    fetch('/status').then(r=>r.json()).then(data=>{
-        let bar = document.getElementById('progress-bar');
-        let text = document.getElementById('status-text');
-        let percent = data.total ? Math.floor(data.current * 100 / data.total) : 0;
-        bar.style.width = percent + '%';
-        bar.innerText = percent + '%';
-        text.innerText = data.status === 'downloading' ? `下载中：${data.current}/${data.total}  ${data.msg}` : data.msg;
-        if(data.status === 'done') {
-            bar.classList.add('bg-success');
-        } else if(data.status === 'error') {
-            bar.classList.add('bg-danger');
-        } else {
-            bar.classList.remove('bg-success','bg-danger');
-        }
-        // 当前歌曲/歌单信息
-        let now = data.now;
-        let nowinfo = document.getElementById('now-info');
-        if(now && now.album && now.album.picUrl) {
-            let cover = now.album.picUrl ? now.album.picUrl : null;
-            let imgHtml = cover ? `<img class='cover-img me-3' src='${cover}'>` : '';
-            nowinfo.innerHTML = `${imgHtml}<b>${now.name}</b> <span class='text-secondary'>${now.artists.map(a=>a.name).join('/')}</span>`;
-        } else if(now && now.coverImgUrl) {
-            let cover = now.coverImgUrl ? now.coverImgUrl : null;
-            let imgHtml = cover ? `<img class='cover-img me-3' src='${cover}'>` : '';
-            nowinfo.innerHTML = `${imgHtml}<b>${now.name}</b>`;
-        } else {
-            nowinfo.innerHTML = '';
-        }
-    });
-}
-setInterval(updateStatus, 2000);
-updateStatus();
-renderQueue();
-
-function batchSequentialDownload() {
-    if (queue.length === 0) {
-        alert('队列为空！');
-        return;
-    }
-    let statusText = document.getElementById('batch-download-status');
-    let i = 0;
-    function downloadNext() {
-        if (i >= queue.length) {
-            statusText.innerText = '全部下载完成！';
-            return;
-        }
-        let item = queue[i];
-        if (item.type === 'song' && item.id) {
-            statusText.innerText = `正在下载第${i+1}首：${item.info.name}`;
-            // 创建临时a标签并点击
-            let a = document.createElement('a');
-            a.href = `/proxy_download/${item.id}`;
-            a.download = '';
-            a.target = '_blank';
-            document.body.appendChild(a);
-            a.click();
-            document.body.removeChild(a);
-        }
-        i++;
-        setTimeout(downloadNext, 3000); // 3秒后下载下一个
-    }
-    downloadNext();
-}
-
-// ========== 补充：获取歌单全部歌曲 ==========
-function fetchPlaylistSongs(pid) {
-    checkLoginStatus(function(loggedIn){
-        if(!loggedIn) { showQrLoginModal(); return; }
-        fetch(`/api/playlist_tracks?id=${pid}&limit=1000`)
-          .then(r => r.json())
-          .then(data => {
-              if(!data.songs || !data.songs.length) {
-                  document.getElementById('playlist-info').innerHTML = '<span class="text-danger">未获取到歌曲，可能未登录或歌单不存在</span>';
-                  document.getElementById('song-list').innerHTML = '';
-                  allSongs = [];
-                  queue = [];
-                  renderQueue();
-                  renderSongPagination();
-                  return;
-              }
-              document.getElementById('playlist-info').innerHTML = `<b>共${data.songs.length}首歌</b>`;
-              allSongs = data.songs;
-              currentPage = 1;
-              renderSongList();
-              renderQueue();
-              renderSongPagination();
-          });
-    });
-}
-window.fetchPlaylistSongs = fetchPlaylistSongs;
-</script>
+<script src="{{static:vendor/bootstrap.bundle.min.js}}"></script>
+<script src="{{static:js/virtual_list.js}}"></script>
+<script src="{{static:js/old_ui.js}}"></script>
 </body>
 </html>
 '''
 
+# HTML 中没有模板语法，渲染结果与原文一致，启动时直接预压缩
+old_ui_page = PrecompressedPage(static_assets.render(HTML))
+
 @app.route('/', methods=['GET'])
 def main_new_ui():
     return new_ui()
 
 @app.route('/old_ui', methods=['GET'])
 def old_ui():
-    return render_template_string(HTML)
+    return serve_page(old_ui_page)
 
-@app.route('/playlist_downloader', methods=['GET'])
-def playlist_downloader():
-    return '''
+PLAYLIST_DOWNLOADER_HTML = '''
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
     <title>网易云歌单全量下载</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-    <style>
-        body { background: #f8f9fa; }
-        .container { max-width: 800px; margin-top: 40px; }
-        .cover-img { width: 60px; height: 60px; object-fit: cover; border-radius: 8px; border: 2px solid #0d6efd; }
-        /* 队列区卡片更明显 */
-        .queue-list { list-style: none; padding: 0; }
-        .queue-list li.queue-item {
-            background: #eaf4ff;
-            border: 2px solid #90caf9;
-            border-radius: 14px;
-            box-shadow: 0 4px 16px #90caf955;
-            margin-bottom: 18px;
-            padding: 14px 18px;
-        }
-        /* 歌曲列表区卡片 */
-        .song-row {
-            background: #fff;
-            border: 1.5px solid #e3eafc;
-            border-radius: 12px;
-            box-shadow: 0 2px 8px #e3eafc55;
-            margin-bottom: 16px;
-            padding: 14px 18px;
-        }
-        .btn-primary { background: #0d6efd; border: none; }
-        .btn-primary:hover { background: #0b5ed7; }
-        .form-label { color: #0d6efd; }
-        .qr-modal-bg { position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.4);z-index:9999;display:flex;align-items:center;justify-content:center; }
-        .qr-modal-box { background:#fff;border-radius:16px;box-shadow:0 4px 32px #0002;padding:32px 24px;min-width:320px;max-width:90vw;position:relative; animation: popIn 0.3s; }
-    </style>
+    <link href="{{static:vendor/bootstrap.min.css}}" rel="stylesheet">
+    <link href="{{static:css/playlist_downloader.css}}" rel="stylesheet">
 </head>
 <body>
 <div class="container shadow p-4 bg-white rounded">
@@ -631,7 +1355,7 @@ def playlist_downloader():
                     </div>
                 </div>
                 <span id="batch-download-status" class="ms-2 text-info"></span>
-                <ul class="queue-list" id="queue-list"></ul>
+                <div class="queue-list" id="queue-list"></div>
             </div>
         </div>
     </div>
@@ -639,297 +1363,51 @@ def playlist_downloader():
 </div>
 <div id="qr-modal" style="display:none;"></div>
 <div id="preview-modal"></div>
-<script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js"></script>
-<script>
-let allSongs = [];
-let queue = [];
-function extractPlaylistId(input) {
-    let match = input.match(/playlist\\?id=(\\d+)/);
-    if (match) return match[1];
-    if (/^\\d+$/.test(input)) return input;
-    return null;
-}
-function showQrLoginModal() {
-    let modal = document.getElementById('qr-modal');
-    modal.style.display = '';
-    modal.innerHTML = `<div class='qr-modal-bg'><div class='qr-modal-box'><div id='qr-img-box' class='text-center mb-2'></div><div id='qr-status' class='text-center text-info mb-2'>请使用网易云音乐App扫码登录</div><button class='btn btn-sm btn-outline-secondary' onclick='closeQrModal()' style='position:absolute;top:8px;right:12px;'>关闭</button></div></div>`;
-    fetch('/api/qr_key').then(r=>r.json()).then(data=>{
-        let key = data.data.unikey;
-        fetch(`/api/qr_create?key=${key}`).then(r=>r.json()).then(data=>{
-            let qrimg = data.data.qrimg;
-            document.getElementById('qr-img-box').innerHTML = `<img src='${qrimg}' style='width:180px;height:180px;'>`;
-            pollQrStatus(key);
-        });
-    });
-}
-function closeQrModal() {
-    document.getElementById('qr-modal').style.display = 'none';
-}
-function pollQrStatus(key) {
-    let statusDiv = document.getElementById('qr-status');
-    let timer = setInterval(()=>{
-        fetch(`/api/qr_check?key=${key}`).then(r=>r.json()).then(data=>{
-            if(data.code === 800) {
-                statusDiv.innerText = '二维码已过期，请关闭后重试';
-                clearInterval(timer);
-            } else if(data.code === 801) {
-                statusDiv.innerText = '等待扫码...';
-            } else if(data.code === 802) {
-                statusDiv.innerText = '请在手机上确认登录';
-            } else if(data.code === 803) {
-                statusDiv.innerText = '登录成功！';
-                setTimeout(()=>{ closeQrModal(); location.reload(); }, 1000);
-                clearInterval(timer);
-            }
-        });
-    }, 2000);
-}
-function checkLoginStatus(cb) {
-    fetch('/api/user_account').then(r=>r.json()).then(data=>{
-        if(data.code === 200 && data.profile && data.profile.nickname) {
-            document.getElementById('login-status').innerText = `已登录：${data.profile.nickname}`;
-            cb && cb(true);
-        } else {
-            document.getElementById('login-status').innerHTML = `<span class='text-danger'>未登录，请先 <a href='#' onclick='showQrLoginModal()'>扫码登录</a></span>`;
-            cb && cb(false);
-        }
-    });
-}
-function renderSongList() {
-    let html = '';
-    allSongs.forEach((song, idx)=>{
-        let cover = song.al && song.al.picUrl ? song.al.picUrl : '';
-        let artists = song.ar ? song.ar.map(a=>a.name).join('/') : '';
-        let inQueue = queue.find(q=>q.id===song.id);
-        html += `<div class='song-row row align-items-center'>
-            <div class='col-auto'>${cover?`<img class='cover-img' src='${cover}'>`:''}</div>
-            <div class='col'>
-                <b>${idx+1}. ${song.name}</b><br>
-                <span class='text-secondary'>${artists}</span>
-            </div>
-            <div class='col-auto d-flex flex-column gap-2'>
-                <button class='btn btn-${inQueue?'danger':'primary'} btn-sm mb-1' onclick='toggleQueue(${JSON.stringify(song)})'>${inQueue?'移除队列':'加入队列'}</button>
-                <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm mb-1" download target="_blank">下载</a>
-                <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.name,artist:artists,cover:cover})})'>试听</button>
-            </div>
-        </div>`;
-    });
-    document.getElementById('song-list').innerHTML = html;
-    // 控制分隔线和队列区显示
-    document.getElementById('divider-line').style.display = allSongs.length ? '' : 'none';
-    document.getElementById('queue-section').style.display = allSongs.length ? '' : 'none';
-    // 全部加入队列按钮逻辑
-    let allInQueue = allSongs.length > 0 && allSongs.every(song => queue.find(q => q.id === song.id));
-    let addAllBtn = document.getElementById('add-all-btn');
-    addAllBtn.style.display = allSongs.length ? '' : 'none';
-    addAllBtn.disabled = allInQueue;
-    addAllBtn.innerText = allInQueue ? '已全部加入' : '全部加入队列';
-}
-function renderQueue() {
-    let ql = document.getElementById('queue-list');
-    ql.innerHTML = '';
-    queue.forEach((song, idx) => {
-        let cover = song.al && song.al.picUrl ? song.al.picUrl : '';
-        let artists = song.ar ? song.ar.map(a=>a.name).join('/') : '';
-        let html = `<div class="row align-items-center">
-            <div class="col-auto">
-                ${cover?`<img class='cover-img' src='${cover}'>`:''}
-            </div>
-            <div class="col">
-                <div class="fw-bold fs-6 mb-1">${song.name}</div>
-                <div class="text-secondary small mb-2">${artists}</div>
-                <div class="d-flex gap-2 justify-content-end">
-                    <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.name,artist:artists,cover:cover})})'>试听</button>
-                    <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm" download target="_blank">下载</a>
-                    <button class='btn btn-sm btn-outline-danger' onclick='removeFromQueue(${idx})'>移除</button>
-                </div>
-            </div>
-        </div>`;
-        let li = document.createElement('li');
-        li.className = 'queue-item';
-        li.innerHTML = html;
-        ql.appendChild(li);
-    });
-    document.getElementById('batch-download-btn').style.display = queue.length ? '' : 'none';
-    document.getElementById('remove-all-btn').style.display = queue.length ? '' : 'none';
-}
-function addToQueue(song) {
-    if(!queue.find(q=>q.id===song.id)) {
-        queue.push(song);
-        renderSongList();
-        renderQueue();
-    }
-}
-function removeFromQueue(idx) {
-    queue.splice(idx, 1);
-    renderSongList();
-    renderQueue();
-}
-function toggleQueue(song) {
-    let idx = queue.findIndex(q=>q.id===song.id);
-    if(idx === -1) {
-        queue.push(song);
-    } else {
-        queue.splice(idx, 1);
-    }
-    renderSongList();
-    renderQueue();
-}
-document.getElementById('add-all-btn').onclick = function() {
-    allSongs.forEach(song=>addToQueue(song));
-};
-document.getElementById('batch-download-btn').onclick = function() {
-    batchSequentialDownload();
-};
-function batchSequentialDownload() {
-    if (queue.length === 0) {
-        alert('队列为空！');
-        return;
-    }
-    let statusText = document.getElementById('batch-download-status');
-    let i = 0;
-    function downloadNext() {
-        if (i >= queue.length) {
-            statusText.innerText = '全部下载完成！';
-            return;
-        }
-        let item = queue[i];
-        statusText.innerText = `正在下载第${i+1}首：${item.name}`;
-        let a = document.createElement('a');
-        a.href = `/proxy_download/${item.id}`;
-        a.download = '';
-        a.target = '_blank';
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        i++;
-        setTimeout(downloadNext, 3000);
-    }
-    downloadNext();
-}
-function showPreviewModal(song) {
-    let modal = document.getElementById('preview-modal');
-    modal.innerHTML = `<div style="position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.4);z-index:9999;display:flex;align-items:center;justify-content:center;">
-      <div style="background:#fff;border-radius:16px;box-shadow:0 4px 32px #0002;padding:32px 24px;min-width:320px;max-width:90vw;position:relative;">
-        <button onclick="document.getElementById('preview-modal').innerHTML=''" style="position:absolute;top:8px;right:12px;font-size:22px;border:none;background:none;">×</button>
-        <div class="d-flex align-items-center mb-3">
-          ${song.cover?`<img src='${song.cover}' style='width:80px;height:80px;border-radius:8px;border:2px solid #0d6efd;object-fit:cover;'>`:''}
-          <div class="ms-3">
-            <b style="font-size:1.2em;">${song.name}</b><br>
-            <span class="text-secondary">${song.artist}</span>
-          </div>
-        </div>
-        <audio id="audio-preview" src="/proxy_download/${song.id}" controls style="width:100%;"></audio>
-      </div>
-    </div>`;
-}
-document.getElementById('fetch-btn').onclick = function() {
-    let val = document.getElementById('playlist-input').value.trim();
-    let pid = extractPlaylistId(val);
-    if(!pid) { alert('请输入正确的歌单ID或链接'); return; }
-    checkLoginStatus(function(loggedIn){
-        if(!loggedIn) { showQrLoginModal(); return; }
-        fetch(`/api/playlist_tracks?id=${pid}&limit=1000`)
-          .then(r => r.json())
-          .then(data => {
-              if(!data.songs || !data.songs.length) {
-                  document.getElementById('playlist-info').innerHTML = '<span class="text-danger">未获取到歌曲，可能未登录或歌单不存在</span>';
-                  document.getElementById('song-list').innerHTML = '';
-                  allSongs = [];
-                  queue = [];
-                  renderQueue();
-                  renderSongPagination();
-                  return;
-              }
-              document.getElementById('playlist-info').innerHTML = `<b>共${data.songs.length}首歌</b>`;
-              allSongs = data.songs;
-              queue = [];
-              renderSongList();
-              renderQueue();
-          });
-    });
-};
-checkLoginStatus();
-
-// ========== 补充：获取歌单全部歌曲 ==========
-function fetchPlaylistSongs(pid) {
-    checkLoginStatus(function(loggedIn){
-        if(!loggedIn) { showQrLoginModal(); return; }
-        fetch(`/api/playlist_tracks?id=${pid}&limit=1000`)
-          .then(r => r.json())
-          .then(data => {
-              if(!data.songs || !data.songs.length) {
-                  document.getElementById('playlist-info').innerHTML = '<span class="text-danger">未获取到歌曲，可能未登录或歌单不存在</span>';
-                  document.getElementById('song-list').innerHTML = '';
-                  allSongs = [];
-                  queue = [];
-                  renderQueue();
-                  renderSongPagination();
-                  return;
-              }
-              document.getElementById('playlist-info').innerHTML = `<b>共${data.songs.length}首歌</b>`;
-              allSongs = data.songs;
-              currentPage = 1;
-              renderSongList();
-              renderQueue();
-              renderSongPagination();
-          });
-    });
-}
-window.fetchPlaylistSongs = fetchPlaylistSongs;
-</script>
+<script src="{{static:vendor/bootstrap.bundle.min.js}}"></script>
+<script src="{{static:js/virtual_list.js}}"></script>
+<script src="{{static:js/playlist_downloader.js}}"></script>
 </body>
 </html>
 '''
+playlist_downloader_page = PrecompressedPage(static_assets.render(PLAYLIST_DOWNLOADER_HTML))
+
+@app.route('/playlist_downloader', methods=['GET'])
+def playlist_downloader():
+    return serve_page(playlist_downloader_page)
 
 @app.route('/search')
 def search():
     kw = request.args.get('kw', '')
     stype = request.args.get('stype', '1')
-    return jsonify(search_api(kw, stype))
+    limit = request.args.get('limit', 30)
+    offset = request.args.get('offset', 0)
+    if not kw.strip():
+        return jsonify({'code': 400, 'msg': '关键词不能为空'})
+    return jsonify(cached_search(kw, stype, limit, offset))
 
-@app.route('/new_ui')
-def new_ui():
-    return '''
+@app.route('/api/search_songs')
+def api_search_songs():
+    # 搜索 + 批量获取封面合并为一次请求，前端拿到即可渲染
+    kw = request.args.get('kw', '')
+    if not kw.strip():
+        return jsonify({'code': 400, 'msg': '关键词不能为空', 'songs': []})
+    return jsonify(search_songs_with_covers(kw, request.args.get('limit', 30), request.args.get('offset', 0)))
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    return jsonify({'search': search_cache.stats(), 'search_songs': song_search_cache.stats(),
+                    'song_detail': song_detail_cache.stats(), 'song_url': song_url_cache.stats(),
+                    'playlist': playlist_cache.stats()})
+
+NEW_UI_HTML = '''
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
     <title>网易云音乐多功能下载中心</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/bootstrap-icons.css">
-    <style>
-        body { background: linear-gradient(135deg, #f6d365 0%, #fda085 100%); min-height: 100vh; }
-        .main-container { max-width: 1400px; margin: 48px auto; background: rgba(255,255,255,0.97); border-radius: 32px; box-shadow: 0 8px 32px #fda08555; padding: 48px 40px; }
-        .big-title { font-size: 2.7em; font-weight: bold; background: linear-gradient(90deg,#fda085,#f6d365); -webkit-background-clip: text; color: transparent; letter-spacing: 2px; }
-        .sub-title { font-size: 1.2em; color: #f6723a; margin-bottom: 32px; }
-        .left-col { border-right: 2px dashed #fda08533; min-height: 600px; }
-        .section-title { color: #f6723a; font-weight: bold; font-size: 1.2em; margin-bottom: 16px; letter-spacing: 1px; }
-        .card-style { background: #fff7f0; border-radius: 16px; box-shadow: 0 4px 16px #fda08533; padding: 18px 20px; margin-bottom: 22px; }
-        .cover-img { width: 44px; height: 44px; object-fit: cover; border-radius: 8px; border: 2px solid #f6723a; box-shadow: 0 2px 8px #fda08533; }
-        .queue-list { list-style: none; padding: 0; }
-        .queue-list li.queue-item { background: #ffe0c7; border: 2px solid #fda085; border-radius: 14px; box-shadow: 0 4px 16px #fda08533; margin-bottom: 14px; padding: 10px 14px; }
-        .song-row { background: #fff; border: 2px solid #f6d365; border-radius: 12px; box-shadow: 0 2px 8px #fda08533; margin-bottom: 10px; padding: 8px 10px; font-size: 0.98em; min-height: 54px; }
-        .song-row .col { font-size: 0.97em; }
-        .song-row .btn { font-size: 0.92em; padding: 2px 10px; margin-bottom: 2px; }
-        .btn-main { background: linear-gradient(90deg,#fda085,#f6d365); border: none; color: #fff; font-weight: bold; }
-        .btn-main:hover { background: linear-gradient(90deg,#f6d365,#fda085); color: #fff; }
-        .btn-icon { margin-right: 5px; }
-        .form-label { color: #f6723a; font-weight: bold; }
-        .info-card { background: #fffbe6; border-left: 6px solid #fda085; border-radius: 10px; padding: 12px 14px; margin-bottom: 14px; color: #b85c00; font-size: 0.98em; }
-        .qr-modal-bg { position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.4);z-index:9999;display:flex;align-items:center;justify-content:center; animation: fadeIn 0.3s; }
-        .qr-modal-box { background:#fff;border-radius:16px;box-shadow:0 4px 32px #0002;padding:32px 24px;min-width:320px;max-width:90vw;position:relative; animation: popIn 0.3s; }
-        .divider { border-top: 2px dashed #fda08533; margin: 32px 0; }
-        .help-section { background: #f6d36522; border-radius: 12px; padding: 18px 22px; color: #b85c00; font-size: 1.05em; margin-top: 32px; }
-        .copyright { color: #f6723a; font-size: 0.98em; margin-top: 18px; text-align: center; }
-        @keyframes fadeIn { from { opacity: 0; } to { opacity: 1; } }
-        @keyframes popIn { from { transform: scale(0.8); opacity: 0; } to { transform: scale(1); opacity: 1; } }
-        .modal-anim { animation: fadeIn 0.3s; }
-        .modal-content-anim { animation: popIn 0.3s; }
-        .pagination { justify-content: center; margin-top: 10px; }
-        .pagination .page-link { color: #f6723a; }
-        .pagination .active .page-link { background: linear-gradient(90deg,#fda085,#f6d365); color: #fff; border: none; }
-    </style>
+    <link href="{{static:vendor/bootstrap.min.css}}" rel="stylesheet">
+    <link href="{{static:vendor/bootstrap-icons.css}}" rel="stylesheet">
+    <link href="{{static:css/new_ui.css}}" rel="stylesheet">
 </head>
 <body>
 <div class="main-container">
@@ -959,9 +1437,6 @@ def new_ui():
             </div>
             <div id="search-result"></div>
             <div id="song-list"></div>
-            <nav>
-                <ul class="pagination" id="song-pagination"></ul>
-            </nav>
         </div>
         <div class="col-md-5">
             <div class="section-title"><i class="bi bi-link-45deg"></i> 歌单ID/链接直达区</div>
@@ -983,7 +1458,7 @@ def new_ui():
                 - 歌单歌曲可全部加入队列，支持批量顺序下载。
             </div>
             <div class="mb-3">
-                <button class="btn btn-success" id="add-all-btn" style="display:none;"><i class="bi bi-plus-circle btn-icon"></i>全部加入队列（本页）</button>
+                <button class="btn btn-success" id="add-all-btn" style="display:none;"><i class="bi bi-plus-circle btn-icon"></i>全部加入队列</button>
                 <button class="btn btn-danger ms-2" id="remove-all-btn" style="display:none;"><i class="bi bi-trash btn-icon"></i>全部移除</button>
                 <button class="btn btn-warning ms-2" id="batch-download-btn" style="display:none;"><i class="bi bi-download btn-icon"></i>批量顺序下载</button>
                 <span id="batch-download-status" class="ms-3 text-info"></span>
@@ -991,7 +1466,7 @@ def new_ui():
             <div class="divider"></div>
             <div class="section-title"><i class="bi bi-list-task"></i> 下载队列（全局唯一）</div>
             <div id="queue-section" class="card-style" style="display:none;">
-                <ul class="queue-list" id="queue-list"></ul>
+                <div class="queue-list" id="queue-list"></div>
             </div>
         </div>
     </div>
@@ -1008,347 +1483,17 @@ def new_ui():
 </div>
 <div id="qr-modal" style="display:none;"></div>
 <div id="preview-modal"></div>
-<script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js"></script>
-<script>
-// ========== 全局变量 ==========
-let allSongs = [];
-let queue = [];
-let currentPage = 1;
-const PAGE_SIZE = 10;
-
-// ========== 工具函数 ==========
-function extractPlaylistId(input) {
-    let match = input.match(/playlist\?id=(\d+)/);
-    if (match) return match[1];
-    if (/^\d+$/.test(input)) return input;
-    return null;
-}
-function getArtist(song) {
-    if (song.ar && Array.isArray(song.ar)) {
-        return song.ar.map(a=>a.name).join('/');
-    }
-    if (song.artist) {
-        return song.artist;
-    }
-    if (song.artists && Array.isArray(song.artists)) {
-        return song.artists.map(a=>a.name).join('/');
-    }
-    return '';
-}
-function showModal(message, type='info') {
-    let color = {
-        info: '#f6723a',
-        success: '#388e3c',
-        error: '#d32f2f',
-        warning: '#fbc02d'
-    }[type] || '#f6723a';
-    let modal = document.createElement('div');
-    modal.id = 'info-modal';
-    modal.className = 'modal-anim';
-    modal.innerHTML = `
-      <div class="modal-backdrop" style="position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.3);z-index:9999;display:flex;align-items:center;justify-content:center;">
-        <div class="modal-content modal-content-anim" style="background:#fff;border-radius:10px;box-shadow:0 2px 16px #0002;padding:18px 20px;min-width:180px;max-width:260px;position:relative;">
-          <button onclick="document.body.removeChild(document.getElementById('info-modal'))" style="position:absolute;top:6px;right:8px;font-size:18px;border:none;background:none;">×</button>
-          <div style="color:${color};font-size:1em;">${message}</div>
-        </div>
-      </div>`;
-    document.body.appendChild(modal);
-}
-function showQrLoginModal() {
-    let modal = document.createElement('div');
-    modal.id = 'qr-modal';
-    modal.className = 'modal-anim';
-    modal.innerHTML = `
-      <div class="qr-modal-bg">
-        <div class="qr-modal-box modal-content-anim">
-          <button onclick="document.body.removeChild(document.getElementById('qr-modal'))" style="position:absolute;top:6px;right:8px;font-size:22px;border:none;background:none;">×</button>
-          <div id="qr-img-box" class="text-center mb-2"></div>
-          <div id="qr-status" class="text-center text-info mb-2" style="font-size:0.98em;">请使用网易云音乐App扫码登录</div>
-        </div>
-      </div>`;
-    document.body.appendChild(modal);
-    fetch('/api/qr_key').then(r=>r.json()).then(data=>{
-        let key = data.data.unikey;
-        fetch(`/api/qr_create?key=${key}`).then(r=>r.json()).then(data=>{
-            let qrimg = data.data.qrimg;
-            document.getElementById('qr-img-box').innerHTML = `<img src='${qrimg}' style='width:140px;height:140px;'>`;
-            pollQrStatus(key);
-        });
-    });
-}
-function pollQrStatus(key) {
-    let statusDiv = document.getElementById('qr-status');
-    let timer = setInterval(()=>{
-        fetch(`/api/qr_check?key=${key}`).then(r=>r.json()).then(data=>{
-            if(data.code === 800) {
-                statusDiv.innerText = '二维码已过期，请关闭后重试';
-                clearInterval(timer);
-            } else if(data.code === 801) {
-                statusDiv.innerText = '等待扫码...';
-            } else if(data.code === 802) {
-                statusDiv.innerText = '请在手机上确认登录';
-            } else if(data.code === 803) {
-                statusDiv.innerText = '登录成功！';
-                setTimeout(()=>{ document.body.removeChild(document.getElementById('qr-modal')); location.reload(); }, 1000);
-                clearInterval(timer);
-            }
-        });
-    }, 2000);
-}
-function checkLoginStatus(cb) {
-    fetch('/api/user_account').then(r=>r.json()).then(data=>{
-        if(data.code === 200 && data.profile && data.profile.nickname) {
-            document.getElementById('login-status').innerHTML = `<span class='text-success'>已登录：${data.profile.nickname}</span>`;
-            document.getElementById('qr-login-btn').style.display = 'none';
-            cb && cb(true);
-        } else {
-            document.getElementById('login-status').innerHTML = `<span class='text-danger'>未登录，请先 <a href='#' onclick='showQrLoginModal()'>扫码登录</a></span>`;
-            document.getElementById('qr-login-btn').style.display = '';
-            cb && cb(false);
-        }
-    });
-}
-// ========== 搜索功能 ==========
-document.getElementById('search-form').onsubmit = function(e) {
-    e.preventDefault();
-    let kw = document.getElementById('search-keyword').value.trim();
-    let stype = document.getElementById('search-type').value;
-    if(!kw) { showModal('请输入关键词', 'warning'); return; }
-    let defaultCover = 'https://via.placeholder.com/44x44?text=No+Cover';
-    fetch(`/search?kw=${encodeURIComponent(kw)}&stype=${stype}`).then(r=>r.json()).then(data=>{
-        let res = document.getElementById('search-result');
-        res.innerHTML = '';
-        if(stype==='1' && data.result && data.result.songs) {
-            let ids = data.result.songs.map(song => song.id).join(',');
-            fetch(`/api/song_detail?ids=${ids}`).then(r=>r.json()).then(detailData => {
-                let id2cover = {};
-                detailData.songs.forEach(song => {
-                    id2cover[song.id] = song.al && song.al.picUrl ? song.al.picUrl : defaultCover;
-                });
-                // 分页
-                allSongs = data.result.songs.map(song => ({...song, cover: id2cover[song.id] || defaultCover}));
-                currentPage = 1;
-                renderSongList();
-                renderSongPagination();
-            });
-        } else {
-            res.innerHTML = '<div class="text-danger">未找到结果</div>';
-        }
-    });
-};
-// ========== 歌单ID/链接直达 ==========
-document.getElementById('fetch-btn').onclick = function() {
-    let val = document.getElementById('playlist-input').value.trim();
-    let pid = extractPlaylistId(val);
-    if(!pid) { showModal('请输入正确的歌单ID或链接','warning'); return; }
-    checkLoginStatus(function(loggedIn){
-        if(!loggedIn) { showQrLoginModal(); return; }
-        fetch(`/api/playlist_tracks?id=${pid}&limit=1000`)
-          .then(r => r.json())
-          .then(data => {
-              if(!data.songs || !data.songs.length) {
-                  document.getElementById('playlist-info').innerHTML = '<span class="text-danger">未获取到歌曲，可能未登录或歌单不存在</span>';
-                  document.getElementById('song-list').innerHTML = '';
-                  allSongs = [];
-                  queue = [];
-                  renderQueue();
-                  renderSongPagination();
-                  return;
-              }
-              document.getElementById('playlist-info').innerHTML = `<b>共${data.songs.length}首歌</b>`;
-              allSongs = data.songs;
-              currentPage = 1;
-              renderSongList();
-              renderQueue();
-              renderSongPagination();
-          });
-    });
-};
-// ========== 歌曲分页与队列按钮 ==========
-function renderSongList() {
-    let html = '';
-    let start = (currentPage-1)*PAGE_SIZE;
-    let end = Math.min(start+PAGE_SIZE, allSongs.length);
-    for(let i=start;i<end;i++){
-        let song = allSongs[i];
-        let cover = song.al && song.al.picUrl ? song.al.picUrl : (song.cover?song.cover:'');
-        let artists = song.ar ? song.ar.map(a=>a.name).join('/') : (song.artist?song.artist:'');
-        let inQueue = queue.find(q=>q.id==song.id);
-        html += `<div class='song-row row align-items-center'>
-            <div class='col-auto'>${cover?`<img class='cover-img' src='${cover}'>`:''}</div>
-            <div class='col'>
-                <b>${i+1}. ${song.name}</b><br>
-                <span class='text-secondary' style='font-size:0.93em;'>${artists}</span>
-            </div>
-            <div class='col-auto d-flex flex-column gap-1'>
-                <button class='btn btn-sm ${inQueue?'btn-danger':'btn-main'} mb-1 queue-toggle-btn' data-song='${encodeURIComponent(JSON.stringify(song))}'>${inQueue?'<i class="bi bi-x-circle btn-icon"></i>移除队列':'<i class="bi bi-plus-circle btn-icon"></i>加入队列'}</button>
-                <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm mb-1" download target="_blank"><i class="bi bi-download btn-icon"></i>下载</a>
-                <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.name,artist:artists,cover:cover})})'><i class="bi bi-play-circle btn-icon"></i>试听</button>
-            </div>
-        </div>`;
-    }
-    document.getElementById('song-list').innerHTML = html;
-    document.getElementById('add-all-btn').style.display = allSongs.length ? '' : 'none';
-    document.getElementById('batch-download-btn').style.display = queue.length ? '' : 'none';
-    document.getElementById('remove-all-btn').style.display = queue.length ? '' : 'none';
-    // 队列按钮事件绑定
-    document.querySelectorAll('.queue-toggle-btn').forEach(btn => {
-        btn.onclick = function() {
-            let song = JSON.parse(decodeURIComponent(this.getAttribute('data-song')));
-            toggleQueue(song);
-        };
-    });
-}
-function renderSongPagination() {
-    let total = Math.ceil(allSongs.length/PAGE_SIZE);
-    let pag = document.getElementById('song-pagination');
-    if(total<=1) { pag.innerHTML = ''; return; }
-    let html = '';
-    for(let i=1;i<=total;i++){
-        html += `<li class="page-item${i==currentPage?' active':''}"><a class="page-link" href="#" onclick="gotoPage(${i});return false;">${i}</a></li>`;
-    }
-    pag.innerHTML = html;
-}
-function gotoPage(page) {
-    currentPage = page;
-    renderSongList();
-    renderSongPagination();
-}
-function renderQueue() {
-    let ql = document.getElementById('queue-list');
-    ql.innerHTML = '';
-    queue.forEach((song, idx) => {
-        let cover = song.info && song.info.cover ? song.info.cover : '';
-        let artists = song.info && song.info.artist ? song.info.artist : '';
-        let html = `<div class="row align-items-center">
-            <div class="col-auto">
-                ${cover?`<img class='cover-img' src='${cover}'>`:''}
-            </div>
-            <div class="col">
-                <div class="fw-bold fs-6 mb-1">${song.info.name}</div>
-                <div class="text-secondary small mb-2">${artists}</div>
-                <div class="d-flex gap-2 justify-content-end">
-                    <button class="btn btn-info btn-sm" onclick='showPreviewModal(${JSON.stringify({id:song.id,name:song.info.name,artist:artists,cover:cover})})'><i class="bi bi-play-circle btn-icon"></i>试听</button>
-                    <a href="/proxy_download/${song.id}" class="btn btn-success btn-sm" download target="_blank"><i class="bi bi-download btn-icon"></i>下载</a>
-                    <button class='btn btn-sm btn-outline-danger' onclick='removeFromQueue(${idx})'><i class="bi bi-x-circle btn-icon"></i>移除</button>
-                </div>
-            </div>
-        </div>`;
-        let li = document.createElement('li');
-        li.className = 'queue-item';
-        li.innerHTML = html;
-        ql.appendChild(li);
-    });
-    document.getElementById('queue-section').style.display = queue.length ? '' : 'none';
-    document.getElementById('batch-download-btn').style.display = queue.length ? '' : 'none';
-    document.getElementById('remove-all-btn').style.display = queue.length ? '' : 'none';
-}
-function addToQueue(song) {
-    if(!queue.find(q=>q.id==song.id)) {
-        queue.push({type:'song', id:song.id, info:{name:song.name,artist:getArtist(song),cover:(song.al && song.al.picUrl) ? song.al.picUrl : (song.cover?song.cover:'')}});
-        renderSongList();
-        renderQueue();
-    }
-}
-function removeFromQueue(idx) {
-    queue.splice(idx, 1);
-    renderSongList();
-    renderQueue();
-}
-function toggleQueue(song) {
-    let idx = queue.findIndex(q=>q.id==song.id);
-    if(idx === -1) {
-        queue.push({
-            type: 'song',
-            id: song.id,
-            info: {
-                name: song.name,
-                artist: getArtist(song),
-                cover: (song.al && song.al.picUrl) ? song.al.picUrl : (song.cover?song.cover:'')
-            }
-        });
-    } else {
-        queue.splice(idx, 1);
-    }
-    renderSongList();
-    renderQueue();
-}
-document.getElementById('add-all-btn').onclick = function() {
-    let start = (currentPage-1)*PAGE_SIZE;
-    let end = Math.min(start+PAGE_SIZE, allSongs.length);
-    for(let i=start;i<end;i++){
-        let song = allSongs[i];
-        if(!queue.find(q=>q.id==song.id)) {
-            queue.push({type:'song', id:song.id, info:{name:song.name,artist:getArtist(song),cover:(song.al && song.al.picUrl) ? song.al.picUrl : (song.cover?song.cover:'')}});
-        }
-    }
-    renderSongList();
-    renderQueue();
-};
-document.getElementById('remove-all-btn').onclick = function() {
-    if(queue.length>0) {
-        queue = [];
-        renderSongList();
-        renderQueue();
-    }
-};
-document.getElementById('batch-download-btn').onclick = function() {
-    batchSequentialDownload();
-};
-function batchSequentialDownload() {
-    if (queue.length === 0) {
-        showModal('队列为空！','warning');
-        return;
-    }
-    let statusText = document.getElementById('batch-download-status');
-    let i = 0;
-    function downloadNext() {
-        if (i >= queue.length) {
-            statusText.innerText = '全部下载完成！';
-            showModal('全部下载完成！','success');
-            return;
-        }
-        let item = queue[i];
-        statusText.innerText = `正在下载第${i+1}首：${item.info.name}`;
-        let a = document.createElement('a');
-        a.href = `/proxy_download/${item.id}`;
-        a.download = '';
-        a.target = '_blank';
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        i++;
-        setTimeout(downloadNext, 3000);
-    }
-    downloadNext();
-}
-// ========== 试听弹窗 ==========
-function showPreviewModal(song) {
-    let modal = document.getElementById('preview-modal');
-    modal.innerHTML = `<div class="qr-modal-bg" style="animation:fadeIn 0.3s;">
-      <div class="qr-modal-box modal-content-anim" style="min-width:340px;max-width:95vw;">
-        <button onclick="document.getElementById('preview-modal').innerHTML=''" style="position:absolute;top:8px;right:12px;font-size:22px;border:none;background:none;">×</button>
-        <div class="d-flex align-items-center mb-3">
-          ${song.cover?`<img src='${song.cover}' style='width:80px;height:80px;border-radius:8px;border:2px solid #f6723a;object-fit:cover;'>`:''}
-          <div class="ms-3">
-            <b style="font-size:1.2em;">${song.name}</b><br>
-            <span class="text-secondary">${song.artist}</span>
-          </div>
-        </div>
-        <audio id="audio-preview" src="/proxy_download/${song.id}" controls style="width:100%;"></audio>
-      </div>
-    </div>`;
-}
-// ========== 扫码登录按钮 ==========
-document.getElementById('qr-login-btn').onclick = function() {
-    showQrLoginModal();
-};
-// ========== 初始化 ==========
-checkLoginStatus();
-</script>
+<script src="{{static:vendor/bootstrap.bundle.min.js}}"></script>
+<script src="{{static:js/virtual_list.js}}"></script>
+<script src="{{static:js/new_ui.js}}"></script>
 </body>
 </html>
 '''
+new_ui_page = PrecompressedPage(static_assets.render(NEW_UI_HTML))
+
+@app.route('/new_ui')
+def new_ui():
+    return serve_page(new_ui_page)
 
 @app.route('/logout', methods=['POST'])
 def logout():
@@ -1363,9 +1508,7 @@ def logout():
     session.pop('netease_user_key', None)
     return '', 204
 
-@app.route('/debug_playlist', methods=['GET'])
-def debug_playlist():
-    return '''
+DEBUG_PLAYLIST_HTML = '''
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
@@ -1407,10 +1550,24 @@ function debugFetch() {
 </body>
 </html>
 '''
+debug_playlist_page = PrecompressedPage(DEBUG_PLAYLIST_HTML)
+
+@app.route('/debug_playlist', methods=['GET'])
+def debug_playlist():
+    return serve_page(debug_playlist_page)
 
 @app.route('/API_Document.html')
 def api_doc():
     return send_from_directory('.', 'API_Document.html')
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    if '--worker' in sys.argv:
+        # 独立下载进程：只领取并执行 jobs.db 中的任务，可与任意数量的 web 进程同时运行
+        job_store.release_dead_leases()
+        print(f'下载进程 {WORKER_ID} 已启动，等待任务...')
+        download_worker(poll=True)
+    else:
+        # debug 模式下 reloader 父进程不提供服务，只在实际服务的子进程中恢复任务，避免重复下载
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background_jobs()
+        app.run(debug=True) 
\ No newline at end of file